@@ -1,6 +1,9 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, Company, ContactMessage
+from .models import (
+    User, Company, CompanyCounters, UserTombstone, ContactMessage, Expense, ExpenseRollup, ApprovalRule, ApprovalStep,
+    ExpenseApproval, ReceiptBatch, OCRJob, OCRResultCache, ExchangeRateTable, ReportJob
+)
 
 
 @admin.register(User)
@@ -54,6 +57,38 @@ class CompanyAdmin(admin.ModelAdmin):
         return qs.select_related('admin')
 
 
+@admin.register(CompanyCounters)
+class CompanyCountersAdmin(admin.ModelAdmin):
+    list_display = ['company', 'users', 'employees', 'managers', 'pending_approvals', 'updated_at']
+    search_fields = ['company__name']
+    readonly_fields = ['company', 'users', 'employees', 'managers', 'pending_approvals', 'updated_at']
+    
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs.select_related('company')
+
+
+@admin.register(ExpenseRollup)
+class ExpenseRollupAdmin(admin.ModelAdmin):
+    list_display = ['company', 'day', 'category', 'employee', 'total', 'count', 'updated_at']
+    list_filter = ['category', 'day']
+    search_fields = ['company__name', 'employee__username', 'employee__email']
+    ordering = ['-day']
+    readonly_fields = ['company', 'employee', 'category', 'day', 'total', 'count', 'updated_at']
+    
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs.select_related('company', 'employee')
+
+
+@admin.register(UserTombstone)
+class UserTombstoneAdmin(admin.ModelAdmin):
+    list_display = ['user_id', 'company', 'deleted_at']
+    list_filter = ['deleted_at']
+    search_fields = ['company__name']
+    ordering = ['-deleted_at']
+
+
 @admin.register(ContactMessage)
 class ContactMessageAdmin(admin.ModelAdmin):
     list_display = ['name', 'email', 'created_at', 'is_read']
@@ -85,4 +120,92 @@ class ContactMessageAdmin(admin.ModelAdmin):
     def mark_as_unread(self, request, queryset):
         updated = queryset.update(is_read=False)
         self.message_user(request, f'{updated} message(s) marked as unread.')
-    mark_as_unread.short_description = 'Mark selected messages as unread'
\ No newline at end of file
+    mark_as_unread.short_description = 'Mark selected messages as unread'
+
+
+@admin.register(Expense)
+class ExpenseAdmin(admin.ModelAdmin):
+    list_display = ['title', 'employee', 'company', 'amount', 'currency', 'category', 'status', 'date']
+    list_filter = ['status', 'category', 'currency', 'date']
+    search_fields = ['title', 'merchant', 'employee__username', 'employee__email']
+    ordering = ['-created_at']
+    readonly_fields = ['created_at', 'updated_at']
+    
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs.select_related('employee', 'company')
+
+
+class ApprovalStepInline(admin.TabularInline):
+    model = ApprovalStep
+    extra = 0
+
+
+@admin.register(ApprovalRule)
+class ApprovalRuleAdmin(admin.ModelAdmin):
+    list_display = ['name', 'company', 'category', 'min_amount', 'max_amount', 'approver_role', 'is_active']
+    list_filter = ['is_active', 'category', 'approver_role']
+    search_fields = ['name', 'company__name']
+    inlines = [ApprovalStepInline]
+
+
+@admin.register(ExpenseApproval)
+class ExpenseApprovalAdmin(admin.ModelAdmin):
+    list_display = ['expense', 'approver', 'step_number', 'status', 'created_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['expense__title', 'approver__username']
+    ordering = ['-created_at']
+    
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs.select_related('expense', 'approver')
+
+
+@admin.register(ReceiptBatch)
+class ReceiptBatchAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'total_files', 'created_at']
+    ordering = ['-created_at']
+    readonly_fields = ['skipped', 'skipped_count', 'created_at']
+
+
+@admin.register(OCRJob)
+class OCRJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'filename', 'status', 'batch', 'created_at', 'updated_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['user__username', 'user__email', 'text']
+    ordering = ['-created_at']
+    readonly_fields = ['text', 'result', 'timings', 'error', 'created_at', 'updated_at']
+    
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs.select_related('user')
+
+
+@admin.register(OCRResultCache)
+class OCRResultCacheAdmin(admin.ModelAdmin):
+    list_display = ['content_hash', 'pipeline_version', 'hits', 'created_at', 'last_used_at']
+    list_filter = ['pipeline_version']
+    search_fields = ['content_hash']
+    ordering = ['-last_used_at']
+    readonly_fields = ['text', 'data', 'hits', 'created_at', 'last_used_at']
+
+
+@admin.register(ExchangeRateTable)
+class ExchangeRateTableAdmin(admin.ModelAdmin):
+    list_display = ['base', 'source', 'fetched_at']
+    list_filter = ['base', 'source']
+    ordering = ['-fetched_at']
+    readonly_fields = ['base', 'rates', 'source', 'fetched_at']
+
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'company', 'format', 'status', 'rows', 'created_at', 'updated_at']
+    list_filter = ['format', 'status', 'created_at']
+    search_fields = ['user__username', 'user__email', 'company__name']
+    ordering = ['-created_at']
+    readonly_fields = ['filters', 'file', 'rows', 'error', 'created_at', 'updated_at']
+    
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs.select_related('user', 'company')
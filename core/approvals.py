@@ -0,0 +1,245 @@
+import threading
+import uuid
+from bisect import bisect_right
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+CACHE_TIMEOUT = 24 * 3600
+_NO_MINIMUM = Decimal('-Infinity')
+# Companies whose structures each process keeps in memory, least recently used dropped first
+LOCAL_STRUCTURES_MAX = 1000
+
+# (kind, company id) -> (version, structure); shared-cache versions tell us when it is stale
+_local_structures = OrderedDict()
+_local_lock = threading.Lock()
+
+
+class RuleIndex:
+    """A company's active approval rules, sorted by min_amount for bisect lookups.
+
+    Matches the old linear scan: the rule with the highest min_amount not
+    above the amount wins, provided the amount is within its max_amount.
+    Non-overlapping amount tiers resolve in O(log n); overlapping rules are
+    walked downwards from the bisect position.
+    """
+
+    def __init__(self, rules):
+        self.rules = sorted(rules, key=self._minimum)
+        self.minimums = [self._minimum(rule) for rule in self.rules]
+
+    @staticmethod
+    def _minimum(rule):
+        return rule.min_amount if rule.min_amount is not None else _NO_MINIMUM
+
+    def lookup(self, amount):
+        position = bisect_right(self.minimums, amount)
+        for rule in reversed(self.rules[:position]):
+            if rule.max_amount is None or amount <= rule.max_amount:
+                return rule
+        return None
+
+
+def _version_key(kind, company_id):
+    return f'{kind}_version:{company_id}'
+
+
+def _get_versioned(kind, company_id, build, timeout):
+    """Fetch a per-company compiled structure from process memory, the shared cache or the database.
+
+    A version token in the cache says whether a copy is current: process
+    memory is used while the token is unchanged, then the cache, and the
+    structure is rebuilt only after the token rotated. Invalidation
+    rotates the token; tokens also expire after
+    APPROVAL_CACHE_REFRESH_SECONDS, so with a per-process cache backend
+    (LocMemCache) other processes pick up changes within that time.
+    """
+    version_key = _version_key(kind, company_id)
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, uuid.uuid4().hex, settings.APPROVAL_CACHE_REFRESH_SECONDS)
+        version = cache.get(version_key)
+
+    with _local_lock:
+        local = _local_structures.get((kind, company_id))
+        if local is not None and local[0] == version:
+            _local_structures.move_to_end((kind, company_id))
+            return local[1]
+
+    key = f'{kind}:{company_id}:{version}'
+    value = cache.get(key)
+    if value is None:
+        value = build(company_id)
+        cache.set(key, value, timeout)
+
+    with _local_lock:
+        _local_structures[(kind, company_id)] = (version, value)
+        _local_structures.move_to_end((kind, company_id))
+        while len(_local_structures) > LOCAL_STRUCTURES_MAX:
+            _local_structures.popitem(last=False)
+    return value
+
+
+def _invalidate(kind, company_id):
+    cache.set(_version_key(kind, company_id), uuid.uuid4().hex, settings.APPROVAL_CACHE_REFRESH_SECONDS)
+    with _local_lock:
+        _local_structures.pop((kind, company_id), None)
+
+
+def _build_rule_index(company_id):
+    from .models import ApprovalRule
+
+    # Steps ride along so the workflow needs no further queries. Their approvers are not loaded:
+    # step_approver resolves approver ids against the routing table, which follows user changes
+    rules = ApprovalRule.objects.filter(company_id=company_id, is_active=True).prefetch_related('steps')
+    return RuleIndex(list(rules))
+
+
+def get_rule_index(company_id):
+    """The compiled rule index for a company, rebuilt only after its rules change"""
+    return _get_versioned('approval_rule_index', company_id, _build_rule_index, CACHE_TIMEOUT)
+
+
+def invalidate_rule_index(company_id):
+    """Force every process to rebuild the company's rule index on next use"""
+    _invalidate('approval_rule_index', company_id)
+
+
+class RoutingTable:
+    """A company's active users by role (longest-standing first) and by id"""
+
+    def __init__(self, users):
+        self.by_role = {}
+        self.by_id = {}
+        for user in users:
+            self.by_role.setdefault(user.role, []).append(user)
+            self.by_id[user.id] = user
+
+    def get(self, role, default=None):
+        return self.by_role.get(role, default)
+
+
+def _build_routing_table(company_id):
+    from .models import User
+
+    return RoutingTable(User.objects.filter(company_id=company_id, is_active=True).order_by('id'))
+
+
+def get_routing_table(company_id):
+    """The company's RoutingTable of eligible approvers"""
+    return _get_versioned('approver_routing', company_id, _build_routing_table, CACHE_TIMEOUT)
+
+
+def invalidate_routing_table(company_id):
+    """Force every process to rebuild the company's routing table on next use"""
+    _invalidate('approver_routing', company_id)
+
+
+def _pending_count_key(user_id):
+    return f'approver_pending:{user_id}'
+
+
+def get_pending_counts(approvers):
+    """Pending approvals per approver id, from the cache with one query for any misses.
+
+    Counts are adjusted once the writing transaction commits and expire after
+    APPROVAL_CACHE_REFRESH_SECONDS, so with a per-process cache backend other
+    workers may lag by up to that long; configure a shared cache for exact
+    counts across workers.
+    """
+    from .models import ExpenseApproval
+    from django.db.models import Count
+
+    keys = {_pending_count_key(user.id): user.id for user in approvers}
+    cached = cache.get_many(keys)
+    counts = {keys[key]: value for key, value in cached.items()}
+
+    missing = [user_id for key, user_id in keys.items() if key not in cached]
+    if missing:
+        fresh = dict.fromkeys(missing, 0)
+        fresh.update(
+            ExpenseApproval.objects.filter(approver_id__in=missing, status='pending')
+            .values('approver_id').annotate(total=Count('id')).values_list('approver_id', 'total')
+        )
+        cache.set_many(
+            {_pending_count_key(user_id): total for user_id, total in fresh.items()},
+            settings.APPROVAL_CACHE_REFRESH_SECONDS,
+        )
+        counts.update(fresh)
+    return counts
+
+
+def _incr_pending_count(user_id, delta):
+    try:
+        cache.incr(_pending_count_key(user_id), delta)
+    except ValueError:
+        pass
+
+
+def adjust_pending_count(user_id, delta):
+    """Apply a change to a cached pending count once the current transaction commits;
+    missing counts are recomputed on demand"""
+    transaction.on_commit(lambda: _incr_pending_count(user_id, delta))
+
+
+def invalidate_pending_count(user_id):
+    """Drop a cached pending count once the current transaction commits"""
+    transaction.on_commit(lambda: cache.delete(_pending_count_key(user_id)))
+
+
+def first_approver(company_id, role, approvers):
+    """Always the longest-standing approver (the old behaviour)"""
+    return approvers[0]
+
+
+def round_robin_approver(company_id, role, approvers):
+    """Take turns through the eligible approvers"""
+    key = f'approver_round_robin:{company_id}:{role}'
+    cache.add(key, -1, None)
+    try:
+        turn = cache.incr(key)
+    except ValueError:
+        turn = 0
+    return approvers[turn % len(approvers)]
+
+
+def least_pending_approver(company_id, role, approvers):
+    """The approver with the fewest pending approvals, ties going to the lowest id (the longest-standing)"""
+    counts = get_pending_counts(approvers)
+    return min(approvers, key=lambda user: (counts.get(user.id, 0), user.id))
+
+
+ROUTING_STRATEGIES = {
+    'first': first_approver,
+    'round_robin': round_robin_approver,
+    'least_pending': least_pending_approver,
+}
+
+
+def get_routing_strategy():
+    """APPROVER_ROUTING_STRATEGY: a name from ROUTING_STRATEGIES or a dotted path to a callable"""
+    name = settings.APPROVER_ROUTING_STRATEGY
+    if name in ROUTING_STRATEGIES:
+        return ROUTING_STRATEGIES[name]
+    return import_string(name)
+
+
+def route_approver(company_id, role):
+    """Pick an approver with the given role using the configured strategy, or None"""
+    approvers = get_routing_table(company_id).get(role)
+    if not approvers:
+        return None
+    return get_routing_strategy()(company_id, role, approvers)
+
+
+def step_approver(company_id, step):
+    """Who approves a rule step: its named approver while still an active company member, else one routed by role"""
+    if step.approver_id is not None:
+        approver = get_routing_table(company_id).by_id.get(step.approver_id)
+        if approver is not None:
+            return approver
+    return route_approver(company_id, step.approver_role)
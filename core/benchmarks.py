@@ -0,0 +1,433 @@
+import json
+import random
+import statistics
+import subprocess
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+BENCH_PREFIX = 'bench'
+BENCH_PASSWORD = 'benchmark'
+BENCH_EMAIL_DOMAIN = 'bench.example'
+
+
+class BenchmarkError(Exception):
+    """A scenario could not be run as intended, so its timings would mean nothing"""
+
+
+def clear_benchmark_data():
+    """Delete everything seed_benchmark_data (and the benchmark scenarios) created"""
+    from .models import Company, ContactMessage, User
+
+    Company.objects.filter(name__startswith='Bench Company').delete()
+    User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+    ContactMessage.objects.filter(email__endswith=f'@{BENCH_EMAIL_DOMAIN}').delete()
+
+
+def _manager_tree(rng, managers):
+    """Hang managers under each other a few levels deep; the first one is the top of the tree"""
+    for position, manager in enumerate(managers[1:], start=1):
+        manager.manager = managers[rng.randrange(max(position // 3, 1))]
+
+
+def seed_benchmark_data(companies=10, users_per_company=200, expenses_per_user=2, contact_messages=500, seed=42):
+    """Create a reproducible data set of companies, manager trees, expenses and contact messages.
+
+    The same seed always yields the same shape of data. Every user shares
+    BENCH_PASSWORD so the harness can also log in over HTTP.
+    """
+    from .counters import rebuild_counters
+    from .rollups import rebuild_rollups
+    from .hierarchy import link_new_users
+    from .models import ApprovalRule, Company, ContactMessage, Expense, User
+    from .approvals import invalidate_routing_table
+    from .utils import bump_company_version, process_approval_workflow_batch
+
+    rng = random.Random(seed)
+    password = make_password(BENCH_PASSWORD)
+    today = timezone.localdate()
+    currencies = [code for code, _ in Company.CURRENCY_CHOICES]
+    categories = [code for code, _ in Expense.CATEGORY_CHOICES]
+    start = Company.objects.filter(name__startswith='Bench Company').count()
+    summary = {'companies': 0, 'users': 0, 'expenses': 0, 'contact_messages': 0}
+
+    for number in range(start, start + companies):
+        tag = f'{BENCH_PREFIX}{number}'
+        with transaction.atomic():
+            admin = User.objects.create(
+                username=f'{tag}-admin', email=f'{tag}-admin@{BENCH_EMAIL_DOMAIN}', password=password,
+                first_name='Admin', last_name=str(number), role='admin', is_staff=True
+            )
+            company = Company.objects.create(name=f'Bench Company {number}', currency=rng.choice(currencies), admin=admin)
+            admin.company = company
+            admin.save(update_fields=['company'])
+            ApprovalRule.objects.create(company=company, name='Manager approval', is_manager_approver=True)
+
+            staff = max(users_per_company - 1, 0)
+            manager_count = min(max(staff // 8, 1), staff)
+            users = [
+                User(
+                    username=f'{tag}-user{index}',
+                    email=f'{tag}-user{index}@{BENCH_EMAIL_DOMAIN}',
+                    password=password,
+                    first_name=rng.choice(['Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie']),
+                    last_name=f'Member{index}',
+                    role='manager' if index < manager_count else 'employee',
+                    company=company
+                )
+                for index in range(staff)
+            ]
+            User.objects.bulk_create(users, batch_size=1000)
+
+            managers, employees = users[:manager_count], users[manager_count:]
+            _manager_tree(rng, managers)
+            for employee in employees:
+                employee.manager = rng.choice(managers)
+            User.objects.bulk_update(users[1:], ['manager'], batch_size=1000)
+            link_new_users(users)
+
+            submitted, decided = [], []
+            for employee in employees:
+                for _ in range(expenses_per_user):
+                    amount = Decimal(rng.randint(500, 250000)) / 100
+                    expense = Expense(
+                        company=company,
+                        employee=employee,
+                        title=f'{rng.choice(categories).title()} expense',
+                        amount=amount,
+                        currency=company.currency,
+                        converted_amount=amount,
+                        category=rng.choice(categories),
+                        date=today - timedelta(days=rng.randrange(180)),
+                        status='draft'
+                    )
+                    roll = rng.random()
+                    if roll < 0.6:
+                        submitted.append(expense)
+                    else:
+                        expense.status = 'approved' if roll < 0.9 else 'rejected'
+                        decided.append(expense)
+            Expense.objects.bulk_create(decided, batch_size=1000)
+            process_approval_workflow_batch(submitted)
+
+            invalidate_routing_table(company.id)
+            bump_company_version(company.id)
+
+        summary['companies'] += 1
+        summary['users'] += len(users) + 1
+        summary['expenses'] += len(submitted) + len(decided)
+
+    ContactMessage.objects.bulk_create([
+        ContactMessage(
+            name=f'Visitor {index}',
+            email=f'{BENCH_PREFIX}-visitor{index}@{BENCH_EMAIL_DOMAIN}',
+            message=rng.choice(['Pricing question', 'Demo request', 'Support needed', 'Partnership']) * rng.randint(1, 5)
+        )
+        for index in range(contact_messages)
+    ], batch_size=1000)
+    summary['contact_messages'] = contact_messages
+
+    # The approved and rejected expenses went in with bulk_create, past the rollup signals
+    bench_companies = list(Company.objects.filter(name__startswith='Bench Company').values_list('id', flat=True))
+    rebuild_counters(bench_companies)
+    rebuild_rollups(bench_companies)
+    return summary
+
+
+class BenchmarkContext:
+    """The seeded company a benchmark run acts in, plus sample rows for routes that take ids"""
+
+    def __init__(self, company):
+        from .models import OCRJob, ReceiptBatch, User
+
+        self.company = company
+        self.admin = company.admin
+        self.run = uuid.uuid4().hex[:8]
+        members = User.objects.filter(company=company)
+        self.manager = members.filter(role='manager', subordinates__isnull=False).order_by('id').first()
+        self.employee = members.filter(role='employee', manager__isnull=False).order_by('id').first()
+        self.approver = self.employee.manager if self.employee else None
+        self.ocr_job = OCRJob.objects.filter(user=self.admin).order_by('-id').first()
+        self.receipt_batch = ReceiptBatch.objects.filter(user=self.admin).order_by('-id').first()
+        self.report_job = None
+
+    def email(self, kind, iteration):
+        return f'{BENCH_PREFIX}-{kind}-{self.run}-{iteration}@{BENCH_EMAIL_DOMAIN}'
+
+
+def _json(data):
+    return {'data': json.dumps(data), 'content_type': 'application/json'}
+
+
+def _delete_target(ctx, iteration):
+    from .models import User
+
+    # Created outside the timed request
+    user = User.objects.create(
+        username=ctx.email('gone', iteration).split('@')[0], email=ctx.email('gone', iteration),
+        company=ctx.company, first_name='Gone'
+    )
+    return reverse('core:delete_user', args=[user.id])
+
+
+def _as_approver(ctx, client, path):
+    client.force_login(ctx.approver)
+    return path
+
+
+def _decision(ctx, client, iteration):
+    from .models import Expense
+    from .utils import process_approval_workflow_batch
+
+    # A fresh expense in the approver's inbox, routed outside the timed request
+    expense, = process_approval_workflow_batch([Expense(
+        company=ctx.company, employee=ctx.employee, title=f'Bench decision {iteration}',
+        amount=Decimal('42.00'), currency=ctx.company.currency, category='meals', status='draft'
+    )])
+    client.force_login(ctx.approver)
+    return _json({'expenseIds': [expense.id], 'decision': 'approve' if iteration % 2 else 'reject', 'comments': 'Bench'})
+
+
+def _report_path(ctx, name):
+    from .models import ReportJob
+    from .reports import generate_report
+
+    # One finished report, built outside the timed requests
+    if ctx.report_job is None:
+        ctx.report_job = ReportJob.objects.create(user=ctx.admin, company=ctx.company, status='processing')
+        generate_report(ctx.report_job)
+    return reverse(name, args=[ctx.report_job.id])
+
+
+def _relogin(ctx, client):
+    client.force_login(ctx.admin)
+    return reverse('core:logout')
+
+
+# url name -> (ctx, client, iteration) -> (method, path, client kwargs); anything with
+# side effects outside the timed request happens inside the scenario
+SCENARIOS = {
+    'index': lambda ctx, client, i: ('get', reverse('core:index'), {}),
+    'register': lambda ctx, client, i: ('post', reverse('core:register'), _json({
+        'username': ctx.email('reg', i).split('@')[0], 'email': ctx.email('reg', i),
+        'password': BENCH_PASSWORD, 'country': 'USD'
+    })),
+    'login': lambda ctx, client, i: ('post', reverse('core:login'), _json({
+        'username': ctx.admin.username, 'password': BENCH_PASSWORD
+    })),
+    'logout': lambda ctx, client, i: ('post', _relogin(ctx, client), {}),
+    'contact': lambda ctx, client, i: ('post', reverse('core:contact'), _json({
+        'name': 'Bench Visitor', 'email': ctx.email('contact', i), 'message': 'Benchmark message'
+    })),
+    'dashboard': lambda ctx, client, i: ('get', reverse('core:dashboard'), {}),
+    'get_company': lambda ctx, client, i: ('get', reverse('core:get_company'), {}),
+    'update_company': lambda ctx, client, i: ('post', reverse('core:update_company'), _json({
+        'name': ctx.company.name, 'currency': ctx.company.currency,
+        'address': ctx.company.address or '', 'phone': ctx.company.phone or ''
+    })),
+    'get_users': lambda ctx, client, i: ('get', reverse('core:get_users'), {}),
+    'sync_users': lambda ctx, client, i: ('get', reverse('core:sync_users'), {}),
+    'create_user': lambda ctx, client, i: ('post', reverse('core:create_user'), _json({
+        'name': 'Bench Hire', 'email': ctx.email('new', i), 'password': BENCH_PASSWORD,
+        'role': 'employee', 'managerId': ctx.manager.id if ctx.manager else None
+    })),
+    'import_users': lambda ctx, client, i: ('post', reverse('core:import_users'), _json({'users': [{
+        'name': 'Bench Import', 'email': ctx.email('import', i), 'password': BENCH_PASSWORD
+    }]})),
+    'update_user': lambda ctx, client, i: ('post', reverse('core:update_user', args=[ctx.employee.id]), _json({
+        'name': ctx.employee.get_full_name(), 'email': ctx.employee.email, 'role': ctx.employee.role,
+        'managerId': ctx.employee.manager_id
+    })),
+    'delete_user': lambda ctx, client, i: ('delete', _delete_target(ctx, i), {}),
+    'get_user_hierarchy': lambda ctx, client, i: ('get', reverse('core:get_user_hierarchy', args=[ctx.manager.id]), {}),
+    'get_expenses': lambda ctx, client, i: ('get', reverse('core:get_expenses'), {}),
+    'approval_inbox': lambda ctx, client, i: ('get', _as_approver(ctx, client, reverse('core:approval_inbox')), {}),
+    'decide_approvals': lambda ctx, client, i: ('post', reverse('core:decide_approvals'), _decision(ctx, client, i)),
+    'get_stats': lambda ctx, client, i: ('get', reverse('core:get_stats'), {}),
+    'spend_analytics': lambda ctx, client, i: ('get', reverse('core:spend_analytics'), {'data': {
+        'group': 'month', 'from': (timezone.localdate() - timedelta(days=180)).isoformat()
+    }}),
+    'metrics': lambda ctx, client, i: ('get', reverse('core:metrics'), {}),
+    'submit_report': lambda ctx, client, i: ('post', reverse('core:submit_report'), _json({
+        'format': 'csv', 'filters': {'status': 'approved'}
+    })),
+    'get_report_job': lambda ctx, client, i: ('get', _report_path(ctx, 'core:get_report_job'), {}),
+    'download_report': lambda ctx, client, i: ('get', _report_path(ctx, 'core:download_report'), {}),
+    'get_ocr_job': lambda ctx, client, i: ('get', reverse('core:get_ocr_job', args=[ctx.ocr_job.id]), {}),
+    'get_receipt_batch': lambda ctx, client, i: (
+        'get', reverse('core:get_receipt_batch', args=[ctx.receipt_batch.id]), {}
+    ),
+}
+
+# Routes the harness leaves out, and why
+EXCLUDED = {
+    'submit_ocr_job': 'needs the Tesseract binary and receipt images',
+    'submit_receipt_batch': 'needs the Tesseract binary and receipt images',
+}
+
+
+def _requirements_missing(name, ctx):
+    needs = {
+        'update_user': ctx.employee,
+        'create_user': ctx.manager,
+        'approval_inbox': ctx.approver,
+        'decide_approvals': ctx.approver,
+        'get_user_hierarchy': ctx.manager,
+        'get_ocr_job': ctx.ocr_job,
+        'get_receipt_batch': ctx.receipt_batch,
+    }
+    return name in needs and needs[name] is None
+
+
+def route_names():
+    """Every named route in core/urls.py"""
+    from . import urls
+
+    return [pattern.name for pattern in urls.urlpatterns if pattern.name]
+
+
+def _failed(response):
+    """Errors are non-2xx responses or the views' own {'success': False} replies"""
+    if not 200 <= response.status_code < 300:
+        return True
+    if not response.headers.get('Content-Type', '').startswith('application/json'):
+        return False
+    try:
+        return response.json().get('success') is False
+    except (ValueError, AttributeError):
+        return False
+
+
+def summarize(latencies, queries, errors, elapsed):
+    """p50/p95/p99 latency in ms, requests per second and queries per request for one route"""
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(cuts[49] * 1000, 3),
+        'p95_ms': round(cuts[94] * 1000, 3),
+        'p99_ms': round(cuts[98] * 1000, 3),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'queries': round(statistics.mean(queries), 2) if queries else None,
+        'max_queries': max(queries) if queries else None,
+    }
+
+
+class _HTTPClient:
+    """Just enough of the test client's interface to drive a running server with requests"""
+
+    def __init__(self, base_url, ctx):
+        import requests
+
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        self.force_login(ctx.admin)
+
+    def force_login(self, user):
+        """Log in as user over HTTP; every seeded user shares BENCH_PASSWORD"""
+        self.session.cookies.clear()
+        # The admin login page is the one view that always hands out a CSRF cookie
+        self.session.get(f'{self.base_url}/admin/login/')
+        response = self.request('post', reverse('core:login'), **_json({
+            'username': user.username, 'password': BENCH_PASSWORD
+        }))
+        if _failed(response):
+            raise BenchmarkError(f"Could not log in as {user.username} on {self.base_url}")
+
+    def request(self, method, path, data=None, content_type=None):
+        headers = {'X-CSRFToken': self.session.cookies.get('csrftoken', '')}
+        if content_type:
+            headers['Content-Type'] = content_type
+        return self.session.request(method.upper(), f'{self.base_url}{path}', data=data, headers=headers)
+
+    def __getattr__(self, method):
+        return lambda path, **kwargs: self.request(method, path, **kwargs)
+
+
+def run_benchmarks(company, requests=50, warmup=5, routes=None, server=None):
+    """Drive each core route through the test client (or a running server) and summarize it per route"""
+    ctx = BenchmarkContext(company)
+    results, skipped, failed = {}, {}, {}
+
+    for name in routes or route_names():
+        scenario = SCENARIOS.get(name)
+        if scenario is None:
+            skipped[name] = EXCLUDED.get(name, 'no benchmark scenario')
+            continue
+        if _requirements_missing(name, ctx):
+            skipped[name] = 'no suitable seeded rows'
+            continue
+
+        latencies, queries, errors = [], [], 0
+        try:
+            if server:
+                client = _HTTPClient(server, ctx)
+            else:
+                client = Client(raise_request_exception=False)
+                client.force_login(ctx.admin)
+
+            for iteration in range(warmup + requests):
+                method, path, kwargs = scenario(ctx, client, iteration)
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = getattr(client, method)(path, **kwargs)
+                    took = time.perf_counter() - started
+                if iteration < warmup:
+                    continue
+                latencies.append(took)
+                if not server:
+                    queries.append(len(captured))
+                if _failed(response):
+                    errors += 1
+        except BenchmarkError as e:
+            failed[name] = str(e)
+            continue
+
+        results[name] = summarize(latencies, queries, errors, sum(latencies))
+
+    return {
+        'meta': {
+            'revision': git_revision(),
+            'database': connection.vendor,
+            'mode': f'server {server}' if server else 'test client',
+            'requests': requests,
+            'company': company.id,
+            'ran_at': timezone.now().isoformat(),
+        },
+        'results': results,
+        'skipped': skipped,
+        'failed': failed,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(baseline, current, metrics=('p50_ms', 'p95_ms', 'p99_ms', 'queries')):
+    """Per-route (metric, before, after, % change) rows for routes present in both runs"""
+    rows = []
+    for name, after in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        for metric in metrics:
+            old, new = before.get(metric), after.get(metric)
+            if old is None or new is None:
+                continue
+            change = ((new - old) / old * 100) if old else (0.0 if new == old else float('inf'))
+            rows.append((name, metric, old, new, change))
+    return rows
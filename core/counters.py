@@ -0,0 +1,156 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+COUNTER_FIELDS = ('users', 'employees', 'managers', 'pending_approvals')
+
+
+def _user_counts(role):
+    return {
+        'users': 1,
+        'employees': int(role == 'employee'),
+        'managers': int(role == 'manager'),
+    }
+
+
+def adjust_counters(company_id, **deltas):
+    """Apply counter deltas to a company's row with a single F-expression UPDATE.
+
+    Callers wrap the change and its counter update in one
+    transaction.atomic() block so they commit or roll back together; the
+    UPDATE also bumps the company version the read APIs' ETags come from. A missing row is left alone;
+    rebuild_company_counters recreates it.
+    """
+    from .models import CompanyCounters
+
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if company_id is None or not deltas:
+        return
+
+    CompanyCounters.objects.filter(company_id=company_id).update(
+        updated_at=timezone.now(),
+        version=F('version') + 1,
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+
+
+def count_user_change(old, new, owned=()):
+    """Adjust counters for a user moving from old to new (company_id, role); either may be None.
+
+    owned holds the ids of companies the user is the admin of. Like the
+    users API, a company counts its admin even when their company_id is
+    not set to it.
+    """
+    if old == new:
+        return
+    deltas = defaultdict(lambda: defaultdict(int))
+    for state, sign in ((old, -1), (new, 1)):
+        if state is None:
+            continue
+        company_id, role = state
+        for counted_in in {company_id, *owned} - {None}:
+            for field, count in _user_counts(role).items():
+                deltas[counted_in][field] += sign * count
+
+    for company_id, company_deltas in deltas.items():
+        adjust_counters(company_id, **company_deltas)
+
+
+def count_admin_change(company_id, old_admin_id, new_admin_id):
+    """Adjust a company's counters when its admin changes; only an admin outside the company changes them"""
+    from .models import User
+
+    if old_admin_id == new_admin_id:
+        return
+    deltas = defaultdict(int)
+    admins = User.objects.filter(id__in={old_admin_id, new_admin_id} - {None}).values_list('id', 'company_id', 'role')
+    for user_id, user_company_id, role in admins:
+        if user_company_id == company_id:
+            continue
+        sign = 1 if user_id == new_admin_id else -1
+        for field, count in _user_counts(role).items():
+            deltas[field] += sign * count
+    adjust_counters(company_id, **deltas)
+
+
+def compute_counters(company_ids=None):
+    """Count users (admin included), employees, managers and pending approvals per company from scratch"""
+    from .models import Company, ExpenseApproval, User
+
+    companies = Company.objects.all()
+    if company_ids is not None:
+        companies = companies.filter(id__in=company_ids)
+    counters = {company_id: dict.fromkeys(COUNTER_FIELDS, 0) for company_id in companies.values_list('id', flat=True)}
+
+    users = User.objects.filter(company_id__in=counters).values('company_id').annotate(
+        users=Count('id'),
+        employees=Count('id', filter=Q(role='employee')),
+        managers=Count('id', filter=Q(role='manager'))
+    ).order_by()
+    for row in users:
+        company_id = row.pop('company_id')
+        counters[company_id].update(row)
+
+    # Admins count towards their company even when they are not a member of it
+    admins = companies.filter(admin__isnull=False).values_list('id', 'admin__company_id', 'admin__role')
+    for company_id, admin_company_id, role in admins:
+        if admin_company_id != company_id:
+            for field, count in _user_counts(role).items():
+                counters[company_id][field] += count
+
+    pending = ExpenseApproval.objects.filter(
+        status='pending',
+        expense__company_id__in=counters
+    ).values('expense__company_id').annotate(count=Count('id')).order_by()
+    for row in pending:
+        counters[row['expense__company_id']]['pending_approvals'] = row['count']
+
+    return counters
+
+
+def rebuild_counters(company_ids=None, fix=True):
+    """Compare stored counters with a fresh count, optionally rewriting the rows that differ.
+
+    Returns a list of (company_id, field, stored, actual) mismatches; a
+    missing row is reported with stored = None.
+    """
+    from .models import CompanyCounters
+
+    with transaction.atomic():
+        actual = compute_counters(company_ids)
+        stored = {
+            row.company_id: row
+            for row in CompanyCounters.objects.select_for_update().filter(company_id__in=actual)
+        }
+
+        mismatches = []
+        missing = []
+        changed = []
+        for company_id, counts in actual.items():
+            row = stored.get(company_id)
+            if row is None:
+                mismatches.extend((company_id, field, None, value) for field, value in counts.items())
+                missing.append(CompanyCounters(company_id=company_id, **counts))
+                continue
+            differences = [
+                (company_id, field, getattr(row, field), value)
+                for field, value in counts.items()
+                if getattr(row, field) != value
+            ]
+            if differences:
+                mismatches.extend(differences)
+                for field, value in counts.items():
+                    setattr(row, field, value)
+                row.updated_at = timezone.now()
+                changed.append(row)
+
+        if fix:
+            CompanyCounters.objects.bulk_create(missing)
+            CompanyCounters.objects.bulk_update(changed, list(COUNTER_FIELDS) + ['updated_at'])
+            CompanyCounters.objects.filter(
+                company_id__in=[row.company_id for row in changed]
+            ).update(version=F('version') + 1)
+
+    return mismatches
@@ -0,0 +1,234 @@
+import json
+from decimal import Decimal, ROUND_HALF_UP
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+
+RATE_TABLE_CACHE_KEY = 'exchange_rate_table'
+
+
+class HTTPRateProvider:
+    """Fetches every rate for the base currency from exchangerate-api.com in one call"""
+
+    name = 'http'
+    url = 'https://api.exchangerate-api.com/v4/latest/{base}'
+
+    def fetch(self, base):
+        response = requests.get(self.url.format(base=base), timeout=10)
+        response.raise_for_status()
+        return response.json()['rates']
+
+
+class FileRateProvider:
+    """Reads rates from a local JSON file, for offline deployments and development.
+
+    The file holds either {"base": "USD", "rates": {...}} or a bare
+    {currency: rate} mapping relative to the requested base.
+    """
+
+    name = 'file'
+
+    def __init__(self, path):
+        self.path = path
+
+    def fetch(self, base):
+        with open(self.path) as f:
+            data = json.load(f)
+        rates = data.get('rates', data)
+        file_base = data.get('base', base)
+        if file_base == base:
+            return rates
+        # Re-express the table relative to the requested base
+        pivot = Decimal(str(rates[base]))
+        return {code: str(Decimal(str(rate)) / pivot) for code, rate in rates.items()}
+
+
+def get_rate_provider():
+    """The rate provider configured by EXCHANGE_RATE_PROVIDER"""
+    if settings.EXCHANGE_RATE_PROVIDER == 'file':
+        return FileRateProvider(settings.EXCHANGE_RATE_FILE)
+    if settings.EXCHANGE_RATE_PROVIDER == 'http':
+        return HTTPRateProvider()
+    raise ValueError(f"Unknown exchange rate provider: {settings.EXCHANGE_RATE_PROVIDER}")
+
+
+def _table_to_cache(table):
+    return {
+        'base': table.base,
+        'rates': table.rates,
+        'fetched_at': table.fetched_at.isoformat()
+    }
+
+
+def refresh_rate_table(provider=None):
+    """Fetch a fresh base-currency table and store it in the database and cache"""
+    from .models import ExchangeRateTable
+
+    provider = provider or get_rate_provider()
+    base = settings.EXCHANGE_RATE_BASE
+    rates = {code: str(rate) for code, rate in provider.fetch(base).items()}
+    rates[base] = '1'
+
+    table = ExchangeRateTable.objects.create(base=base, rates=rates, source=provider.name)
+    cache.set(RATE_TABLE_CACHE_KEY, _table_to_cache(table), settings.EXCHANGE_RATE_CACHE_SECONDS)
+    return table
+
+
+def get_rate_table():
+    """The latest stored rate table as a dict, or None if rates were never fetched.
+
+    Only the cache and the database are consulted; the network is never
+    touched here, refresh_rate_table does that out of band.
+    """
+    from .models import ExchangeRateTable
+
+    table = cache.get(RATE_TABLE_CACHE_KEY)
+    if table is None:
+        latest = ExchangeRateTable.objects.order_by('-fetched_at').first()
+        if latest is None:
+            return None
+        table = _table_to_cache(latest)
+        cache.set(RATE_TABLE_CACHE_KEY, table, settings.EXCHANGE_RATE_CACHE_SECONDS)
+    return table
+
+
+def get_exchange_rate(from_currency, to_currency, table=None):
+    """Rate to multiply an amount in from_currency by to get to_currency, or None if unknown.
+
+    Every cross rate is derived from the single base table.
+    """
+    if from_currency == to_currency:
+        return Decimal('1')
+
+    table = table or get_rate_table()
+    if table is None:
+        return None
+
+    rates = table['rates']
+    if from_currency not in rates or to_currency not in rates:
+        return None
+    return Decimal(rates[to_currency]) / Decimal(rates[from_currency])
+
+
+CENT = Decimal('0.01')
+
+
+def convert_amounts(amounts, currencies, to_currency, table=None):
+    """Convert parallel sequences of amounts and source currencies into to_currency.
+
+    Positions are grouped by source currency so each cross rate is derived
+    once per batch rather than once per amount; every result is rounded
+    half-up to cents. Amounts in currencies missing from the table come
+    back as None.
+    """
+    table = table or get_rate_table()
+    groups = {}
+    for index, currency in enumerate(currencies):
+        groups.setdefault(currency, []).append(index)
+
+    converted = [None] * len(currencies)
+    for currency, indexes in groups.items():
+        rate = get_exchange_rate(currency, to_currency, table)
+        if rate is None:
+            continue
+        for index in indexes:
+            amount = amounts[index]
+            if not isinstance(amount, Decimal):
+                amount = Decimal(str(amount))
+            converted[index] = (amount * rate).quantize(CENT, rounding=ROUND_HALF_UP)
+    return converted
+
+
+def convert_expenses(expenses, table=None):
+    """Set converted_amount, the amount in the company currency, on expenses whose company is loaded.
+
+    Expenses already in the company currency take their amount as is; the
+    rest go through convert_amounts grouped by company currency, reading
+    the rate table at most once. Currencies without a rate leave None.
+    The Expense pre_save signal does this for single saves; bulk paths
+    call it themselves.
+    """
+    foreign = {}
+    for expense in expenses:
+        target = expense.company.currency
+        if expense.currency == target:
+            expense.converted_amount = expense.amount
+        else:
+            foreign.setdefault(target, []).append(expense)
+
+    table = (table or get_rate_table()) if foreign else None
+    for target, group in foreign.items():
+        converted = convert_amounts(
+            [expense.amount for expense in group], [expense.currency for expense in group], target, table
+        ) if table else [None] * len(group)
+        for expense, amount in zip(group, converted):
+            expense.converted_amount = amount
+    return expenses
+
+
+def convert_stored_expenses(expenses=None, batch_size=1000):
+    """Fill in converted_amount on stored expenses that lack it, e.g. ones saved before a rate was known.
+
+    Works through the expenses (default: all) in id order, batch by batch,
+    with one bulk_update per batch; the spend rollups are adjusted for the
+    converted approved ones. Returns how many expenses were converted.
+    """
+    from .models import Expense
+    from .rollups import apply_rollup_deltas, expense_rollup_entry, rollup_deltas
+
+    table = get_rate_table()
+    expenses = (Expense.objects.all() if expenses is None else expenses).filter(converted_amount__isnull=True)
+    converted, last_id = 0, 0
+    while True:
+        batch = list(expenses.filter(id__gt=last_id).select_related('company').order_by('id')[:batch_size])
+        if not batch:
+            return converted
+        last_id = batch[-1].id
+
+        before = [expense_rollup_entry(expense) for expense in batch]
+        convert_expenses(batch, table)
+        changed = [(entry, expense) for entry, expense in zip(before, batch) if expense.converted_amount is not None]
+        with transaction.atomic():
+            Expense.objects.bulk_update([expense for _, expense in changed], ['converted_amount'])
+            # bulk_update skips the signals that keep the rollups current
+            apply_rollup_deltas(rollup_deltas(
+                removed=[entry for entry, _ in changed],
+                added=[expense_rollup_entry(expense) for _, expense in changed]
+            ))
+        converted += len(changed)
+
+
+def convert_queryset_totals(queryset, to_currency, amount_field='amount', currency_field='currency', group_by=()):
+    """Sum a queryset's amounts in to_currency, letting the database do the adding up.
+
+    The database returns one subtotal per (group_by..., currency) and only
+    those subtotals are converted, so the work in Python depends on the
+    number of groups, not rows. Each per-currency subtotal is rounded once
+    after conversion rather than each amount, so a total can differ by a few
+    cents from summing individually converted amounts. Returns ({group key
+    tuple: Decimal total}, [currencies without a rate]); with no group_by the
+    only key is (). Rows in a currency without a rate are left out.
+    """
+    rows = list(
+        queryset.order_by()
+        .values(*group_by, currency_field)
+        .annotate(subtotal=Sum(amount_field))
+    )
+    converted = convert_amounts(
+        [row['subtotal'] or 0 for row in rows],
+        [row[currency_field] for row in rows],
+        to_currency
+    )
+
+    totals = {}
+    missing = set()
+    for row, amount in zip(rows, converted):
+        if amount is None:
+            missing.add(row[currency_field])
+            continue
+        key = tuple(row[field] for field in group_by)
+        totals[key] = totals.get(key, Decimal('0')) + amount
+    return totals, sorted(missing)
@@ -0,0 +1,121 @@
+from django.db.models import F
+
+
+class HierarchyCycleError(ValueError):
+    pass
+
+
+def _links():
+    from .models import UserHierarchy
+    return UserHierarchy.objects
+
+
+def ancestors(user):
+    """The user's managers, nearest first, each annotated with its distance as .depth (one query)"""
+    from .models import User
+
+    return User.objects.filter(
+        descendant_links__descendant=user,
+        descendant_links__depth__gt=0
+    ).annotate(depth=F('descendant_links__depth')).order_by('depth')
+
+
+def descendants(user, max_depth=None):
+    """Everyone under the user, nearest first, each annotated with .depth (one query)"""
+    from .models import User
+
+    # One filter() call, so the depth limit applies to the same user_hierarchy join as the ancestor
+    conditions = {'ancestor_links__ancestor': user, 'ancestor_links__depth__gt': 0}
+    if max_depth is not None:
+        conditions['ancestor_links__depth__lte'] = max_depth
+    return User.objects.filter(**conditions).annotate(depth=F('ancestor_links__depth')).order_by('depth', 'id')
+
+
+def get_depth(user):
+    """How many managers are above the user (one query)"""
+    return _links().filter(descendant=user).exclude(ancestor=user).count()
+
+
+def check_manager(user_id, manager_id):
+    """Raise HierarchyCycleError if making manager_id the manager of user_id would close a loop"""
+    if manager_id is None or user_id is None:
+        return
+    if manager_id == user_id or _links().filter(ancestor_id=user_id, descendant_id=manager_id).exists():
+        raise HierarchyCycleError('A user cannot report to themselves or to someone in their own team')
+
+
+def link_new_users(users):
+    """Add closure rows for freshly created users (managers may be existing users or in the same list).
+
+    Raises HierarchyCycleError, before writing anything, when the managers
+    within the list form a loop.
+    """
+    from .models import UserHierarchy
+
+    users = [user for user in users if user.pk is not None]
+    if not users:
+        return
+
+    new_ids = {user.id for user in users}
+    manager_of = {user.id: user.manager_id for user in users}
+    chains = {}
+    for link in _links().filter(descendant_id__in={m for m in manager_of.values() if m and m not in new_ids}):
+        chains.setdefault(link.descendant_id, []).append((link.ancestor_id, link.depth))
+
+    # chains[user_id] is (ancestor, depth) pairs including the user itself at depth 0. Walk up
+    # from each user to the first manager whose chain is known, then fill the path in top-down
+    for user_id in manager_of:
+        path, on_path = [], set()
+        current = user_id
+        while current is not None and current not in chains:
+            if current in on_path:
+                raise HierarchyCycleError('The managers in this batch form a loop')
+            path.append(current)
+            on_path.add(current)
+            current = manager_of.get(current)
+        above = chains.get(current, [])
+        for member_id in reversed(path):
+            above = chains[member_id] = [(member_id, 0)] + [(ancestor_id, depth + 1) for ancestor_id, depth in above]
+
+    UserHierarchy.objects.bulk_create([
+        UserHierarchy(ancestor_id=ancestor_id, descendant_id=user.id, depth=depth)
+        for user in users
+        for ancestor_id, depth in chains[user.id]
+    ], batch_size=1000)
+
+
+def move_subtree(user_id, manager_id):
+    """Re-hang a user and everyone under them below a new manager (or at the top when None).
+
+    Callers check the move with check_manager first; the User pre_save signal does.
+    """
+    from .models import UserHierarchy
+
+    subtree = list(_links().filter(ancestor_id=user_id).values_list('descendant_id', 'depth'))
+    if not subtree:
+        # Created before the closure table existed or by a bulk path; just link the user
+        subtree = [(user_id, 0)]
+        UserHierarchy.objects.create(ancestor_id=user_id, descendant_id=user_id, depth=0)
+
+    # Drop every link from above the user into its subtree...
+    subtree_ids = [descendant_id for descendant_id, _ in subtree]
+    _links().filter(descendant_id__in=subtree_ids).exclude(ancestor_id__in=subtree_ids).delete()
+
+    if manager_id is None:
+        return
+
+    # ...then connect the new manager's chain to all of it
+    chain = _links().filter(descendant_id=manager_id).values_list('ancestor_id', 'depth')
+    UserHierarchy.objects.bulk_create([
+        UserHierarchy(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=above + below + 1)
+        for ancestor_id, above in chain
+        for descendant_id, below in subtree
+    ], batch_size=1000)
+
+
+def detach_reports(user_id):
+    """Cut the user's reports (and their teams) loose from the chain above them, before the user is deleted"""
+    _links().filter(
+        descendant_id__in=_links().filter(ancestor_id=user_id, depth__gt=0).values('descendant_id'),
+        ancestor_id__in=_links().filter(descendant_id=user_id).values('ancestor_id')
+    ).delete()
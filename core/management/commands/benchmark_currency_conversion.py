@@ -0,0 +1,49 @@
+import random
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.exchange_rates import CENT, convert_amounts, get_rate_table
+from core.utils import convert_currency
+
+
+class Command(BaseCommand):
+    help = 'Compare per-amount convert_currency calls with batch convert_amounts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200000, help='Number of amounts to convert')
+        parser.add_argument('--to', default='USD', help='Target currency')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        table = get_rate_table()
+        if table is None:
+            raise CommandError('No exchange rate table stored; run refresh_exchange_rates first')
+
+        rng = random.Random(options['seed'])
+        codes = sorted(table['rates'])[:20]
+        count = options['count']
+        amounts = [Decimal(rng.randint(100, 1000000)) / 100 for _ in range(count)]
+        currencies = [rng.choice(codes) for _ in range(count)]
+        target = options['to']
+
+        started = time.perf_counter()
+        per_item = [convert_currency(amount, currency, target) for amount, currency in zip(amounts, currencies)]
+        per_item_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        batch = convert_amounts(amounts, currencies, target, table)
+        batch_seconds = time.perf_counter() - started
+
+        mismatches = sum(
+            1 for single, bulk in zip(per_item, batch)
+            if Decimal(single).quantize(CENT, rounding=ROUND_HALF_UP) != bulk
+        )
+
+        self.stdout.write(f"{count:,} amounts across {len(codes)} currencies -> {target}")
+        self.stdout.write(f"per-item convert_currency: {per_item_seconds:8.3f}s ({count / per_item_seconds:>12,.0f}/s)")
+        self.stdout.write(f"batch convert_amounts:     {batch_seconds:8.3f}s ({count / batch_seconds:>12,.0f}/s)")
+        self.stdout.write(self.style.SUCCESS(
+            f"speedup: {per_item_seconds / batch_seconds:.1f}x, {mismatches} rounding difference(s)"
+        ))
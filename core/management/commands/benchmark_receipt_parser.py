@@ -0,0 +1,120 @@
+import re
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from core.ocr_service import parse_receipt_data
+
+SAMPLE_RECEIPTS = [
+    """BEST COFFEE SHOP
+123 Main Street
+Date: 14/03/2024  10:42
+Latte                 $4.50
+Blueberry Muffin      $3.25
+Bottled Water         $1.99
+Subtotal              $9.74
+Sales Tax 8%          $0.78
+TOTAL                $10.52
+VISA ****1234        $10.52
+Thank you for visiting!
+""",
+    """GRAND HOTEL BERLIN
+Unter den Linden 77
+2024-02-29
+Room 2 nights       1.240,00 €
+Minibar                35,50 €
+City tax               24,80 €
+GRAND TOTAL         1.300,30 EUR
+""",
+    """Taxi Service
+Trip 28-11-2023
+Fare 23.40
+Tip 4.00
+Amount due 27.40
+""",
+]
+
+
+def legacy_parse_receipt_data(text):
+    """The multi-regex parser parse_receipt_data replaced, kept for comparison"""
+    data = {
+        'amount': None,
+        'date': None,
+        'merchant': None,
+        'description': text[:200] if text else ""
+    }
+    
+    amount_pattern = r'[\$£€¥₹]\s*(\d+[.,]\d{2})|(\d+[.,]\d{2})\s*[\$£€¥₹]'
+    amount_matches = re.findall(amount_pattern, text)
+    if amount_matches:
+        amount_str = ''.join(amount_matches[0]).replace(',', '.')
+        try:
+            data['amount'] = float(re.findall(r'\d+\.\d{2}', amount_str)[0])
+        except:
+            pass
+    
+    date_patterns = [
+        r'\d{2}/\d{2}/\d{4}',
+        r'\d{2}-\d{2}-\d{4}',
+        r'\d{4}-\d{2}-\d{2}'
+    ]
+    for pattern in date_patterns:
+        date_match = re.search(pattern, text)
+        if date_match:
+            try:
+                date_str = date_match.group()
+                for fmt in ('%d/%m/%Y', '%d-%m-%Y', '%Y-%m-%d'):
+                    try:
+                        data['date'] = datetime.strptime(date_str, fmt).date()
+                        break
+                    except:
+                        continue
+            except:
+                pass
+            if data['date']:
+                break
+    
+    lines = text.split('\n')
+    for line in lines[:5]:
+        if len(line.strip()) > 3 and not any(char.isdigit() for char in line):
+            data['merchant'] = line.strip()
+            break
+    
+    return data
+
+
+class Command(BaseCommand):
+    help = 'Compare receipt parsing throughput of the single-pass parser against the legacy one'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000, help='Parses per implementation')
+
+    def _measure(self, parse, iterations):
+        start = time.perf_counter()
+        for i in range(iterations):
+            parse(SAMPLE_RECEIPTS[i % len(SAMPLE_RECEIPTS)])
+        return iterations / (time.perf_counter() - start)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+
+        # Warm up both so one-off regex compilation is not billed to either side
+        for text in SAMPLE_RECEIPTS:
+            legacy_parse_receipt_data(text)
+            parse_receipt_data(text)
+
+        legacy_rate = self._measure(legacy_parse_receipt_data, iterations)
+        current_rate = self._measure(parse_receipt_data, iterations)
+
+        self.stdout.write(f"legacy parser:      {legacy_rate:>12,.0f} parses/s")
+        self.stdout.write(f"single-pass parser: {current_rate:>12,.0f} parses/s")
+        self.stdout.write(self.style.SUCCESS(f"speedup: {current_rate / legacy_rate:.2f}x"))
+
+        for text in SAMPLE_RECEIPTS:
+            legacy = legacy_parse_receipt_data(text)
+            current = parse_receipt_data(text)
+            self.stdout.write(
+                f"  {current['merchant']!r}: total {legacy['amount']} -> {current['amount']}, "
+                f"date {legacy['date']} -> {current['date']}"
+            )
@@ -0,0 +1,66 @@
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from core.models import Expense
+from core.reports import WRITERS, report_rows
+
+
+def synthetic_rows(count, seed):
+    """Report rows shaped like report_rows() output, generated on the fly"""
+    rng = random.Random(seed)
+    start = date(2024, 1, 1)
+    categories = [code for code, _ in Expense.CATEGORY_CHOICES]
+    statuses = ['approved', 'rejected', 'in_progress']
+    for n in range(1, count + 1):
+        employee = rng.randrange(5000)
+        amount = Decimal(rng.randint(100, 500000)) / 100
+        yield (
+            n, start + timedelta(days=n % 730), f'Employee {employee}', f'employee{employee}@example.com',
+            f'Expense {n}', rng.choice(['Airline', 'Hotel', 'Cafe', '']), rng.choice(categories),
+            rng.choice(statuses), amount, 'USD', amount
+        )
+
+
+class Command(BaseCommand):
+    help = 'Time the CSV/PDF report writers on large row counts and report throughput and peak memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000, help='Number of synthetic rows')
+        parser.add_argument('--formats', nargs='+', choices=sorted(WRITERS), default=['csv', 'pdf'])
+        parser.add_argument('--from-db', action='store_true', help='Read every stored expense instead of synthetic rows')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--trace-memory', action='store_true',
+            help='Measure peak Python allocations with tracemalloc (much slower)'
+        )
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            for report_format in options['formats']:
+                if options['from_db']:
+                    rows = report_rows(Expense.objects.order_by('date', 'id'))
+                else:
+                    rows = synthetic_rows(options['rows'], options['seed'])
+                path = os.path.join(directory, f'report.{report_format}')
+
+                if options['trace_memory']:
+                    tracemalloc.start()
+                started = time.perf_counter()
+                count, _ = WRITERS[report_format](rows, path)
+                seconds = time.perf_counter() - started
+                peak = ''
+                if options['trace_memory']:
+                    peak = f", peak {tracemalloc.get_traced_memory()[1] / 2 ** 20:.1f} MiB"
+                    tracemalloc.stop()
+
+                self.stdout.write(
+                    f"{report_format}: {count:,} rows in {seconds:.2f}s ({count / seconds:,.0f} rows/s), "
+                    f"{os.path.getsize(path) / 2 ** 20:.1f} MiB file{peak}"
+                )
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Company
+from core.user_import import UserImportError, import_users, parse_import_file
+
+
+class Command(BaseCommand):
+    help = 'Bulk-create users for a company from a CSV or JSON file (columns: email, name, role, password, manager)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSON file to import')
+        parser.add_argument('--company', type=int, required=True, help='Company id to add the users to')
+        parser.add_argument('--workers', type=int, default=None, help='Password hashing processes (default USER_IMPORT_WORKERS)')
+
+    def handle(self, *args, **options):
+        try:
+            company = Company.objects.get(id=options['company'])
+        except Company.DoesNotExist:
+            raise CommandError(f"Company {options['company']} does not exist")
+
+        try:
+            with open(options['path'], 'rb') as f:
+                rows = parse_import_file(f.read(), options['path'])
+            result = import_users(company, rows, workers=options['workers'])
+        except (OSError, ValueError, UserImportError) as e:
+            raise CommandError(f"Could not import users: {e}")
+
+        for error in result['errors']:
+            self.stderr.write(f"Row {error['row']} ({error['email'] or 'no email'}): {error['message']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {len(result['created'])} users into {company.name}, {len(result['errors'])} rows rejected"
+        ))
@@ -0,0 +1,54 @@
+from concurrent.futures import as_completed
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import OCRJob
+from core.ocr_queue import finish_job, get_executor, run_ocr, take_job
+
+
+class Command(BaseCommand):
+    help = 'Run queued OCR jobs through the worker pool (e.g. after a web process restart)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requeue-stale',
+            type=int,
+            default=None,
+            metavar='MINUTES',
+            help='Reset jobs stuck in "processing" for longer than this many minutes'
+        )
+        parser.add_argument('--limit', type=int, default=None, help='Maximum number of jobs to run')
+
+    def handle(self, *args, **options):
+        if options['requeue_stale'] is not None:
+            cutoff = timezone.now() - timedelta(minutes=options['requeue_stale'])
+            requeued = OCRJob.objects.filter(status='processing', updated_at__lt=cutoff).update(status='pending')
+            self.stdout.write(f"Requeued {requeued} stale job(s)")
+
+        jobs = OCRJob.objects.filter(status='pending').order_by('created_at')
+        if options['limit']:
+            jobs = jobs[:options['limit']]
+
+        executor = get_executor()
+        futures = {}
+        for job in jobs:
+            if take_job(job):
+                futures[executor.submit(run_ocr, job.image.path, settings.OCR_MAX_RECEIPT_PIXELS)] = job
+
+        failed = 0
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += 1
+                finish_job(job.id, error=e)
+            else:
+                finish_job(job.id, result=result, content_hash=job.content_hash)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {len(futures)} job(s), {failed} failed"
+        ))
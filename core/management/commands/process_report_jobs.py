@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import ReportJob
+from core.reports import claim_report_job, generate_report
+
+
+class Command(BaseCommand):
+    help = 'Build queued expense reports (e.g. after a web process restart, or as a dedicated report worker)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requeue-stale',
+            type=int,
+            default=None,
+            metavar='MINUTES',
+            help='Reset reports stuck in "processing" for longer than this many minutes'
+        )
+        parser.add_argument('--limit', type=int, default=None, help='Maximum number of reports to build')
+
+    def handle(self, *args, **options):
+        if options['requeue_stale'] is not None:
+            cutoff = timezone.now() - timedelta(minutes=options['requeue_stale'])
+            requeued = ReportJob.objects.filter(status='processing', updated_at__lt=cutoff).update(status='pending')
+            self.stdout.write(f"Requeued {requeued} stale report(s)")
+
+        jobs = ReportJob.objects.filter(status='pending').select_related('user', 'company').order_by('created_at')
+        if options['limit']:
+            jobs = jobs[:options['limit']]
+
+        built = failed = 0
+        for job in jobs:
+            if not claim_report_job(job.id):
+                continue
+            generate_report(job)
+            job.refresh_from_db(fields=['status'])
+            built += 1
+            failed += job.status == 'failed'
+
+        self.stdout.write(self.style.SUCCESS(f"Built {built} report(s), {failed} failed"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Recount the per-company counters table and fix (or, with --verify, just report) any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, action='append', dest='companies', help='Only this company id (repeatable)')
+        parser.add_argument('--verify', action='store_true', help='Report mismatches without writing, failing if any are found')
+
+    def handle(self, *args, **options):
+        mismatches = rebuild_counters(options['companies'], fix=not options['verify'])
+
+        for company_id, field, stored, actual in mismatches:
+            self.stdout.write(f"Company {company_id}: {field} stored {stored}, actual {actual}")
+
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('Company counters are up to date'))
+        elif options['verify']:
+            raise CommandError(f"{len(mismatches)} counter mismatches found")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {len(mismatches)} counter mismatches"))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily spend rollups from approved expenses and fix (or, with --verify, just report) any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, action='append', dest='companies', help='Only this company id (repeatable)')
+        parser.add_argument('--verify', action='store_true', help='Report mismatches without writing, failing if any are found')
+
+    def handle(self, *args, **options):
+        mismatches = rebuild_rollups(options['companies'], fix=not options['verify'])
+
+        for (company_id, day, category, employee_id), stored, actual in mismatches:
+            self.stdout.write(
+                f"Company {company_id}, {day}, {category}, employee {employee_id}: "
+                f"stored {stored or 'nothing'}, actual {actual or 'nothing'}"
+            )
+
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('Expense rollups are up to date'))
+        elif options['verify']:
+            raise CommandError(f"{len(mismatches)} rollup mismatches found")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {len(mismatches)} rollup mismatches"))
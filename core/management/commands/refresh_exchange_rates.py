@@ -0,0 +1,68 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.exchange_rates import convert_stored_expenses, refresh_rate_table
+from core.models import ExchangeRateTable
+
+
+class Command(BaseCommand):
+    help = 'Fetch the exchange rate table for the base currency (run from cron, or with --every)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age',
+            type=int,
+            default=None,
+            metavar='MINUTES',
+            help='Skip the fetch if the stored table is younger than this'
+        )
+        parser.add_argument(
+            '--every',
+            type=int,
+            default=None,
+            metavar='SECONDS',
+            help='Keep running and refresh at this interval'
+        )
+        parser.add_argument('--keep', type=int, default=48, help='Number of historical tables to keep')
+        parser.add_argument(
+            '--convert-expenses',
+            action='store_true',
+            help='Afterwards, fill in the company-currency amount of expenses saved while their rate was missing'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            self.refresh(options)
+            if not options['every']:
+                break
+            time.sleep(options['every'])
+
+    def refresh(self, options):
+        if options['max_age'] is not None:
+            cutoff = timezone.now() - timedelta(minutes=options['max_age'])
+            if ExchangeRateTable.objects.filter(fetched_at__gte=cutoff).exists():
+                self.stdout.write('Stored rate table is fresh enough, skipping')
+                return
+
+        try:
+            table = refresh_rate_table()
+        except Exception as e:
+            if not options['every']:
+                raise CommandError(f"Could not refresh exchange rates: {e}")
+            self.stderr.write(f"Could not refresh exchange rates: {e}")
+            return
+
+        old_ids = list(ExchangeRateTable.objects.order_by('-fetched_at').values_list('id', flat=True)[options['keep']:])
+        if old_ids:
+            ExchangeRateTable.objects.filter(id__in=old_ids).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {len(table.rates)} {table.base} rates from {table.source}"
+        ))
+
+        if options['convert_expenses']:
+            converted = convert_stored_expenses()
+            self.stdout.write(self.style.SUCCESS(f"Converted {converted} expenses to their company currency"))
@@ -0,0 +1,73 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarks import compare_results, run_benchmarks
+from core.models import Company
+
+
+class Command(BaseCommand):
+    help = 'Benchmark every core route against the seeded data (p50/p95/p99, throughput, queries per request)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per route')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per route first')
+        parser.add_argument('--routes', nargs='+', help='URL names to run (default: all of core/urls.py)')
+        parser.add_argument('--company', type=int, help='Seeded company to act in (default: the first)')
+        parser.add_argument('--server', help='Drive a running server at this URL instead of the test client')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--compare', help='Earlier results JSON to diff against')
+        parser.add_argument(
+            '--fail-threshold', type=float,
+            help='With --compare, fail when any route gets this many percent slower at p95'
+        )
+
+    def handle(self, *args, **options):
+        companies = Company.objects.filter(name__startswith='Bench Company').order_by('id')
+        if options['company']:
+            companies = companies.filter(id=options['company'])
+        company = companies.select_related('admin').first()
+        if company is None:
+            raise CommandError('No benchmark data found; run seed_benchmark_data first')
+
+        report = run_benchmarks(
+            company,
+            requests=options['requests'],
+            warmup=options['warmup'],
+            routes=options['routes'],
+            server=options['server']
+        )
+
+        meta = report['meta']
+        self.stdout.write(f"{meta['mode']} on {meta['database']} at {meta['revision'] or 'unknown revision'}")
+        self.stdout.write(f"{'route':<22}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'queries':>9}{'errors':>8}")
+        for name, row in report['results'].items():
+            queries = '-' if row['queries'] is None else f"{row['queries']:g}"
+            self.stdout.write(
+                f"{name:<22}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}"
+                f"{row['rps'] or 0:>10.1f}{queries:>9}{row['errors']:>8}"
+            )
+        for name, reason in report['skipped'].items():
+            self.stdout.write(f"{name:<22}skipped: {reason}")
+        for name, reason in report['failed'].items():
+            self.stdout.write(self.style.ERROR(f"{name:<22}failed: {reason}"))
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['compare']:
+            with open(options['compare']) as handle:
+                baseline = json.load(handle)
+            self.stdout.write(f"\nAgainst {baseline['meta'].get('revision') or options['compare']}:")
+            regressions = []
+            for name, metric, before, after, change in compare_results(baseline, report):
+                self.stdout.write(f"{name:<22}{metric:<8}{before:>10g} -> {after:<10g}{change:+8.1f}%")
+                if options['fail_threshold'] is not None and metric == 'p95_ms' and change > options['fail_threshold']:
+                    regressions.append(f"{name} ({change:+.1f}%)")
+            if regressions:
+                raise CommandError(f"p95 regressions over {options['fail_threshold']}%: {', '.join(regressions)}")
+
+        if report['failed']:
+            raise CommandError(f"Scenarios could not run: {', '.join(report['failed'])}")
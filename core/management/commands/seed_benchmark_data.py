@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from core.benchmarks import clear_benchmark_data, seed_benchmark_data
+
+
+class Command(BaseCommand):
+    help = 'Create a reproducible benchmark data set (companies, manager trees, expenses, contact messages)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--companies', type=int, default=10)
+        parser.add_argument('--users-per-company', type=int, default=200)
+        parser.add_argument('--expenses-per-user', type=int, default=2)
+        parser.add_argument('--contact-messages', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--clear', action='store_true', help='Delete earlier benchmark data first')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            clear_benchmark_data()
+            self.stdout.write('Cleared earlier benchmark data')
+
+        summary = seed_benchmark_data(
+            companies=options['companies'],
+            users_per_company=options['users_per_company'],
+            expenses_per_user=options['expenses_per_user'],
+            contact_messages=options['contact_messages'],
+            seed=options['seed']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {summary['companies']} companies, {summary['users']} users, "
+            f"{summary['expenses']} expenses and {summary['contact_messages']} contact messages"
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.sessions import get_session_write_stats
+
+
+class Command(BaseCommand):
+    help = 'Show how many session saves reached the database and how many refreshes were coalesced (read from the shared cache)'
+
+    def handle(self, *args, **options):
+        stats = get_session_write_stats()
+        self.stdout.write(
+            f"Session writes: {stats['written']} persisted, {stats['saved']} skipped "
+            f"({stats['savedRatio']:.1%} saved)"
+        )
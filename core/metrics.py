@@ -0,0 +1,134 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class Histogram:
+    """Cumulative Prometheus-style histogram; rates and windows come from the scraper"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        """Yield (le, cumulative count) pairs, ending with +Inf"""
+        running = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            running += count
+            yield ('+Inf' if bound == float('inf') else repr(bound)), running
+
+
+def get_query_budget(view_name):
+    """The most queries a view may run per request before it is reported"""
+    return settings.QUERY_BUDGETS.get(view_name, settings.QUERY_BUDGET_DEFAULT)
+
+
+def record_request(view_name, queries, db_seconds, total_seconds):
+    with _registry_lock:
+        histograms = _registry.get(view_name)
+        if histograms is None:
+            histograms = _registry[view_name] = {
+                'queries': Histogram(QUERY_BUCKETS),
+                'db_seconds': Histogram(SECONDS_BUCKETS),
+                'seconds': Histogram(SECONDS_BUCKETS),
+            }
+        histograms['queries'].observe(queries)
+        histograms['db_seconds'].observe(db_seconds)
+        histograms['seconds'].observe(total_seconds)
+
+
+def reset_metrics():
+    with _registry_lock:
+        _registry.clear()
+
+
+def render_metrics():
+    """Render this process's per-view histograms in the Prometheus text format"""
+    from .sessions import get_session_write_stats
+
+    metrics = [
+        ('http_view_queries', 'Database queries per request', 'queries'),
+        ('http_view_db_seconds', 'Time spent in database queries per request', 'db_seconds'),
+        ('http_view_seconds', 'Total request time', 'seconds'),
+    ]
+    with _registry_lock:
+        lines = []
+        for name, description, key in metrics:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} histogram')
+            for view_name, histograms in sorted(_registry.items()):
+                histogram = histograms[key]
+                for le, count in histogram.samples():
+                    lines.append(f'{name}_bucket{{view="{view_name}",le="{le}"}} {count}')
+                lines.append(f'{name}_sum{{view="{view_name}"}} {histogram.sum}')
+                lines.append(f'{name}_count{{view="{view_name}"}} {histogram.count}')
+
+    sessions = get_session_write_stats()
+    lines.append('# HELP session_writes_total Session saves, by whether they reached the database')
+    lines.append('# TYPE session_writes_total counter')
+    lines.append(f'session_writes_total{{result="written"}} {sessions["written"]}')
+    lines.append(f'session_writes_total{{result="skipped"}} {sessions["saved"]}')
+    return '\n'.join(lines) + '\n'
+
+
+class QueryMetricsMiddleware:
+    """Record per-view query count, DB time and total time; opt in with QUERY_METRICS = True.
+
+    Requests that run more queries than their budget (QUERY_BUDGETS, else
+    QUERY_BUDGET_DEFAULT) are reported. Queries issued while a streaming
+    response is consumed happen after the middleware returns and are not
+    counted.
+    """
+
+    def __init__(self, get_response):
+        if not settings.QUERY_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = {'queries': 0, 'db_seconds': 0.0}
+
+        def timed(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                stats['queries'] += 1
+                stats['db_seconds'] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(timed):
+            response = self.get_response(request)
+        total_seconds = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else 'unresolved'
+        record_request(view_name, stats['queries'], stats['db_seconds'], total_seconds)
+
+        budget = get_query_budget(view_name)
+        if stats['queries'] > budget:
+            logger.warning(
+                "Query budget exceeded: %s ran %d queries (budget %d) for %s %s",
+                view_name, stats['queries'], budget, request.method, request.path
+            )
+        return response
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_ocr_result_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ocrjob',
+            name='timings',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:13
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_ocrjob_timings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRateTable',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base', models.CharField(max_length=3)),
+                ('rates', models.JSONField()),
+                ('source', models.CharField(max_length=20)),
+                ('fetched_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'exchange_rate_tables',
+                'ordering': ['-fetched_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_exchange_rate_table'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApprovalRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('category', models.CharField(choices=[('all', 'All Categories'), ('travel', 'Travel'), ('meals', 'Meals & Entertainment'), ('supplies', 'Office Supplies'), ('equipment', 'Equipment'), ('training', 'Training & Development'), ('other', 'Other')], default='all', max_length=20)),
+                ('min_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('max_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('approver_role', models.CharField(choices=[('manager', 'Manager'), ('admin', 'Admin')], default='manager', max_length=20)),
+                ('is_manager_approver', models.BooleanField(default=True)),
+                ('auto_approve', models.BooleanField(default=False)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='approval_rules', to='core.company')),
+            ],
+            options={
+                'db_table': 'approval_rules',
+                'ordering': ['-min_amount'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ExpenseApproval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('step_number', models.PositiveIntegerField(default=0)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('rejected', 'Rejected')], default='pending', max_length=20)),
+                ('comments', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('approver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expense_approvals', to=settings.AUTH_USER_MODEL)),
+                ('expense', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='approvals', to='core.expense')),
+            ],
+            options={
+                'db_table': 'expense_approvals',
+                'ordering': ['step_number'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ApprovalStep',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('step_number', models.PositiveIntegerField()),
+                ('approver_role', models.CharField(blank=True, choices=[('admin', 'Admin'), ('manager', 'Manager'), ('employee', 'Employee')], default='', max_length=20)),
+                ('approver', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='approval_steps', to=settings.AUTH_USER_MODEL)),
+                ('rule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='steps', to='core.approvalrule')),
+            ],
+            options={
+                'db_table': 'approval_steps',
+                'ordering': ['step_number'],
+                'unique_together': {('rule', 'step_number')},
+            },
+        ),
+    ]
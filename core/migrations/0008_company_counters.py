@@ -0,0 +1,58 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_counters(apps, schema_editor):
+    Company = apps.get_model('core', 'Company')
+    CompanyCounters = apps.get_model('core', 'CompanyCounters')
+    ExpenseApproval = apps.get_model('core', 'ExpenseApproval')
+    User = apps.get_model('core', 'User')
+
+    # Admins created at registration were never attached to their company
+    for company in Company.objects.filter(admin__isnull=False, admin__company__isnull=True):
+        User.objects.filter(id=company.admin_id).update(company=company)
+
+    counters = {company_id: CompanyCounters(company_id=company_id) for company_id in Company.objects.values_list('id', flat=True)}
+    users = User.objects.filter(company__isnull=False).values('company_id').annotate(
+        users=models.Count('id'),
+        employees=models.Count('id', filter=models.Q(role='employee')),
+        managers=models.Count('id', filter=models.Q(role='manager'))
+    ).order_by()
+    for row in users:
+        counters[row['company_id']].users = row['users']
+        counters[row['company_id']].employees = row['employees']
+        counters[row['company_id']].managers = row['managers']
+    pending = ExpenseApproval.objects.filter(status='pending').values('expense__company_id').annotate(
+        count=models.Count('id')
+    ).order_by()
+    for row in pending:
+        counters[row['expense__company_id']].pending_approvals = row['count']
+    CompanyCounters.objects.bulk_create(counters.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_approval_rules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyCounters',
+            fields=[
+                ('company', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counters', serialize=False, to='core.company')),
+                ('users', models.IntegerField(default=0)),
+                ('employees', models.IntegerField(default=0)),
+                ('managers', models.IntegerField(default=0)),
+                ('pending_approvals', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Company counters',
+                'db_table': 'company_counters',
+            },
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
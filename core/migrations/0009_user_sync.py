@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_company_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'user_tombstones',
+                'ordering': ['deleted_at', 'id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['company', 'updated_at', 'id'], name='users_company_sync_idx'),
+        ),
+        migrations.AddField(
+            model_name='usertombstone',
+            name='company',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_tombstones', to='core.company'),
+        ),
+        migrations.AddIndex(
+            model_name='usertombstone',
+            index=models.Index(fields=['company', 'deleted_at', 'id'], name='tombstones_company_sync_idx'),
+        ),
+    ]
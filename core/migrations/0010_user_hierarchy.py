@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_hierarchy(apps, schema_editor):
+    User = apps.get_model('core', 'User')
+    UserHierarchy = apps.get_model('core', 'UserHierarchy')
+
+    manager_of = dict(User.objects.values_list('id', 'manager_id'))
+    links = []
+    for user_id in manager_of:
+        seen = set()
+        current, depth = user_id, 0
+        # Existing data may contain loops; stop walking at the first repeat
+        while current is not None and current not in seen:
+            seen.add(current)
+            links.append(UserHierarchy(ancestor_id=current, descendant_id=user_id, depth=depth))
+            current, depth = manager_of.get(current), depth + 1
+    UserHierarchy.objects.bulk_create(links, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_user_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserHierarchy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to=settings.AUTH_USER_MODEL)),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'user_hierarchy',
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='user_hierarchy_up_idx')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(populate_hierarchy, migrations.RunPython.noop),
+    ]
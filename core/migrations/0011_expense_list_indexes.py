@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_user_hierarchy'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['company', 'employee', 'status', 'date'], name='expenses_employee_list_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['company', 'status', 'date'], name='expenses_company_list_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_expense_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['current_approver', 'status', 'created_at'], name='expenses_inbox_idx'),
+        ),
+    ]
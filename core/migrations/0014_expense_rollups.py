@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.functions
+
+
+def populate_rollups(apps, schema_editor):
+    Expense = apps.get_model('core', 'Expense')
+    ExpenseRollup = apps.get_model('core', 'ExpenseRollup')
+
+    rows = Expense.objects.filter(status='approved').values('company_id', 'date', 'category', 'employee_id').annotate(
+        total=models.Sum(django.db.models.functions.Coalesce('converted_amount', 'amount')),
+        count=models.Count('id')
+    ).order_by()
+    ExpenseRollup.objects.bulk_create([
+        ExpenseRollup(
+            company_id=row['company_id'], day=row['date'], category=row['category'],
+            employee_id=row['employee_id'], total=row['total'], count=row['count']
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_report_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('travel', 'Travel'), ('meals', 'Meals & Entertainment'), ('supplies', 'Office Supplies'), ('equipment', 'Equipment'), ('training', 'Training & Development'), ('other', 'Other')], max_length=20)),
+                ('day', models.DateField()),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expense_rollups', to='core.company')),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expense_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'expense_rollups',
+                'ordering': ['day'],
+                'unique_together': {('company', 'day', 'category', 'employee')},
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
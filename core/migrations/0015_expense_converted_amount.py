@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+def fill_same_currency_amounts(apps, schema_editor):
+    # Expenses already in their company's currency need no rate; the rest are
+    # converted by refresh_exchange_rates --convert-expenses
+    Expense = apps.get_model('core', 'Expense')
+    Expense.objects.filter(
+        converted_amount__isnull=True, currency=models.F('company__currency')
+    ).update(converted_amount=models.F('amount'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_expense_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_same_currency_amounts, migrations.RunPython.noop),
+    ]
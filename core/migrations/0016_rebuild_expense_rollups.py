@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+def rebuild_rollups(apps, schema_editor):
+    # The rollups used to fall back to the raw amount of unconverted expenses,
+    # mixing currencies; they now only hold company-currency amounts
+    Expense = apps.get_model('core', 'Expense')
+    ExpenseRollup = apps.get_model('core', 'ExpenseRollup')
+
+    ExpenseRollup.objects.all().delete()
+    rows = Expense.objects.filter(status='approved', converted_amount__isnull=False).values(
+        'company_id', 'date', 'category', 'employee_id'
+    ).annotate(total=models.Sum('converted_amount'), count=models.Count('id')).order_by()
+    ExpenseRollup.objects.bulk_create([
+        ExpenseRollup(
+            company_id=row['company_id'], day=row['date'], category=row['category'],
+            employee_id=row['employee_id'], total=row['total'], count=row['count']
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_expense_converted_amount'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_rebuild_expense_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='companycounters',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
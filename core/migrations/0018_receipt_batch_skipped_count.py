@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_company_counters_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receiptbatch',
+            name='skipped_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
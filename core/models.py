@@ -41,6 +41,9 @@ class User(AbstractUser):
     class Meta:
         db_table = 'users'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['company', 'updated_at', 'id'], name='users_company_sync_idx'),
+        ]
     
     def __str__(self):
         return f"{self.get_full_name()} ({self.role})"
@@ -86,13 +89,77 @@ class Company(models.Model):
     def __str__(self):
         return self.name
     
-def get_employee_count(self):
-    """Returns total employees in the company"""
-    return self.employees.filter(role='employee').count()
+    def get_counters(self):
+        """Returns the company's counters row, recounting it if it is missing"""
+        from .counters import rebuild_counters
+        
+        try:
+            return self.counters
+        except CompanyCounters.DoesNotExist:
+            rebuild_counters([self.id])
+            self.counters = CompanyCounters.objects.get(company=self)
+            return self.counters
+    
+    def get_employee_count(self):
+        """Returns total employees in the company"""
+        return self.get_counters().employees
+    
+    def get_manager_count(self):
+        """Returns total managers in the company"""
+        return self.get_counters().managers
+
+
+class CompanyCounters(models.Model):
+    """Per-company totals kept up to date by signals (see core/counters.py)"""
+    company = models.OneToOneField(Company, on_delete=models.CASCADE, primary_key=True, related_name='counters')
+    users = models.IntegerField(default=0)
+    employees = models.IntegerField(default=0)
+    managers = models.IntegerField(default=0)
+    pending_approvals = models.IntegerField(default=0)
+    # Bumped with every change to the company's users, settings or stats; the read APIs' ETag
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'company_counters'
+        verbose_name_plural = 'Company counters'
+    
+    def __str__(self):
+        return f"Counters for {self.company}"
+
+class UserHierarchy(models.Model):
+    """Closure table of the manager tree: one row per (ancestor, descendant) pair, self included at depth 0"""
+    ancestor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+    
+    class Meta:
+        db_table = 'user_hierarchy'
+        unique_together = ['ancestor', 'descendant']
+        indexes = [
+            models.Index(fields=['descendant', 'depth'], name='user_hierarchy_up_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
+
+class UserTombstone(models.Model):
+    """Records a deleted user so delta syncs can tell clients to drop it"""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='user_tombstones')
+    user_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'user_tombstones'
+        ordering = ['deleted_at', 'id']
+        indexes = [
+            models.Index(fields=['company', 'deleted_at', 'id'], name='tombstones_company_sync_idx'),
+        ]
+    
+    def __str__(self):
+        return f"User #{self.user_id} deleted {self.deleted_at}"
 
-def get_manager_count(self):
-    """Returns total managers in the company"""
-    return self.employees.filter(role='manager').count()
 
 class ContactMessage(models.Model):
     name = models.CharField(max_length=100)
@@ -106,4 +173,264 @@ class ContactMessage(models.Model):
         ordering = ['-created_at']
     
     def __str__(self):
-        return f"Message from {self.name} - {self.email}"
\ No newline at end of file
+        return f"Message from {self.name} - {self.email}"
+
+
+class Expense(models.Model):
+    STATUS_CHOICES = [
+        ('draft', 'Draft'),
+        ('pending', 'Pending'),
+        ('in_progress', 'In Progress'),
+        ('approved', 'Approved'),
+        ('rejected', 'Rejected'),
+    ]
+    
+    CATEGORY_CHOICES = [
+        ('travel', 'Travel'),
+        ('meals', 'Meals & Entertainment'),
+        ('supplies', 'Office Supplies'),
+        ('equipment', 'Equipment'),
+        ('training', 'Training & Development'),
+        ('other', 'Other'),
+    ]
+    
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='expenses')
+    employee = models.ForeignKey(User, on_delete=models.CASCADE, related_name='expenses')
+    title = models.CharField(max_length=200)
+    description = models.TextField(blank=True, default='')
+    merchant = models.CharField(max_length=200, blank=True, default='')
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    currency = models.CharField(max_length=3, default='USD')
+    converted_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, default='other')
+    date = models.DateField(default=timezone.localdate)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    current_approver = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        related_name='expenses_to_approve',
+        null=True,
+        blank=True
+    )
+    current_step = models.PositiveIntegerField(default=0)
+    receipt = models.FileField(upload_to='receipts/%Y/%m/', blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'expenses'
+        ordering = ['-created_at']
+        indexes = [
+            # Expense list: one employee's (or a team's) expenses, filtered by status, newest first
+            models.Index(fields=['company', 'employee', 'status', 'date'], name='expenses_employee_list_idx'),
+            # Expense list for company admins
+            models.Index(fields=['company', 'status', 'date'], name='expenses_company_list_idx'),
+            # Approval inbox: what is waiting on an approver, oldest first
+            models.Index(fields=['current_approver', 'status', 'created_at'], name='expenses_inbox_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.title} - {self.amount} {self.currency} ({self.status})"
+
+
+class ExpenseRollup(models.Model):
+    """Approved spend per company, day, category and employee, in the company currency.
+
+    Kept up to date by the Expense signals and the bulk workflow paths;
+    rebuild_expense_rollups recomputes it from the expenses.
+    """
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='expense_rollups')
+    employee = models.ForeignKey(User, on_delete=models.CASCADE, related_name='expense_rollups')
+    category = models.CharField(max_length=20, choices=Expense.CATEGORY_CHOICES)
+    day = models.DateField()
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'expense_rollups'
+        ordering = ['day']
+        unique_together = ['company', 'day', 'category', 'employee']
+    
+    def __str__(self):
+        return f"{self.company} {self.day} {self.category}: {self.total} ({self.count})"
+
+
+class ApprovalRule(models.Model):
+    CATEGORY_CHOICES = [('all', 'All Categories')] + Expense.CATEGORY_CHOICES
+    
+    APPROVER_ROLE_CHOICES = [
+        ('manager', 'Manager'),
+        ('admin', 'Admin'),
+    ]
+    
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='approval_rules')
+    name = models.CharField(max_length=200)
+    category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, default='all')
+    min_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    max_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    approver_role = models.CharField(max_length=20, choices=APPROVER_ROLE_CHOICES, default='manager')
+    is_manager_approver = models.BooleanField(default=True)
+    auto_approve = models.BooleanField(default=False)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'approval_rules'
+        ordering = ['-min_amount']
+    
+    def __str__(self):
+        return f"{self.name} ({self.company})"
+
+
+class ApprovalStep(models.Model):
+    rule = models.ForeignKey(ApprovalRule, on_delete=models.CASCADE, related_name='steps')
+    step_number = models.PositiveIntegerField()
+    approver = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        related_name='approval_steps',
+        null=True,
+        blank=True
+    )
+    approver_role = models.CharField(max_length=20, choices=User.ROLE_CHOICES, blank=True, default='')
+    
+    class Meta:
+        db_table = 'approval_steps'
+        ordering = ['step_number']
+        unique_together = ['rule', 'step_number']
+    
+    def __str__(self):
+        return f"{self.rule.name} - step {self.step_number}"
+
+
+class ExpenseApproval(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('approved', 'Approved'),
+        ('rejected', 'Rejected'),
+    ]
+    
+    expense = models.ForeignKey(Expense, on_delete=models.CASCADE, related_name='approvals')
+    approver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='expense_approvals')
+    step_number = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    comments = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'expense_approvals'
+        ordering = ['step_number']
+    
+    def __str__(self):
+        return f"{self.expense} - {self.approver} ({self.status})"
+
+
+class ReceiptBatch(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='receipt_batches')
+    total_files = models.PositiveIntegerField(default=0)
+    skipped = models.JSONField(default=list, blank=True)
+    skipped_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'receipt_batches'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Receipt batch #{self.id} ({self.total_files} files)"
+
+
+class OCRJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ocr_jobs')
+    batch = models.ForeignKey(ReceiptBatch, on_delete=models.CASCADE, related_name='jobs', null=True, blank=True)
+    expense = models.ForeignKey(Expense, on_delete=models.SET_NULL, related_name='ocr_jobs', null=True, blank=True)
+    image = models.FileField(upload_to='receipts/%Y/%m/')
+    filename = models.CharField(max_length=255, blank=True, default='')
+    content_hash = models.CharField(max_length=64, blank=True, default='')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    text = models.TextField(blank=True, default='')
+    result = models.JSONField(null=True, blank=True)
+    timings = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'ocr_jobs'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"OCR job #{self.id} ({self.status})"
+
+
+class OCRResultCache(models.Model):
+    content_hash = models.CharField(max_length=64)
+    pipeline_version = models.CharField(max_length=32)
+    text = models.TextField(blank=True, default='')
+    data = models.JSONField(null=True, blank=True)
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    class Meta:
+        db_table = 'ocr_result_cache'
+        unique_together = ['content_hash', 'pipeline_version']
+    
+    def __str__(self):
+        return f"{self.content_hash[:12]} (v{self.pipeline_version})"
+
+
+class ExchangeRateTable(models.Model):
+    base = models.CharField(max_length=3)
+    rates = models.JSONField()
+    source = models.CharField(max_length=20)
+    fetched_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    class Meta:
+        db_table = 'exchange_rate_tables'
+        ordering = ['-fetched_at']
+    
+    def __str__(self):
+        return f"{self.base} rates from {self.source} at {self.fetched_at}"
+
+
+class ReportJob(models.Model):
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('pdf', 'PDF'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='report_jobs')
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='report_jobs')
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='csv')
+    filters = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    file = models.FileField(upload_to='reports/%Y/%m/', blank=True, default='')
+    rows = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'report_jobs'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.get_format_display()} report #{self.id} ({self.status})"
@@ -0,0 +1,65 @@
+import hashlib
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+from .ocr_service import get_pipeline_version
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def hash_upload(upload):
+    """SHA-256 of an uploaded file, read chunk by chunk"""
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    upload.seek(0)
+    return digest.hexdigest()
+
+
+def hash_file(path):
+    """SHA-256 of a file on disk, read chunk by chunk"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_cached_result(content_hash):
+    """Return the cached OCR result for an image hash under the current pipeline, if any"""
+    from .models import OCRResultCache
+
+    entry = OCRResultCache.objects.filter(
+        content_hash=content_hash,
+        pipeline_version=get_pipeline_version()
+    ).only('id', 'text', 'data').first()
+    if entry is None:
+        return None
+
+    OCRResultCache.objects.filter(id=entry.id).update(hits=F('hits') + 1, last_used_at=timezone.now())
+    return {'text': entry.text, 'data': entry.data}
+
+
+def store_cached_result(content_hash, result):
+    """Remember an OCR result and evict the least recently used entries over the size limit"""
+    from .models import OCRResultCache
+
+    try:
+        OCRResultCache.objects.update_or_create(
+            content_hash=content_hash,
+            pipeline_version=get_pipeline_version(),
+            defaults={'text': result['text'], 'data': result['data'], 'last_used_at': timezone.now()}
+        )
+    except IntegrityError:
+        # A concurrent worker cached the same image first
+        return
+
+    limit = settings.OCR_CACHE_MAX_ENTRIES
+    stale_ids = list(
+        OCRResultCache.objects.order_by('-last_used_at').values_list('id', flat=True)[limit:limit + 1000]
+    )
+    if stale_ids:
+        OCRResultCache.objects.filter(id__in=stale_ids).delete()
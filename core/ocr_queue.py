@@ -0,0 +1,141 @@
+import logging
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .ocr_cache import get_cached_result, hash_file, store_cached_result
+from .ocr_service import extract_text_from_image, parse_receipt_data
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the shared OCR process pool, creating it on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=max(settings.OCR_WORKERS, 1))
+        return _executor
+
+
+def run_ocr(image_path, max_pixels=None):
+    """Extract and parse a receipt image (runs inside a worker process)"""
+    if max_pixels:
+        # Only the header is read here, so oversized images are refused before decoding
+        with Image.open(image_path) as img:
+            width, height = img.size
+        if width * height > max_pixels:
+            raise ValueError(f"Image is {width}x{height}, above the {max_pixels} pixel limit")
+
+    timings = {}
+    text = extract_text_from_image(image_path, timings=timings)
+    started = time.perf_counter()
+    data = parse_receipt_data(text)
+    timings['parse'] = round((time.perf_counter() - started) * 1000, 2)
+    if data['date']:
+        data['date'] = data['date'].isoformat()
+    return {'text': text, 'data': data, 'timings': timings}
+
+
+def claim_job(job_id):
+    """Atomically move a pending job to processing; False if someone else took it"""
+    from .models import OCRJob
+
+    return OCRJob.objects.filter(id=job_id, status='pending').update(
+        status='processing',
+        updated_at=timezone.now()
+    ) == 1
+
+
+def take_job(job):
+    """Claim a pending job, finishing it straight from the result cache when possible.
+
+    Returns True when the caller still has to run OCR for the job.
+    """
+    if not claim_job(job.id):
+        return False
+
+    if not job.content_hash:
+        job.content_hash = hash_file(job.image.path)
+        job.save(update_fields=['content_hash'])
+
+    cached = get_cached_result(job.content_hash)
+    if cached is not None:
+        finish_job(job.id, result=cached)
+        return False
+    return True
+
+
+def finish_job(job_id, result=None, error=None, content_hash=None):
+    """Store the outcome of an OCR run on its job row (and in the result cache)"""
+    from .models import OCRJob
+
+    if error is not None:
+        OCRJob.objects.filter(id=job_id).update(
+            status='failed',
+            error=str(error),
+            updated_at=timezone.now()
+        )
+        return
+
+    with transaction.atomic():
+        OCRJob.objects.filter(id=job_id).update(
+            status='done',
+            text=result['text'],
+            result=result['data'],
+            timings=result.get('timings'),
+            updated_at=timezone.now()
+        )
+
+        # Batch uploads get a draft expense alongside the finished job
+        job = OCRJob.objects.select_related('user').filter(id=job_id, batch__isnull=False).first()
+        if job is not None:
+            from .receipt_ingest import create_draft_expense
+            create_draft_expense(job)
+
+    # Empty text usually means Tesseract failed, which is not worth remembering
+    if content_hash and result['text'].strip():
+        store_cached_result(content_hash, result)
+
+
+def _on_job_done(job, future):
+    try:
+        finish_job(job.id, result=future.result(), content_hash=job.content_hash)
+    except Exception as e:
+        logger.exception("OCR job %s failed", job.id)
+        finish_job(job.id, error=e)
+    finally:
+        # Callbacks run on the executor's management thread, which gets its own connection
+        connection.close()
+
+
+def enqueue_ocr_job(job):
+    """Hand a pending job to the worker pool and return without waiting for it.
+
+    Duplicate images are answered from the result cache without touching the
+    pool. With OCR_WORKERS = 0 the job runs inline instead, which is handy for
+    development machines and tests.
+    """
+    if not take_job(job):
+        return None
+
+    if settings.OCR_WORKERS <= 0:
+        try:
+            result = run_ocr(job.image.path, settings.OCR_MAX_RECEIPT_PIXELS)
+        except Exception as e:
+            finish_job(job.id, error=e)
+        else:
+            finish_job(job.id, result=result, content_hash=job.content_hash)
+        return None
+
+    future = get_executor().submit(run_ocr, job.image.path, settings.OCR_MAX_RECEIPT_PIXELS)
+    future.add_done_callback(lambda f: _on_job_done(job, f))
+    return future
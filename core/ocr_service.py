@@ -1,73 +1,331 @@
+import hashlib
+import threading
+import time
+
 import pytesseract
 from PIL import Image
 import cv2
 import numpy as np
 import re
-from datetime import datetime
+from datetime import date
+from django.conf import settings
+
+# Bump whenever preprocessing or parsing changes so cached OCR results are invalidated
+OCR_PIPELINE_VERSION = '4'
+
+# Long edge of the thumbnail used to locate the receipt and measure skew
+_ANALYSIS_SIZE = 512
+
+
+class _BufferPool(threading.local):
+    """Per-thread scratch arrays that stages write into instead of allocating.
+
+    Each stage keeps one buffer, replaced only when the image shape changes,
+    so a worker processing a stream of similar photos stops allocating.
+    """
+
+    def __init__(self):
+        self.arrays = {}
+
+    def get(self, name, shape, dtype=np.uint8):
+        array = self.arrays.get(name)
+        if array is None or array.shape != shape or array.dtype != dtype:
+            array = self.arrays[name] = np.empty(shape, dtype=dtype)
+        return array
+
+
+_buffers = _BufferPool()
+
+
+def _as_gray(img):
+    if img.ndim == 2:
+        return img
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=_buffers.get('gray', img.shape[:2]))
+
+
+def _thumbnail(gray):
+    height, width = gray.shape
+    scale = min(1.0, _ANALYSIS_SIZE / max(height, width))
+    size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    thumb = cv2.resize(gray, size, dst=_buffers.get('thumb', size[::-1]), interpolation=cv2.INTER_NEAREST)
+    return thumb, scale
+
+
+def _target_width():
+    return int(settings.OCR_TARGET_DPI * settings.OCR_RECEIPT_WIDTH_INCHES)
+
+
+def grayscale(img):
+    """Drop colour information; Tesseract only needs luminance"""
+    return _as_gray(img)
+
+
+def crop(img):
+    """Cut the photo down to the receipt, i.e. the largest bright region"""
+    thumb, scale = _thumbnail(_as_gray(img))
+    mask = cv2.threshold(thumb, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=_buffers.get('mask', thumb.shape))[1]
+    contours = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]
+    if not contours:
+        return img
+
+    x, y, width, height = cv2.boundingRect(max(contours, key=cv2.contourArea))
+    if width * height < 0.05 * mask.size:
+        # Nothing receipt-sized stands out, so keep the whole frame
+        return img
+
+    margin = 4
+    top = max(0, int((y - margin) / scale))
+    left = max(0, int((x - margin) / scale))
+    bottom = min(img.shape[0], int((y + height + margin) / scale))
+    right = min(img.shape[1], int((x + width + margin) / scale))
+    return img[top:bottom, left:right]
+
+
+def downscale(img):
+    """Resize so the receipt is rendered at OCR_TARGET_DPI; never upscales"""
+    target_width = _target_width()
+    height, width = img.shape[:2]
+    if width <= target_width:
+        return img
+
+    size = (target_width, max(1, round(height * target_width / width)))
+    buffer = _buffers.get('downscale', size[::-1] + img.shape[2:])
+    return cv2.resize(img, size, dst=buffer, interpolation=cv2.INTER_AREA)
+
+
+def _skew_angle(thumb):
+    """Skew in degrees, from the paper edge when visible, otherwise from the ink"""
+    paper = cv2.threshold(thumb, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=_buffers.get('mask', thumb.shape))[1]
+    contours = cv2.findContours(paper, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]
+    rect = None
+    if contours:
+        largest = max(contours, key=cv2.contourArea)
+        if cv2.contourArea(largest) < 0.95 * paper.size:
+            rect = cv2.minAreaRect(largest)
+
+    if rect is None:
+        ink = cv2.bitwise_not(paper, dst=paper)
+        points = cv2.findNonZero(ink)
+        if points is None:
+            return 0.0
+        rect = cv2.minAreaRect(points)
+
+    angle = rect[-1]
+    return angle - 90 if angle > 45 else angle
+
+
+def deskew(img):
+    """Rotate the receipt upright using the minimum-area box around the paper or text"""
+    thumb, _ = _thumbnail(_as_gray(img))
+    angle = _skew_angle(thumb)
+    if abs(angle) < 0.5 or abs(angle) > 15:
+        # Too small to matter, or too large to be trusted
+        return img
+
+    height, width = img.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(
+        img, matrix, (width, height),
+        dst=_buffers.get('deskew', img.shape),
+        flags=cv2.INTER_LINEAR,
+        borderMode=cv2.BORDER_REPLICATE
+    )
+
+
+def threshold(img):
+    """Binarise with Otsu's method"""
+    gray = _as_gray(img)
+    return cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=_buffers.get('threshold', gray.shape))[1]
+
+
+PREPROCESS_STAGES = {
+    'grayscale': grayscale,
+    'crop': crop,
+    'downscale': downscale,
+    'deskew': deskew,
+    'threshold': threshold,
+}
+
+
+def get_preprocess_stages():
+    """The preprocessing stages configured for this deployment, in order"""
+    stages = list(settings.OCR_PREPROCESS_STAGES)
+    unknown = [name for name in stages if name not in PREPROCESS_STAGES]
+    if unknown:
+        raise ValueError(f"Unknown OCR preprocessing stage(s): {', '.join(unknown)}")
+    return stages
+
+
+def get_pipeline_version():
+    """Version tag for cached OCR results: code version plus the preprocessing configuration"""
+    config = f"{','.join(get_preprocess_stages())}|{settings.OCR_TARGET_DPI}|{settings.OCR_RECEIPT_WIDTH_INCHES}"
+    return f"{OCR_PIPELINE_VERSION}-{hashlib.sha1(config.encode()).hexdigest()[:8]}"
+
+
+def _read_image(image_path, stages):
+    """Decode the image, letting libjpeg shrink it on the fly when we will downscale anyway"""
+    flags = cv2.IMREAD_GRAYSCALE if 'grayscale' in stages else cv2.IMREAD_COLOR
+    if 'downscale' in stages:
+        with Image.open(image_path) as header:
+            width = header.size[0]
+        # Receipts often fill only part of the photo, so keep plenty of headroom for cropping
+        reduced = {
+            cv2.IMREAD_GRAYSCALE: (cv2.IMREAD_REDUCED_GRAYSCALE_8, cv2.IMREAD_REDUCED_GRAYSCALE_4, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+            cv2.IMREAD_COLOR: (cv2.IMREAD_REDUCED_COLOR_8, cv2.IMREAD_REDUCED_COLOR_4, cv2.IMREAD_REDUCED_COLOR_2),
+        }[flags]
+        for factor, flag in zip((8, 4, 2), reduced):
+            if width / factor >= 4 * _target_width():
+                flags = flag
+                break
+
+    img = cv2.imread(image_path, flags)
+    if img is None:
+        raise ValueError(f"Could not read image {image_path}")
+    return img
+
+
+def extract_text_from_image(image_path, stages=None, timings=None):
+    """Extract text from receipt image using OCR.
+
+    The image goes through the configured preprocessing stages before
+    Tesseract. Pass a dict as ``timings`` to get the milliseconds spent
+    reading, in each stage and in Tesseract. Unreadable images, unknown
+    stages and Tesseract failures raise, so the OCR job is marked failed.
+    """
+    stages = stages if stages is not None else get_preprocess_stages()
+    
+    started = time.perf_counter()
+    img = _read_image(image_path, stages)
+    if timings is not None:
+        timings['read'] = round((time.perf_counter() - started) * 1000, 2)
+    
+    for name in stages:
+        started = time.perf_counter()
+        img = PREPROCESS_STAGES[name](img)
+        if timings is not None:
+            timings[name] = round((time.perf_counter() - started) * 1000, 2)
+    
+    started = time.perf_counter()
+    text = pytesseract.image_to_string(Image.fromarray(img))
+    if timings is not None:
+        timings['tesseract'] = round((time.perf_counter() - started) * 1000, 2)
+    return text
+
+_CURRENCY_SYMBOLS = {'$': 'USD', '£': 'GBP', '€': 'EUR', '¥': 'JPY', '₹': 'INR'}
+
+# Patterns start with a digit/word so the regex engine can skip ahead in C between hits
+_AMOUNT_RE = re.compile(r'\d[\d.,]*[.,]\d\d(?!\d)')
+_SYMBOL_AMOUNT_RE = re.compile(r'([$£€¥₹])[ \t]*(\d[\d.,]*[.,]\d\d)(?!\d)|(\d[\d.,]*[.,]\d\d)(?!\d)[ \t]*([$£€¥₹])')
+_SYMBOL_RE = re.compile(r'[$£€¥₹]')
+_DATE_RE = re.compile(r'(\d{2})([/-])(\d{2})\2(\d{4})(?!\d)|(\d{4})-(\d{2})-(\d{2})(?!\d)')
+_CURRENCY_CODE_RE = re.compile(r'\b(?:USD|EUR|GBP|INR|JPY|AUD|CAD)\b')
+_SUBTOTAL_RE = re.compile(r'\bSUB\s*-?\s*TOTAL\b')
+_GRAND_TOTAL_RE = re.compile(r'\b(?:GRAND\s+TOTAL|TOTAL\s+DUE|AMOUNT\s+DUE|BALANCE\s+DUE|AMOUNT\s+PAID)\b')
+_TOTAL_RE = re.compile(r'\bTOTAL\b')
+_TAX_RE = re.compile(r'\b(?:TAX|VAT|GST|HST)\b')
+# "TOTAL INCL. VAT" is still the total
+_TAX_INCLUDED_RE = re.compile(r'\b(?:INCL|INCLUDING|INC)\b')
+
+# How strongly a line's wording suggests its amount is the receipt total
+_SCORE_GRAND_TOTAL = 3
+_SCORE_TOTAL = 2
+_SCORE_SUBTOTAL = 1
+
+
+def _parse_amount(num):
+    """Normalise "1.234,56" / "1,234.56" / "12,50" to a float"""
+    return float(num[:-3].replace(',', '').replace('.', '') + '.' + num[-2:])
+
+
+def _score_total_line(upper):
+    if _SUBTOTAL_RE.search(upper):
+        return _SCORE_SUBTOTAL
+    if _GRAND_TOTAL_RE.search(upper):
+        return _SCORE_GRAND_TOTAL
+    if _TOTAL_RE.search(upper):
+        return _SCORE_TOTAL
+    return 0
 
-def extract_text_from_image(image_path):
-    """Extract text from receipt image using OCR"""
-    try:
-        # Read image
-        img = cv2.imread(image_path)
-        
-        # Preprocess image
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
-        
-        # Extract text
-        text = pytesseract.image_to_string(Image.fromarray(thresh))
-        return text
-    except Exception as e:
-        print(f"OCR Error: {e}")
-        return ""
 
 def parse_receipt_data(text):
-    """Parse receipt text and extract relevant information"""
+    """Parse receipt text and extract relevant information.
+
+    The text is upper-cased and split into lines once; merchant, total and
+    tax are then picked up in a single walk over those lines, using cheap
+    substring checks before any precompiled pattern runs. The total is the
+    largest amount on the line whose wording scores highest ("GRAND TOTAL" >
+    "TOTAL" > "SUBTOTAL"); receipts without such a line fall back to the
+    largest amount printed next to a currency symbol.
+    """
     data = {
         'amount': None,
         'date': None,
         'merchant': None,
+        'tax': None,
+        'currency': None,
         'description': text[:200] if text else ""
     }
+    if not text:
+        return data
     
-    # Extract amount (looking for currency symbols and numbers)
-    amount_pattern = r'[\$£€¥₹]\s*(\d+[.,]\d{2})|(\d+[.,]\d{2})\s*[\$£€¥₹]'
-    amount_matches = re.findall(amount_pattern, text)
-    if amount_matches:
-        amount_str = ''.join(amount_matches[0]).replace(',', '.')
-        try:
-            data['amount'] = float(re.findall(r'\d+\.\d{2}', amount_str)[0])
-        except:
-            pass
+    lines = text.split('\n')
+    best_score = 0
+    total_line = None
     
-    # Extract date
-    date_patterns = [
-        r'\d{2}/\d{2}/\d{4}',
-        r'\d{2}-\d{2}-\d{4}',
-        r'\d{4}-\d{2}-\d{2}'
-    ]
-    for pattern in date_patterns:
-        date_match = re.search(pattern, text)
-        if date_match:
-            try:
-                date_str = date_match.group()
-                for fmt in ('%d/%m/%Y', '%d-%m-%Y', '%Y-%m-%d'):
-                    try:
-                        data['date'] = datetime.strptime(date_str, fmt).date()
-                        break
-                    except:
-                        continue
-            except:
-                pass
-            if data['date']:
-                break
+    for index, upper in enumerate(text.upper().split('\n')):
+        # Merchant name is usually the first wordy line at the top of the receipt
+        if index < 5 and data['merchant'] is None:
+            stripped = lines[index].strip()
+            if len(stripped) > 3 and not any(char.isdigit() for char in stripped):
+                data['merchant'] = stripped
+                continue
+        
+        # Tax lines come first so "TOTAL TAX 1.20" is not taken for the total
+        if ('TAX' in upper or 'VAT' in upper or 'GST' in upper or 'HST' in upper) and (
+            _TAX_RE.search(upper) and not _TAX_INCLUDED_RE.search(upper)
+        ):
+            if data['tax'] is None:
+                amounts = _AMOUNT_RE.findall(upper)
+                if amounts:
+                    data['tax'] = _parse_amount(amounts[-1])
+        elif 'TOTAL' in upper or 'DUE' in upper or 'PAID' in upper:
+            score = _score_total_line(upper)
+            if score and score >= best_score:
+                amounts = _AMOUNT_RE.findall(upper)
+                if amounts:
+                    value = max(_parse_amount(amount) for amount in amounts)
+                    if score > best_score or value > data['amount']:
+                        best_score = score
+                        total_line = upper
+                        data['amount'] = value
     
-    # Extract merchant name (usually at the top of the receipt)
-    lines = text.split('\n')
-    for line in lines[:5]:
-        if len(line.strip()) > 3 and not any(char.isdigit() for char in line):
-            data['merchant'] = line.strip()
+    symbol = None
+    if total_line is not None:
+        symbol_match = _SYMBOL_RE.search(total_line)
+        symbol = symbol_match.group() if symbol_match else None
+    else:
+        for pre, pre_num, post_num, post in _SYMBOL_AMOUNT_RE.findall(text):
+            value = _parse_amount(pre_num or post_num)
+            if data['amount'] is None or value > data['amount']:
+                data['amount'] = value
+                symbol = pre or post
+    
+    code_match = _CURRENCY_CODE_RE.search(text)
+    if code_match:
+        data['currency'] = code_match.group()
+    elif symbol:
+        data['currency'] = _CURRENCY_SYMBOLS[symbol]
+    
+    date_match = _DATE_RE.search(text)
+    while date_match:
+        groups = date_match.groups()
+        try:
+            if groups[0]:
+                data['date'] = date(int(groups[3]), int(groups[2]), int(groups[0]))
+            else:
+                data['date'] = date(int(groups[4]), int(groups[5]), int(groups[6]))
             break
+        except ValueError:
+            date_match = _DATE_RE.search(text, date_match.end())
     
-    return data
\ No newline at end of file
+    return data
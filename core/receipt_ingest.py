@@ -0,0 +1,192 @@
+import hashlib
+import os
+import zipfile
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+RECEIPT_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp'}
+COPY_CHUNK_SIZE = 64 * 1024
+NO_TEXT_ERROR = 'No text could be read from the receipt'
+
+
+class ReceiptTooLarge(Exception):
+    pass
+
+
+def _iter_receipt_sources(uploads):
+    """Yield (name, opener) pairs for every receipt in the uploads, one at a time.
+
+    ZIP archives are expanded lazily so only the member being copied is open;
+    Django has already spooled large uploads to a temporary file.
+    """
+    for upload in uploads:
+        if zipfile.is_zipfile(upload):
+            upload.seek(0)
+            with zipfile.ZipFile(upload) as archive:
+                for info in archive.infolist():
+                    if info.is_dir():
+                        continue
+                    yield info.filename, (lambda info=info: archive.open(info))
+        else:
+            upload.seek(0)
+            yield upload.name, (lambda upload=upload: upload)
+
+
+def _copy_limited(source, destination, max_bytes, digest):
+    """Copy in fixed-size chunks, hashing as we go and refusing to write more than max_bytes"""
+    copied = 0
+    while True:
+        chunk = source.read(COPY_CHUNK_SIZE)
+        if not chunk:
+            return copied
+        copied += len(chunk)
+        if copied > max_bytes:
+            raise ReceiptTooLarge(f"larger than {max_bytes} bytes")
+        digest.update(chunk)
+        destination.write(chunk)
+
+
+def _store_receipt(filename, source):
+    """Stream one receipt into media storage; returns (storage name, content hash)"""
+    from .models import OCRJob
+
+    name = default_storage.get_available_name(
+        OCRJob._meta.get_field('image').generate_filename(None, os.path.basename(filename))
+    )
+    path = default_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'wb') as destination:
+            _copy_limited(source, destination, settings.OCR_MAX_RECEIPT_BYTES, digest)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return name, digest.hexdigest()
+
+
+def ingest_receipts(user, uploads):
+    """Unpack uploaded images/ZIP archives into a batch of queued OCR jobs.
+
+    Members are written to disk one at a time, so memory use is bounded by
+    the copy chunk size no matter how big the archive is. Only the first
+    OCR_MAX_SKIPPED_LISTED skipped files are listed; skipped_count has them all.
+    """
+    from .models import OCRJob, ReceiptBatch
+    from .ocr_queue import enqueue_ocr_job
+
+    batch = ReceiptBatch.objects.create(user=user)
+    skipped = []
+    skipped_count = 0
+    jobs = []
+
+    def skip(filename, reason):
+        nonlocal skipped_count
+        skipped_count += 1
+        if len(skipped) < settings.OCR_MAX_SKIPPED_LISTED:
+            skipped.append({'name': filename, 'reason': reason})
+
+    for filename, open_source in _iter_receipt_sources(uploads):
+        if os.path.splitext(filename)[1].lower() not in RECEIPT_EXTENSIONS:
+            skip(filename, 'not an image')
+            continue
+        if len(jobs) >= settings.OCR_MAX_BATCH_FILES:
+            skip(filename, 'batch file limit reached')
+            continue
+
+        try:
+            with open_source() as source:
+                name, content_hash = _store_receipt(filename, source)
+        except Exception as e:
+            skip(filename, str(e))
+            continue
+
+        jobs.append(OCRJob.objects.create(
+            user=user,
+            batch=batch,
+            image=name,
+            filename=filename,
+            content_hash=content_hash
+        ))
+
+    batch.total_files = len(jobs)
+    batch.skipped = skipped
+    batch.skipped_count = skipped_count
+    batch.save(update_fields=['total_files', 'skipped', 'skipped_count'])
+
+    for job in jobs:
+        transaction.on_commit(lambda job=job: enqueue_ocr_job(job))
+
+    return batch
+
+
+def create_draft_expense(job):
+    """Turn a finished batch OCR job into a draft expense for its uploader.
+
+    Receipts where OCR read no text fail the job instead: a draft would
+    only be an empty $0.00 expense.
+    """
+    from .models import Expense, OCRJob
+    from .utils import get_user_company
+
+    if not job.text.strip():
+        OCRJob.objects.filter(id=job.id).update(status='failed', error=NO_TEXT_ERROR, updated_at=timezone.now())
+        return None
+
+    user = job.user
+    company = get_user_company(user)
+    if company is None:
+        return None
+
+    data = job.result or {}
+    try:
+        amount = Decimal(str(data['amount'])) if data.get('amount') is not None else Decimal('0')
+    except InvalidOperation:
+        amount = Decimal('0')
+
+    expense = Expense.objects.create(
+        company=company,
+        employee=user,
+        title=(data.get('merchant') or os.path.basename(job.filename) or 'Receipt')[:200],
+        description=data.get('description') or '',
+        merchant=(data.get('merchant') or '')[:200],
+        amount=amount,
+        currency=data.get('currency') or company.currency,
+        date=parse_date(data['date']) if data.get('date') else timezone.localdate(),
+        status='draft',
+        receipt=job.image.name
+    )
+    job.expense = expense
+    job.save(update_fields=['expense'])
+    return expense
+
+
+def get_batch_progress(batch):
+    """Summarise per-file OCR progress for a receipt batch"""
+    counts = {status: 0 for status, _ in batch.jobs.model.STATUS_CHOICES}
+    files = []
+    for job in batch.jobs.order_by('id').values('id', 'filename', 'status', 'expense_id', 'error'):
+        counts[job['status']] += 1
+        files.append({
+            'jobId': job['id'],
+            'name': job['filename'],
+            'status': job['status'],
+            'expenseId': job['expense_id'],
+            'error': job['error'] or None
+        })
+
+    return {
+        'id': batch.id,
+        'total': batch.total_files,
+        'completed': counts['done'] + counts['failed'],
+        'counts': counts,
+        'files': files,
+        'skipped': batch.skipped,
+        'skippedCount': batch.skipped_count
+    }
@@ -0,0 +1,220 @@
+import csv
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.utils import timezone
+
+REPORT_COLUMNS = (
+    'ID', 'Date', 'Employee', 'Email', 'Title', 'Merchant', 'Category', 'Status', 'Amount', 'Currency', 'Converted'
+)
+
+# PDF layout: landscape A4 in a monospaced font, so each row is one fixed-width text line
+PDF_FONT = 'Courier'
+PDF_FONT_SIZE = 8
+PDF_LINE_HEIGHT = 11
+PDF_MARGIN = 36
+PDF_COLUMNS = (('Date', 10, '<'), ('Employee', 26, '<'), ('Title', 44, '<'), ('Category', 10, '<'),
+               ('Status', 11, '<'), ('Amount', 14, '>'), ('Cur', 3, '<'))
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class ReportTooLarge(Exception):
+    pass
+
+
+def get_executor():
+    """Return the shared report thread pool, creating it on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(settings.REPORT_WORKERS, 1), thread_name_prefix='report')
+        return _executor
+
+
+def report_queryset(job):
+    """The expenses a report covers: what its requester may see, narrowed by the stored filters"""
+    from .utils import filter_expenses, visible_expenses
+
+    return filter_expenses(visible_expenses(job.user, job.company), job.filters).order_by('date', 'id')
+
+
+def report_rows(expenses):
+    """Yield report rows from the database in REPORT_CHUNK_SIZE chunks (a server-side cursor on PostgreSQL)"""
+    values = expenses.values_list(
+        'id', 'date', 'employee__first_name', 'employee__last_name', 'employee__email',
+        'title', 'merchant', 'category', 'status', 'amount', 'currency', 'converted_amount'
+    ).iterator(chunk_size=settings.REPORT_CHUNK_SIZE)
+    for expense_id, date, first, last, email, *rest in values:
+        yield (expense_id, date, f"{first} {last}".strip() or email, email, *rest)
+
+
+def _counted(rows, totals, progress):
+    """Pass rows through while adding up amounts per currency and reporting progress every chunk"""
+    count = 0
+    for row in rows:
+        count += 1
+        totals[row[9]] = totals.get(row[9], Decimal('0')) + row[8]
+        if progress and count % settings.REPORT_CHUNK_SIZE == 0:
+            progress(count)
+        yield row
+
+
+def write_csv(rows, path, progress=None):
+    """Write rows to a CSV file as they arrive; returns (row count, totals per currency)"""
+    totals = {}
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(REPORT_COLUMNS)
+        for count, row in enumerate(_counted(rows, totals, progress), start=1):
+            writer.writerow(row)
+    return count, totals
+
+
+def _clip(value, limit):
+    value = '' if value is None else str(value)
+    return value if len(value) <= limit else value[:limit - 1] + '~'
+
+
+def _pdf_line(cells):
+    return ' '.join(f"{_clip(value, width):{align}{width}}" for (_, width, align), value in zip(PDF_COLUMNS, cells))
+
+
+def write_pdf(rows, path, title='Expense report', progress=None):
+    """Draw rows onto PDF pages as they arrive; returns (row count, totals per currency).
+
+    Each page is a single text object with one fixed-width line per row,
+    drawn on the low-level canvas rather than through platypus so rows are
+    never collected into a story. reportlab still keeps the finished,
+    compressed page streams until the file is saved, which is why PDFs are
+    capped at REPORT_PDF_MAX_ROWS.
+    """
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.pdfgen import canvas
+
+    width, height = landscape(A4)
+    pdf = canvas.Canvas(path, pagesize=(width, height), pageCompression=1)
+    pdf.setTitle(title)
+    generated = timezone.now().strftime('%Y-%m-%d %H:%M UTC')
+    lines_per_page = int((height - 2 * PDF_MARGIN) // PDF_LINE_HEIGHT) - 3
+    header = _pdf_line(name for name, _, _ in PDF_COLUMNS)
+    page = 0
+
+    def new_page():
+        nonlocal page
+        page += 1
+        pdf.setFont('Helvetica-Bold', 12)
+        pdf.drawString(PDF_MARGIN, height - PDF_MARGIN, title)
+        pdf.setFont('Helvetica', PDF_FONT_SIZE)
+        pdf.drawRightString(width - PDF_MARGIN, height - PDF_MARGIN, f"Generated {generated} - page {page}")
+        text = pdf.beginText(PDF_MARGIN, height - PDF_MARGIN - 2 * PDF_LINE_HEIGHT)
+        text.setFont(PDF_FONT, PDF_FONT_SIZE, PDF_LINE_HEIGHT)
+        text.textLine(header)
+        text.textLine('-' * len(header))
+        return text
+
+    def finish_page(text):
+        pdf.drawText(text)
+        pdf.showPage()
+
+    totals = {}
+    count = 0
+    text, used = new_page(), 0
+    for count, row in enumerate(_counted(rows, totals, progress), start=1):
+        if used == lines_per_page:
+            finish_page(text)
+            text, used = new_page(), 0
+        text.textLine(_pdf_line((row[1], row[2], row[4], row[6], row[7], f"{row[8]:,.2f}", row[9])))
+        used += 1
+
+    if used + len(totals) + 2 > lines_per_page:
+        finish_page(text)
+        text = new_page()
+    text.textLine('')
+    text.textLine(f"{count} expense(s)")
+    for currency, total in sorted(totals.items()):
+        text.textLine(_pdf_line(('', 'Total', '', '', '', f"{total:,.2f}", currency)))
+    finish_page(text)
+    pdf.save()
+    return count, totals
+
+
+WRITERS = {
+    'csv': write_csv,
+    'pdf': write_pdf,
+}
+
+
+def claim_report_job(job_id):
+    """Atomically move a pending report to processing; False if someone else took it"""
+    from .models import ReportJob
+
+    return ReportJob.objects.filter(id=job_id, status='pending').update(
+        status='processing',
+        updated_at=timezone.now()
+    ) == 1
+
+
+def generate_report(job):
+    """Build a claimed report job's file on disk and record the outcome on the job"""
+    from .models import ReportJob
+
+    def progress(rows):
+        ReportJob.objects.filter(id=job.id).update(rows=rows, updated_at=timezone.now())
+
+    name = job.file.field.generate_filename(job, f"expenses-{job.id}.{job.format}")
+    path = default_storage.path(name)
+    partial = f"{path}.part"
+    try:
+        expenses = report_queryset(job)
+        if job.format == 'pdf' and expenses.count() > settings.REPORT_PDF_MAX_ROWS:
+            raise ReportTooLarge(
+                f"PDF reports are limited to {settings.REPORT_PDF_MAX_ROWS} expenses; use CSV or narrow the filters"
+            )
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if job.format == 'pdf':
+            rows, _ = write_pdf(report_rows(expenses), partial, title=f"{job.company.name} expenses", progress=progress)
+        else:
+            rows, _ = write_csv(report_rows(expenses), partial, progress=progress)
+        os.replace(partial, path)
+    except Exception as e:
+        logger.exception("Report job %s failed", job.id)
+        if os.path.exists(partial):
+            os.remove(partial)
+        ReportJob.objects.filter(id=job.id).update(status='failed', error=str(e), updated_at=timezone.now())
+        return
+
+    ReportJob.objects.filter(id=job.id).update(status='done', file=name, rows=rows, updated_at=timezone.now())
+
+
+def _run_in_worker(job):
+    try:
+        generate_report(job)
+    finally:
+        # Worker threads get their own connection
+        connection.close()
+
+
+def enqueue_report_job(job):
+    """Hand a pending report to the worker pool and return without waiting for it.
+
+    With REPORT_WORKERS = 0 the report is built inline instead, which is
+    handy for development machines and tests.
+    """
+    if not claim_report_job(job.id):
+        return None
+
+    if settings.REPORT_WORKERS <= 0:
+        generate_report(job)
+        return None
+    return get_executor().submit(_run_in_worker, job)
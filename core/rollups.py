@@ -0,0 +1,158 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+# Only approved expenses count as spend
+ROLLUP_STATUSES = ('approved',)
+# Saves that touch none of these cannot move an expense between rollup rows
+ROLLUP_FIELDS = {'company', 'employee', 'category', 'date', 'status', 'amount', 'converted_amount'}
+# Rows per INSERT ... ON CONFLICT statement, well under SQLite's bound-parameter limit
+UPSERT_BATCH_SIZE = 500
+
+
+def rollup_entry(company_id, employee_id, category, day, status, amount, converted_amount):
+    """The (rollup key, amount) an expense in this state contributes, or None.
+
+    Rollups are in the company currency, so expenses not yet converted to
+    it (no rate for their currency) stay out until they are.
+    """
+    if status not in ROLLUP_STATUSES or company_id is None or converted_amount is None:
+        return None
+    return (company_id, day, category, employee_id), Decimal(converted_amount)
+
+
+def expense_rollup_entry(expense):
+    return rollup_entry(
+        expense.company_id, expense.employee_id, expense.category, expense.date,
+        expense.status, expense.amount, expense.converted_amount
+    )
+
+
+def rollup_deltas(removed=(), added=()):
+    """Collapse rollup entries leaving and entering the rollups into {key: [total delta, count delta]}"""
+    deltas = defaultdict(lambda: [Decimal('0'), 0])
+    for entries, sign in ((removed, -1), (added, 1)):
+        for entry in entries:
+            if entry is None:
+                continue
+            key, value = entry
+            deltas[key][0] += sign * value
+            deltas[key][1] += sign
+    return {key: delta for key, delta in deltas.items() if delta[1] or delta[0]}
+
+
+def _upsert_rollups(deltas, now):
+    """Create-or-increment rollup rows with one INSERT ... ON CONFLICT DO UPDATE per UPSERT_BATCH_SIZE keys"""
+    from .models import ExpenseRollup
+
+    quote = connection.ops.quote_name
+    fields = [
+        ExpenseRollup._meta.get_field(name)
+        for name in ('company', 'day', 'category', 'employee', 'total', 'count', 'updated_at')
+    ]
+    table = quote(ExpenseRollup._meta.db_table)
+    columns = [quote(field.column) for field in fields]
+    key, (total, count, updated_at) = columns[:4], columns[4:]
+    rows = [(*key_values, *delta, now) for key_values, delta in deltas.items()]
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            placeholders = ', '.join(['(' + ', '.join(['%s'] * len(columns)) + ')'] * len(batch))
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES {placeholders} "
+                f"ON CONFLICT ({', '.join(key)}) DO UPDATE SET "
+                f"{total} = {table}.{total} + EXCLUDED.{total}, "
+                f"{count} = {table}.{count} + EXCLUDED.{count}, "
+                f"{updated_at} = EXCLUDED.{updated_at}",
+                [field.get_db_prep_save(value, connection) for row in batch for field, value in zip(fields, row)]
+            )
+
+
+def apply_rollup_deltas(deltas):
+    """Add deltas to the rollup rows, creating rows for newly approved expenses.
+
+    Deltas that add expenses go in with a single upsert statement however
+    many keys they touch, so the bulk workflow paths keep a constant query
+    count. Deltas that only move or remove spend (edits, un-approvals,
+    deletes, one expense at a time from the signals) are F-expression
+    UPDATEs of rows that already exist; nothing is taken from a row that
+    is gone, e.g. deleted along with its company. Runs inside the caller's
+    transaction, so the rollups commit or roll back together with the
+    expenses they describe.
+    """
+    from .models import ExpenseRollup
+
+    now = timezone.now()
+    additions = {key: delta for key, delta in deltas.items() if delta[1] > 0}
+    if additions:
+        _upsert_rollups(additions, now)
+    for (company_id, day, category, employee_id), (total, count) in deltas.items():
+        if count <= 0:
+            ExpenseRollup.objects.filter(
+                company_id=company_id, day=day, category=category, employee_id=employee_id
+            ).update(total=F('total') + total, count=F('count') + count, updated_at=now)
+
+
+def add_expenses_to_rollups(expenses):
+    """Roll up expenses that just reached an approved state through a bulk path that skips the signals"""
+    apply_rollup_deltas(rollup_deltas(added=[expense_rollup_entry(expense) for expense in expenses]))
+
+
+def compute_rollups(company_ids=None):
+    """Sum approved expenses per (company, day, category, employee) from scratch"""
+    from .models import Expense
+
+    expenses = Expense.objects.filter(status__in=ROLLUP_STATUSES, converted_amount__isnull=False)
+    if company_ids is not None:
+        expenses = expenses.filter(company_id__in=company_ids)
+    rows = expenses.values('company_id', 'date', 'category', 'employee_id').annotate(
+        total=Sum('converted_amount'),
+        count=Count('id')
+    ).order_by()
+    return {
+        (row['company_id'], row['date'], row['category'], row['employee_id']): (row['total'], row['count'])
+        for row in rows
+    }
+
+
+def rebuild_rollups(company_ids=None, fix=True):
+    """Compare the rollups with a fresh aggregation, optionally rewriting them.
+
+    Returns a list of (key, stored, actual) mismatches where key is
+    (company_id, day, category, employee_id) and stored/actual are
+    (total, count) pairs, None when the row is missing.
+    """
+    from .models import ExpenseRollup
+
+    with transaction.atomic():
+        actual = compute_rollups(company_ids)
+        rows = ExpenseRollup.objects.select_for_update()
+        if company_ids is not None:
+            rows = rows.filter(company_id__in=company_ids)
+        # Rows emptied by un-approvals stay behind with zeros; they are not drift
+        stored = {
+            (row.company_id, row.day, row.category, row.employee_id): (row.total, row.count)
+            for row in rows
+            if row.count or row.total
+        }
+
+        mismatches = [
+            (key, stored.get(key), actual.get(key))
+            for key in sorted(set(stored) | set(actual), key=str)
+            if stored.get(key) != actual.get(key)
+        ]
+
+        if fix and mismatches:
+            rows.delete()
+            ExpenseRollup.objects.bulk_create([
+                ExpenseRollup(
+                    company_id=company_id, day=day, category=category, employee_id=employee_id, total=total, count=count
+                )
+                for (company_id, day, category, employee_id), (total, count) in actual.items()
+            ], batch_size=1000)
+
+    return mismatches
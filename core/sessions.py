@@ -0,0 +1,60 @@
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.core.cache import cache
+
+PERSISTED_AT_KEY = '_session_persisted_at'
+WRITES_KEY = 'session_writes:written'
+WRITES_SAVED_KEY = 'session_writes:saved'
+
+
+def _count(key):
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def get_session_write_stats():
+    """Session saves that hit the database vs. refreshes that were skipped, since the cache was last cleared.
+
+    Counted in the cache, so the figures cover every worker only when the cache is shared.
+    """
+    written = cache.get(WRITES_KEY, 0)
+    saved = cache.get(WRITES_SAVED_KEY, 0)
+    return {
+        'written': written,
+        'saved': saved,
+        'savedRatio': round(saved / (written + saved), 4) if written + saved else 0.0
+    }
+
+
+class SessionStore(CachedDBStore):
+    """Cached, database-backed sessions that coalesce expiry-refresh writes.
+
+    With SESSION_SAVE_EVERY_REQUEST every request saves the session just to
+    push its expiry forward. This store skips that write while the session
+    is unmodified and was persisted less than SESSION_REFRESH_FRACTION of
+    its age ago, so the stored expiry trails the cookie by at most that
+    fraction. Reads come from the cache and fall back to the database, as
+    with cached_db, so this needs a cache shared by every worker. Enable it
+    with SESSION_ENGINE = 'core.sessions'.
+    """
+
+    def _persisted_recently(self):
+        persisted_at = self._session.get(PERSISTED_AT_KEY)
+        if persisted_at is None:
+            return False
+        return time.time() - persisted_at < settings.SESSION_REFRESH_FRACTION * self.get_expiry_age()
+
+    def save(self, must_create=False):
+        if not must_create and not self.modified and self.session_key and self._persisted_recently():
+            _count(WRITES_SAVED_KEY)
+            return
+
+        # Set on the underlying dict so the stamp alone does not mark the session modified
+        self._get_session(no_load=must_create)[PERSISTED_AT_KEY] = time.time()
+        super().save(must_create)
+        _count(WRITES_KEY)
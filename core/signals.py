@@ -0,0 +1,197 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .approvals import (
+    adjust_pending_count, invalidate_pending_count, invalidate_routing_table, invalidate_rule_index
+)
+from .counters import adjust_counters, count_admin_change, count_user_change
+from .exchange_rates import convert_expenses
+from .hierarchy import check_manager, detach_reports, link_new_users, move_subtree
+from .models import ApprovalRule, ApprovalStep, Company, CompanyCounters, Expense, ExpenseApproval, User, UserTombstone
+from .rollups import ROLLUP_FIELDS, apply_rollup_deltas, expense_rollup_entry, rollup_deltas, rollup_entry
+from .utils import bump_company_version, touch_users
+
+
+@receiver([post_save, post_delete], sender=ApprovalRule)
+def approval_rule_changed(sender, instance, **kwargs):
+    invalidate_rule_index(instance.company_id)
+
+
+@receiver([post_save, post_delete], sender=ApprovalStep)
+def approval_step_changed(sender, instance, **kwargs):
+    company_id = ApprovalRule.objects.filter(id=instance.rule_id).values_list('company_id', flat=True).first()
+    if company_id is not None:
+        invalidate_rule_index(company_id)
+
+
+@receiver(pre_save, sender=Company)
+def company_saving(sender, instance, update_fields=None, **kwargs):
+    # Remember the admin so post_save can count a change
+    if instance._state.adding:
+        instance._previous_admin_id = None
+    elif update_fields is not None and 'admin' not in update_fields:
+        instance._previous_admin_id = instance.admin_id
+    else:
+        instance._previous_admin_id = Company.objects.filter(pk=instance.pk).values_list('admin_id', flat=True).first()
+
+
+@receiver(post_save, sender=Company)
+def company_saved(sender, instance, created, **kwargs):
+    if created:
+        CompanyCounters.objects.get_or_create(company=instance)
+    count_admin_change(instance.id, getattr(instance, '_previous_admin_id', None), instance.admin_id)
+    if not created:
+        bump_company_version(instance.id)
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, update_fields=None, **kwargs):
+    # Remember the counted (company, role) and the manager so post_save can diff them
+    if instance._state.adding:
+        instance._counted_state, instance._previous_manager_id = None, None
+    elif update_fields is not None and not {'role', 'company', 'manager'} & set(update_fields):
+        instance._counted_state = (instance.company_id, instance.role)
+        instance._previous_manager_id = instance.manager_id
+    else:
+        previous = User.objects.filter(pk=instance.pk).values_list('company_id', 'role', 'manager_id').first()
+        instance._counted_state = previous[:2] if previous else None
+        instance._previous_manager_id = previous[2] if previous else None
+    
+    # Refuse reporting loops before anything is written
+    if instance._previous_manager_id != instance.manager_id:
+        check_manager(instance.pk, instance.manager_id)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    old = getattr(instance, '_counted_state', None)
+    new = (instance.company_id, instance.role)
+    if old != new:
+        owned = () if created else list(Company.objects.filter(admin=instance).values_list('id', flat=True))
+        count_user_change(old, new, owned)
+    
+    # Delta syncs of the company a user left must drop them; one they rejoin lists them again
+    if old is not None and old[0] != instance.company_id:
+        if old[0] is not None:
+            UserTombstone.objects.create(company_id=old[0], user_id=instance.pk)
+        if instance.company_id is not None:
+            UserTombstone.objects.filter(company_id=instance.company_id, user_id=instance.pk).delete()
+    
+    previous_manager_id = getattr(instance, '_previous_manager_id', None)
+    if created:
+        link_new_users([instance])
+    elif previous_manager_id != instance.manager_id:
+        move_subtree(instance.pk, instance.manager_id)
+    
+    # Team sizes are part of the managers' rows, so delta syncs must see them change
+    if previous_manager_id != instance.manager_id:
+        touch_users({previous_manager_id, instance.manager_id} - {None})
+    
+    # Logging in only touches last_login, which affects neither routing nor the users API
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    for company_id in {old[0] if old else None, instance.company_id} - {None}:
+        invalidate_routing_table(company_id)
+        bump_company_version(company_id)
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    # Subordinates lose their manager through SET_NULL, which bypasses save() and auto_now
+    instance.subordinates.update(updated_at=timezone.now())
+    detach_reports(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    count_user_change((instance.company_id, instance.role), None)
+    if instance.manager_id is not None:
+        touch_users([instance.manager_id])
+    if instance.company_id is not None:
+        # count_user_change already bumped the company version
+        invalidate_routing_table(instance.company_id)
+
+
+@receiver(pre_save, sender=Expense)
+def expense_saving(sender, instance, update_fields=None, **kwargs):
+    # Remember what the stored row contributed to the spend rollups so post_save can diff it
+    if instance._state.adding:
+        previous = None
+    elif update_fields is not None and not ROLLUP_FIELDS & set(update_fields):
+        instance._rollup_entry = expense_rollup_entry(instance)
+        return
+    else:
+        previous = Expense.objects.filter(pk=instance.pk).values_list(
+            'company_id', 'employee_id', 'category', 'date', 'status', 'amount', 'converted_amount', 'currency'
+        ).first()
+    instance._rollup_entry = rollup_entry(*previous[:7]) if previous else None
+
+    # Keep the company-currency amount in step with the amount, currency and company, unless the caller set it
+    if update_fields is not None and 'converted_amount' not in update_fields:
+        return
+    if instance.converted_amount is None:
+        stale = True
+    elif previous is None:
+        stale = False
+    else:
+        company_id, amount, converted_amount, currency = previous[0], previous[5], previous[6], previous[7]
+        stale = instance.converted_amount == converted_amount and (
+            (instance.company_id, instance.amount, instance.currency) != (company_id, amount, currency)
+        )
+    if stale:
+        convert_expenses([instance])
+
+
+@receiver(post_save, sender=Expense)
+def expense_saved(sender, instance, **kwargs):
+    apply_rollup_deltas(rollup_deltas(
+        removed=[getattr(instance, '_rollup_entry', None)],
+        added=[expense_rollup_entry(instance)]
+    ))
+
+
+@receiver(post_delete, sender=Expense)
+def expense_deleted(sender, instance, **kwargs):
+    apply_rollup_deltas(rollup_deltas(removed=[expense_rollup_entry(instance)]))
+
+
+def _approval_company_id(approval):
+    if ExpenseApproval.expense.is_cached(approval):
+        return approval.expense.company_id
+    return Expense.objects.filter(id=approval.expense_id).values_list('company_id', flat=True).first()
+
+
+@receiver(pre_save, sender=ExpenseApproval)
+def expense_approval_saving(sender, instance, update_fields=None, **kwargs):
+    if instance._state.adding:
+        instance._previous_status, instance._previous_approver_id = None, None
+    elif update_fields is not None and not {'status', 'approver', 'approver_id'} & set(update_fields):
+        instance._previous_status, instance._previous_approver_id = instance.status, instance.approver_id
+    else:
+        instance._previous_status, instance._previous_approver_id = (
+            ExpenseApproval.objects.filter(pk=instance.pk).values_list('status', 'approver_id').first()
+            or (None, None)
+        )
+
+
+@receiver(post_save, sender=ExpenseApproval)
+def expense_approval_saved(sender, instance, created, **kwargs):
+    if created and instance.status == 'pending':
+        adjust_pending_count(instance.approver_id, 1)
+    else:
+        invalidate_pending_count(instance.approver_id)
+        previous_approver_id = getattr(instance, '_previous_approver_id', None)
+        if previous_approver_id and previous_approver_id != instance.approver_id:
+            invalidate_pending_count(previous_approver_id)
+
+    delta = int(instance.status == 'pending') - int(getattr(instance, '_previous_status', None) == 'pending')
+    if delta:
+        adjust_counters(_approval_company_id(instance), pending_approvals=delta)
+
+
+@receiver(post_delete, sender=ExpenseApproval)
+def expense_approval_deleted(sender, instance, **kwargs):
+    invalidate_pending_count(instance.approver_id)
+    if instance.status == 'pending':
+        adjust_counters(_approval_company_id(instance), pending_approvals=-1)
@@ -0,0 +1,23 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+from .metrics import get_query_budget
+
+
+class QueryBudgetMixin:
+    """TestCase mixin for holding endpoints to their QUERY_BUDGETS entry"""
+
+    def assertWithinQueryBudget(self, url, method='get', budget=None, **kwargs):
+        """Request url with self.client and fail if the view ran more queries than its budget"""
+        view_name = resolve(url.split('?')[0]).view_name
+        if budget is None:
+            budget = get_query_budget(view_name)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, **kwargs)
+
+        if len(queries) > budget:
+            listing = '\n'.join(f"{number}. {query['sql']}" for number, query in enumerate(queries, start=1))
+            self.fail(f"{view_name} ran {len(queries)} queries, budget is {budget}:\n{listing}")
+        return response
@@ -1,3 +1,1756 @@
-from django.test import TestCase
+import io
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import time
+import zipfile
+from concurrent.futures import Future
+from decimal import Decimal
+from io import StringIO
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+import cv2
+import numpy as np
+from PIL import Image
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, is_password_usable
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import approvals
+from .approvals import get_pending_counts, get_rule_index, route_approver
+from .benchmarks import BenchmarkContext, compare_results, route_names, run_benchmarks, seed_benchmark_data
+from .counters import rebuild_counters
+from .exchange_rates import (
+    FileRateProvider, convert_amounts, convert_queryset_totals, convert_stored_expenses, get_exchange_rate,
+    refresh_rate_table
+)
+from .hierarchy import HierarchyCycleError, ancestors, descendants, get_depth, link_new_users
+from .models import (
+    User, Company, CompanyCounters, Expense, ExpenseRollup, ApprovalRule, ApprovalStep, ExpenseApproval, ExchangeRateTable,
+    OCRJob, OCRResultCache, UserHierarchy, UserTombstone
+)
+from .metrics import reset_metrics
+from .ocr_cache import get_cached_result, hash_file, hash_upload, store_cached_result
+from .ocr_queue import enqueue_ocr_job
+from .receipt_ingest import NO_TEXT_ERROR
+from .ocr_service import (
+    crop, downscale, extract_text_from_image, get_pipeline_version, get_preprocess_stages, parse_receipt_data
+)
+from .rollups import rebuild_rollups
+from .sessions import get_session_write_stats
+from .testing import QueryBudgetMixin
+from .user_import import hash_passwords, import_users
+from .utils import (
+    bump_company_version, convert_currency, get_company_version, get_user_stats, process_approval_workflow_batch
+)
+
+
+def receipt_image(name='receipt.png', color='white'):
+    content = io.BytesIO()
+    Image.new('RGB', (40, 60), color).save(content, 'PNG')
+    return SimpleUploadedFile(name, content.getvalue(), content_type='image/png')
+
+
+class InlineExecutor:
+    """Stands in for the OCR process pool, running each job on submit"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class OCRTestCase(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_override = override_settings(MEDIA_ROOT=media.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.company = Company.objects.create(name='Acme')
+        self.employee = User.objects.create_user(
+            username='employee', email='employee@example.com', password='x', company=self.company
+        )
+
+    def ocr_result(self, text='COFFEE HOUSE\nTOTAL 4.50', amount=4.5):
+        return {'text': text, 'data': {'amount': amount, 'date': None, 'merchant': 'COFFEE HOUSE'}, 'timings': {}}
+
+    def job(self, color='white', **fields):
+        return OCRJob.objects.create(user=self.employee, image=receipt_image(color=color), **fields)
+
+
+@override_settings(OCR_WORKERS=0)
+class OCRQueueTests(OCRTestCase):
+    def test_inline_jobs_finish_done_or_failed(self):
+        with mock.patch('core.ocr_queue.run_ocr', return_value=self.ocr_result()):
+            enqueue_ocr_job(self.job())
+        with mock.patch('core.ocr_queue.run_ocr', side_effect=ValueError('Could not read image')):
+            enqueue_ocr_job(self.job(color='black'))
+
+        done, failed = OCRJob.objects.order_by('id')
+        self.assertEqual((done.status, done.text, done.result['amount']), ('done', 'COFFEE HOUSE\nTOTAL 4.50', 4.5))
+        self.assertEqual(len(done.content_hash), 64)
+        self.assertEqual((failed.status, failed.error), ('failed', 'Could not read image'))
+
+    @override_settings(OCR_WORKERS=2)
+    def test_pool_results_are_recorded_and_failures_logged(self):
+        with mock.patch('core.ocr_queue.get_executor', return_value=InlineExecutor()), \
+                mock.patch('core.ocr_queue.connection'):
+            with mock.patch('core.ocr_queue.run_ocr', return_value=self.ocr_result()):
+                enqueue_ocr_job(self.job())
+            with mock.patch('core.ocr_queue.run_ocr', side_effect=RuntimeError('tesseract crashed')), \
+                    self.assertLogs('core.ocr_queue', 'ERROR') as logs:
+                failing = self.job(color='black')
+                enqueue_ocr_job(failing)
+
+        self.assertEqual(list(OCRJob.objects.order_by('id').values_list('status', flat=True)), ['done', 'failed'])
+        self.assertIn(f'OCR job {failing.id} failed', logs.output[0])
+        self.assertIn('tesseract crashed', logs.output[0])
+
+    def test_claimed_jobs_are_not_run_twice(self):
+        job = self.job(status='processing')
+        with mock.patch('core.ocr_queue.run_ocr') as run_ocr:
+            self.assertIsNone(enqueue_ocr_job(job))
+        run_ocr.assert_not_called()
+        self.assertEqual(OCRJob.objects.get().status, 'processing')
+
+    def test_stale_jobs_are_requeued_and_retried(self):
+        stuck, recent = self.job(status='processing'), self.job(status='processing')
+        OCRJob.objects.filter(id=stuck.id).update(updated_at=timezone.now() - timedelta(minutes=31))
+
+        stdout = StringIO()
+        command = 'core.management.commands.process_ocr_jobs'
+        with mock.patch(f'{command}.get_executor', return_value=InlineExecutor()), \
+                mock.patch(f'{command}.run_ocr', return_value=self.ocr_result()):
+            call_command('process_ocr_jobs', '--requeue-stale', '30', stdout=stdout)
+
+        self.assertIn('Requeued 1 stale job(s)', stdout.getvalue())
+        self.assertIn('Processed 1 job(s), 0 failed', stdout.getvalue())
+        self.assertEqual(OCRJob.objects.get(id=stuck.id).status, 'done')
+        self.assertEqual(OCRJob.objects.get(id=recent.id).status, 'processing')
+
+
+class OCRPipelineTests(OCRTestCase):
+    def write_image(self, img, name='receipt.png'):
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        cv2.imwrite(path, img)
+        return path
+
+    def photo(self):
+        """A white 1200x1800 receipt with some ink, lying on a dark 2000x2400 table"""
+        img = np.full((2400, 2000, 3), 40, dtype=np.uint8)
+        img[300:2100, 400:1600] = 255
+        img[500:520, 500:1400] = 0
+        return img
+
+    @override_settings(OCR_PREPROCESS_STAGES=['grayscale', 'blur'])
+    def test_stage_configuration_is_validated(self):
+        with self.assertRaisesMessage(ValueError, 'Unknown OCR preprocessing stage(s): blur'):
+            get_preprocess_stages()
+        with self.assertRaises(ValueError):
+            extract_text_from_image(self.write_image(self.photo()))
+
+    def test_pipeline_version_follows_the_configuration(self):
+        versions = set()
+        for stages, dpi in ((['grayscale', 'threshold'], 300), (['grayscale'], 300), (['grayscale'], 200)):
+            with self.settings(OCR_PREPROCESS_STAGES=stages, OCR_TARGET_DPI=dpi):
+                versions.add(get_pipeline_version())
+        self.assertEqual(len(versions), 3)
+
+    @override_settings(OCR_PREPROCESS_STAGES=['grayscale', 'crop', 'downscale', 'deskew', 'threshold'], OCR_TARGET_DPI=100)
+    def test_stages_run_in_order_and_are_timed(self):
+        timings = {}
+        with mock.patch('core.ocr_service.pytesseract.image_to_string', return_value='TOTAL 4.50') as tesseract:
+            self.assertEqual(extract_text_from_image(self.write_image(self.photo()), timings=timings), 'TOTAL 4.50')
+
+        self.assertEqual(list(timings), ['read', 'grayscale', 'crop', 'downscale', 'deskew', 'threshold', 'tesseract'])
+        image = tesseract.call_args[0][0]
+        self.assertEqual(image.mode, 'L')
+        # Cropped to the receipt, then scaled to 100 DPI over the receipt width
+        self.assertEqual(image.width, 315)
+        self.assertEqual(set(np.unique(np.asarray(image))), {0, 255})
+
+    @override_settings(OCR_TARGET_DPI=100)
+    def test_crop_and_downscale(self):
+        cropped = crop(self.photo())
+        self.assertLess(abs(cropped.shape[0] - 1800), 50)
+        self.assertLess(abs(cropped.shape[1] - 1200), 50)
+
+        small = np.zeros((100, 200), dtype=np.uint8)
+        self.assertIs(downscale(small), small)
+        self.assertEqual(downscale(cropped).shape[1], 315)
+
+    @override_settings(OCR_WORKERS=0)
+    def test_failures_reach_the_job(self):
+        job = OCRJob.objects.create(user=self.employee, image=SimpleUploadedFile('receipt.png', b'not an image'))
+        enqueue_ocr_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertTrue(job.error)
+
+        with mock.patch('core.ocr_service.pytesseract.image_to_string', side_effect=RuntimeError('tesseract is not installed')):
+            with self.assertRaisesMessage(RuntimeError, 'tesseract is not installed'):
+                extract_text_from_image(self.write_image(self.photo()))
+
+
+class ReceiptParserTests(TestCase):
+    CASES = [
+        # (receipt text, expected fields)
+        ('', {'amount': None, 'tax': None, 'date': None, 'merchant': None, 'currency': None}),
+        (
+            'BEST COFFEE SHOP\nDate: 14/03/2024\nLatte $4.50\nSubtotal $9.74\nSales Tax 8% $0.78\nTOTAL $10.52\n',
+            {'merchant': 'BEST COFFEE SHOP', 'amount': 10.52, 'tax': 0.78, 'date': date(2024, 3, 14), 'currency': 'USD'}
+        ),
+        ('Corner Shop\nSUBTOTAL 8.80\nTOTAL TAX 1.20\nTOTAL 10.00\n', {'amount': 10.0, 'tax': 1.2}),
+        ('Corner Shop\nTOTAL 10.00\nTOTAL TAX 1.20\n', {'amount': 10.0, 'tax': 1.2}),
+        ('Corner Shop\nVAT 20% 2.00\nTOTAL INCL. VAT 12.00\n', {'amount': 12.0, 'tax': 2.0}),
+        ('Corner Shop\nTOTAL 10.00\nGRAND TOTAL 12.50\nAMOUNT PAID 20.00\n', {'amount': 20.0}),
+        ('Corner Shop\nSubtotal 9.00\n', {'amount': 9.0}),
+        ('Corner Shop\nTaxes included\nBread 2.40 €\nWine 12.00 €\n', {'amount': 12.0, 'tax': None, 'currency': 'EUR'}),
+        ('GRAND HOTEL BERLIN\n2024-02-29\nCity tax 24,80 €\nGRAND TOTAL 1.300,30 EUR\n', {
+            'merchant': 'GRAND HOTEL BERLIN', 'amount': 1300.3, 'tax': 24.8, 'date': date(2024, 2, 29), 'currency': 'EUR'
+        }),
+        ('Taxi\nTrip 31-02-2023 then 28-11-2023\nAmount due 27.40\n', {'date': date(2023, 11, 28), 'amount': 27.4}),
+        ('12 Main St\nAcme Hardware\nTOTAL 5.00', {'merchant': 'Acme Hardware'}),
+        ('Kiosk\nTOTAL 5.00', {'merchant': 'Kiosk'}),
+        ('Bus\nTOTAL 5.00', {'merchant': None}),
+    ]
+
+    def test_receipts(self):
+        for text, expected in self.CASES:
+            with self.subTest(text=text):
+                data = parse_receipt_data(text)
+                self.assertEqual({field: data[field] for field in expected}, expected)
+                self.assertEqual(data['description'], text[:200])
+
+
+@override_settings(OCR_WORKERS=0, OCR_PREPROCESS_STAGES=['grayscale', 'threshold'])
+class OCRResultCacheTests(OCRTestCase):
+    def submit(self, upload, result=None):
+        self.client.force_login(self.employee)
+        with mock.patch('core.ocr_queue.run_ocr', return_value=result or self.ocr_result()) as run_ocr, \
+                self.captureOnCommitCallbacks(execute=True):
+            job_id = self.client.post(reverse('core:submit_ocr_job'), {'receipt': upload}).json()['jobId']
+        return OCRJob.objects.get(id=job_id), run_ocr.call_count
+
+    def test_identical_images_are_answered_from_the_cache(self):
+        first, runs = self.submit(receipt_image('monday.png'))
+        self.assertEqual((first.status, runs), ('done', 1))
+
+        # Same pixels under another name: no OCR run, same result
+        second, runs = self.submit(receipt_image('tuesday.png'))
+        self.assertEqual((second.status, second.text, second.result, runs), ('done', first.text, first.result, 0))
+        self.assertEqual(second.content_hash, first.content_hash)
+        self.assertEqual(OCRResultCache.objects.get().hits, 1)
+
+        _, runs = self.submit(receipt_image('monday.png', color='black'))
+        self.assertEqual(runs, 1)
+
+    def test_keys_derive_from_the_image_content(self):
+        upload = receipt_image()
+        content = upload.read()
+        upload.seek(0)
+        job = self.job()
+
+        self.assertEqual(hash_upload(upload), hashlib.sha256(content).hexdigest())
+        self.assertEqual(upload.read(), content)
+        self.assertEqual(hash_file(job.image.path), hashlib.sha256(content).hexdigest())
+        self.assertNotEqual(hash_upload(receipt_image(color='black')), hash_file(job.image.path))
+
+    def test_pipeline_changes_invalidate_cached_results(self):
+        store_cached_result('a' * 64, self.ocr_result())
+        self.assertEqual(get_cached_result('a' * 64)['text'], 'COFFEE HOUSE\nTOTAL 4.50')
+
+        with self.settings(OCR_PREPROCESS_STAGES=['grayscale', 'deskew', 'threshold']):
+            self.assertIsNone(get_cached_result('a' * 64))
+            _, runs = self.submit(receipt_image())
+            self.assertEqual(runs, 1)
+        self.assertEqual(OCRResultCache.objects.count(), 2)
+
+    def test_blank_results_are_not_cached_and_old_entries_are_evicted(self):
+        self.submit(receipt_image(), result=self.ocr_result(text=''))
+        self.assertFalse(OCRResultCache.objects.exists())
+
+        with self.settings(OCR_CACHE_MAX_ENTRIES=2):
+            for key in 'abc':
+                store_cached_result(key * 64, self.ocr_result())
+            get_cached_result('b' * 64)
+            store_cached_result('d' * 64, self.ocr_result())
+        self.assertEqual(sorted(OCRResultCache.objects.values_list('content_hash', flat=True)), ['b' * 64, 'd' * 64])
+
+
+@override_settings(OCR_WORKERS=0)
+class ReceiptBatchTests(OCRTestCase):
+    def fake_ocr(self, image_path, max_pixels=None):
+        if 'blank' in image_path:
+            return self.ocr_result(text='  \n')
+        if 'broken' in image_path:
+            raise ValueError('Could not read image')
+        if 'euro' in image_path:
+            result = self.ocr_result(text='CAFE\nTOTAL 4.50 EUR')
+            result['data']['currency'] = 'EUR'
+            return result
+        return self.ocr_result()
+
+    def upload(self, *uploads):
+        self.client.force_login(self.employee)
+        with mock.patch('core.ocr_queue.run_ocr', side_effect=self.fake_ocr), \
+                self.captureOnCommitCallbacks(execute=True):
+            result = self.client.post(reverse('core:submit_receipt_batch'), {'receipts': list(uploads)}).json()
+        self.assertTrue(result['success'])
+        return result, self.client.get(reverse('core:get_receipt_batch', args=[result['batchId']])).json()['batch']
+
+    def archive(self, *members):
+        content = io.BytesIO()
+        with zipfile.ZipFile(content, 'w') as archive:
+            for name, data in members:
+                archive.writestr(name, data)
+        return SimpleUploadedFile('receipts.zip', content.getvalue(), content_type='application/zip')
+
+    def test_archives_and_images_become_draft_expenses(self):
+        result, batch = self.upload(
+            self.archive(('a.png', receipt_image(color='red').read()), ('notes.txt', b'hello')),
+            receipt_image('b.png', color='blue')
+        )
+        self.assertEqual(result['accepted'], 2)
+        self.assertEqual(result['skipped'], [{'name': 'notes.txt', 'reason': 'not an image'}])
+        self.assertEqual((batch['completed'], batch['counts']['done']), (2, 2))
+
+        expenses = Expense.objects.filter(employee=self.employee, status='draft')
+        self.assertEqual(sorted(file['expenseId'] for file in batch['files']), sorted(expenses.values_list('id', flat=True)))
+        self.assertEqual({(expense.merchant, expense.amount) for expense in expenses}, {('COFFEE HOUSE', Decimal('4.50'))})
+
+    def test_unreadable_receipts_are_reported_per_file(self):
+        _, batch = self.upload(
+            receipt_image('good.png', color='red'),
+            receipt_image('blank.png', color='green'),
+            receipt_image('broken.png', color='blue')
+        )
+        files = {file['name']: file for file in batch['files']}
+        self.assertEqual(batch['counts'], {'pending': 0, 'processing': 0, 'done': 1, 'failed': 2})
+        self.assertIsNotNone(files['good.png']['expenseId'])
+        self.assertEqual((files['blank.png']['status'], files['blank.png']['error']), ('failed', NO_TEXT_ERROR))
+        self.assertIsNone(files['blank.png']['expenseId'])
+        self.assertEqual(files['broken.png']['error'], 'Could not read image')
+        self.assertEqual(Expense.objects.filter(employee=self.employee).count(), 1)
+
+    def test_drafts_keep_the_receipt_currency(self):
+        _, batch = self.upload(receipt_image('euro.png', color='red'), receipt_image('plain.png', color='blue'))
+        files = {file['name']: file for file in batch['files']}
+        self.assertEqual(
+            {name: Expense.objects.get(id=files[name]['expenseId']).currency for name in files},
+            {'euro.png': 'EUR', 'plain.png': self.company.currency}
+        )
+
+    @override_settings(OCR_MAX_BATCH_FILES=1, OCR_MAX_RECEIPT_BYTES=1024)
+    def test_limits(self):
+        big = SimpleUploadedFile('big.png', b'x' * 2048, content_type='image/png')
+        result, batch = self.upload(big, receipt_image('a.png', color='red'), receipt_image('b.png', color='blue'))
+        self.assertEqual(result['accepted'], 1)
+        self.assertEqual(result['skipped'], [
+            {'name': 'big.png', 'reason': 'larger than 1024 bytes'},
+            {'name': 'b.png', 'reason': 'batch file limit reached'},
+        ])
+        self.assertEqual([file['name'] for file in batch['files']], ['a.png'])
+        self.assertEqual((result['skippedCount'], batch['skippedCount']), (2, 2))
+
+    @override_settings(OCR_MAX_SKIPPED_LISTED=2)
+    def test_skipped_listing_is_capped_but_counted(self):
+        result, batch = self.upload(self.archive(
+            ('a.png', receipt_image(color='red').read()), *((f'notes{i}.txt', b'hello') for i in range(5))
+        ))
+        self.assertEqual(result['accepted'], 1)
+        self.assertEqual([file['name'] for file in result['skipped']], ['notes0.txt', 'notes1.txt'])
+        self.assertEqual((result['skippedCount'], batch['skippedCount'], len(batch['skipped'])), (5, 5, 2))
+
+
+@override_settings(EXCHANGE_RATE_BASE='USD')
+class ExchangeRateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def store_rates(self, **rates):
+        ExchangeRateTable.objects.create(base='USD', rates={code: str(rate) for code, rate in rates.items()}, source='file')
+
+    def test_cross_rates_come_from_the_base_table(self):
+        self.store_rates(USD=1, EUR='0.5', GBP='0.25')
+
+        self.assertEqual(get_exchange_rate('USD', 'EUR'), Decimal('0.5'))
+        self.assertEqual(get_exchange_rate('EUR', 'USD'), Decimal('2'))
+        self.assertEqual(get_exchange_rate('EUR', 'GBP'), Decimal('0.5'))
+        self.assertEqual(convert_currency(Decimal('10'), 'EUR', 'USD'), Decimal('20'))
+
+        # Served from the cache afterwards
+        with self.assertNumQueries(0):
+            self.assertEqual(get_exchange_rate('GBP', 'USD'), Decimal('4'))
+
+    def test_missing_rates(self):
+        self.assertIsNone(get_exchange_rate('USD', 'EUR'))
+        self.assertEqual(get_exchange_rate('JPY', 'JPY'), Decimal('1'))
+
+        self.store_rates(USD=1, EUR='0.5')
+        cache.clear()
+        self.assertIsNone(get_exchange_rate('USD', 'JPY'))
+        with self.assertLogs('core.utils', 'WARNING') as logs:
+            self.assertEqual(convert_currency(Decimal('10'), 'USD', 'JPY'), Decimal('10'))
+        self.assertIn('USD -> JPY', logs.output[0])
+
+    def test_file_provider_rebases_to_the_configured_base(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump({'base': 'EUR', 'rates': {'EUR': 1, 'USD': 2, 'GBP': 0.5}}, f)
+        self.addCleanup(os.remove, f.name)
+
+        table = refresh_rate_table(FileRateProvider(f.name))
+        self.assertEqual((table.base, table.source), ('USD', 'file'))
+        self.assertEqual(Decimal(table.rates['USD']), Decimal('1'))
+        self.assertEqual(Decimal(table.rates['GBP']), Decimal('0.25'))
+        self.assertEqual(get_exchange_rate('GBP', 'EUR'), Decimal('2'))
+
+
+class CurrencyConversionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.company = Company.objects.create(name='Acme', currency='EUR')
+        self.employee = User.objects.create_user(
+            username='employee', email='employee@example.com', password='x', company=self.company
+        )
+
+    def store_rates(self, **rates):
+        ExchangeRateTable.objects.create(base='USD', rates={code: str(rate) for code, rate in rates.items()}, source='file')
+
+    def expense(self, amount, currency, **fields):
+        return Expense.objects.create(
+            company=self.company, employee=self.employee, title='Expense', amount=Decimal(amount), currency=currency, **fields
+        )
+
+    def test_convert_amounts_groups_by_currency_and_rounds_half_up(self):
+        self.store_rates(USD=1, EUR='0.9', JPY='150')
+        with self.assertNumQueries(1):
+            converted = convert_amounts(['10.005', Decimal('1'), 300, '7'], ['USD', 'EUR', 'JPY', 'XXX'], 'EUR')
+        self.assertEqual(converted, [Decimal('9.00'), Decimal('1.00'), Decimal('1.80'), None])
+
+        totals, missing = convert_queryset_totals(Expense.objects.none(), 'EUR')
+        self.assertEqual((totals, missing), ({}, []))
+
+    def test_queryset_totals_round_per_currency_subtotal(self):
+        self.store_rates(USD=1, EUR='0.9')
+        self.expense('0.05', 'USD', description='travel')
+        self.expense('0.05', 'USD', description='travel')
+        self.expense('10', 'EUR', description='travel')
+        self.expense('3', 'JPY', description='travel')
+        self.expense('2', 'USD', description='meals')
+
+        with self.assertNumQueries(1):
+            totals, missing = convert_queryset_totals(Expense.objects.all(), 'EUR', group_by=('description',))
+        # 0.10 USD -> 0.09 EUR as one subtotal; converting each 0.05 separately would give 0.10
+        self.assertEqual(totals, {('travel',): Decimal('10.09'), ('meals',): Decimal('1.80')})
+        self.assertEqual(missing, ['JPY'])
+
+    def test_expenses_are_converted_when_saved(self):
+        self.store_rates(USD=1, EUR='0.5')
+        local = self.expense('10', 'EUR')
+        foreign = self.expense('10', 'USD')
+        unknown = self.expense('10', 'JPY')
+        given = self.expense('10', 'USD', converted_amount=Decimal('4'))
+        self.assertEqual(
+            [expense.converted_amount for expense in (local, foreign, unknown, given)],
+            [Decimal('10'), Decimal('5.00'), None, Decimal('4')]
+        )
+
+        foreign.amount = Decimal('30')
+        foreign.save()
+        foreign.refresh_from_db()
+        self.assertEqual(foreign.converted_amount, Decimal('15.00'))
+
+    def test_batch_workflow_converts_before_routing(self):
+        self.store_rates(USD=1, EUR='0.5')
+        manager = User.objects.create_user(
+            username='manager', email='manager@example.com', password='x', role='manager', company=self.company
+        )
+        self.employee.manager = manager
+        self.employee.save()
+        ApprovalRule.objects.create(company=self.company, name='Over 100 EUR', min_amount=Decimal('100'))
+
+        cheap, dear = process_approval_workflow_batch([
+            Expense(company=self.company, employee=self.employee, title='USD', amount=Decimal('150'), currency='USD'),
+            Expense(company=self.company, employee=self.employee, title='EUR', amount=Decimal('150'), currency='EUR'),
+        ])
+        self.assertEqual((cheap.converted_amount, cheap.status), (Decimal('75.00'), 'approved'))
+        self.assertEqual((dear.converted_amount, dear.status, dear.current_approver), (Decimal('150'), 'in_progress', manager))
+        cheap.refresh_from_db()
+        self.assertEqual(cheap.converted_amount, Decimal('75.00'))
+
+    def test_stored_expenses_are_converted_once_a_rate_exists(self):
+        pending = self.expense('10', 'USD', status='approved')
+        self.assertIsNone(pending.converted_amount)
+
+        self.store_rates(USD=1, EUR='0.5')
+        stdout = StringIO()
+        with mock.patch('core.management.commands.refresh_exchange_rates.refresh_rate_table') as refresh:
+            refresh.return_value = ExchangeRateTable.objects.get()
+            call_command('refresh_exchange_rates', '--convert-expenses', stdout=stdout)
+        self.assertIn('Converted 1 expenses', stdout.getvalue())
+        pending.refresh_from_db()
+        self.assertEqual(pending.converted_amount, Decimal('5.00'))
+        self.assertEqual(ExpenseRollup.objects.get().total, Decimal('5.00'))
+        self.assertEqual(rebuild_rollups(fix=False), [])
+
+
+class ApprovalWorkflowBatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username='admin', email='admin@example.com', password='x', role='admin')
+        self.company = Company.objects.create(name='Acme', admin=self.admin)
+        self.manager = User.objects.create_user(
+            username='manager', email='manager@example.com', password='x', role='manager', company=self.company
+        )
+        self.finance = User.objects.create_user(
+            username='finance', email='finance@example.com', password='x', role='admin', company=self.company
+        )
+        self.employee = User.objects.create_user(
+            username='employee', email='employee@example.com', password='x',
+            company=self.company, manager=self.manager
+        )
+        self.loner = User.objects.create_user(
+            username='loner', email='loner@example.com', password='x', company=self.company
+        )
+        ApprovalRule.objects.create(company=self.company, name='Small', max_amount=Decimal('100'))
+        big = ApprovalRule.objects.create(company=self.company, name='Big', min_amount=Decimal('100.01'))
+        ApprovalStep.objects.create(rule=big, step_number=1, approver_role='admin')
+
+    def make_expenses(self, count, amount=Decimal('50')):
+        ids = [
+            Expense.objects.create(
+                company=self.company,
+                employee=self.employee if i % 2 else self.loner,
+                title=f'Expense {i}',
+                amount=amount,
+            ).id
+            for i in range(count)
+        ]
+        # Fresh instances, as a bulk import would hand them over
+        return list(Expense.objects.filter(id__in=ids))
+
+    def test_routes_expenses_like_the_single_workflow(self):
+        [manager_expense] = self.make_expenses(1)
+        manager_expense.employee = self.employee
+        manager_expense.save()
+        [step_expense] = self.make_expenses(1, amount=Decimal('500'))
+
+        process_approval_workflow_batch([manager_expense, step_expense])
+
+        manager_expense.refresh_from_db()
+        step_expense.refresh_from_db()
+        self.assertEqual(manager_expense.current_approver, self.manager)
+        self.assertEqual(manager_expense.current_step, 0)
+        self.assertEqual(step_expense.current_approver, self.finance)
+        self.assertEqual(step_expense.current_step, 1)
+        self.assertEqual(ExpenseApproval.objects.filter(status='pending').count(), 2)
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        # Warm the rule index and routing table
+        process_approval_workflow_batch(self.make_expenses(1, amount=Decimal('500')))
+
+        small, large = self.make_expenses(3), self.make_expenses(30)
+        large += self.make_expenses(30, amount=Decimal('500'))
+        # savepoint, employees, companies, approvals insert, expenses update, counters update, release savepoint
+        with self.assertNumQueries(7):
+            process_approval_workflow_batch(small)
+        with self.assertNumQueries(7):
+            process_approval_workflow_batch(large)
+
+
+@override_settings(APPROVER_ROUTING_STRATEGY='first', APPROVAL_CACHE_REFRESH_SECONDS=60)
+class ApprovalCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.company = Company.objects.create(name='Acme')
+        self.finance = User.objects.create_user(
+            username='finance', email='finance@example.com', password='x', role='admin', company=self.company
+        )
+        self.backup = User.objects.create_user(
+            username='backup', email='backup@example.com', password='x', role='admin', company=self.company
+        )
+        self.employee = User.objects.create_user(
+            username='employee', email='employee@example.com', password='x', company=self.company
+        )
+        rule = ApprovalRule.objects.create(company=self.company, name='Finance', is_manager_approver=False)
+        ApprovalStep.objects.create(rule=rule, step_number=1, approver=self.finance, approver_role='admin')
+
+    def submit(self):
+        [expense] = process_approval_workflow_batch([
+            Expense(company=self.company, employee=self.employee, title='Expense', amount=Decimal('10'), status='draft')
+        ])
+        return expense
+
+    def test_named_step_approvers_that_left_are_routed_around(self):
+        self.assertEqual(self.submit().current_approver, self.finance)
+
+        # Deleting the approver nulls the step through SET_NULL, which sends no step signal
+        self.finance.delete()
+        expense = self.submit()
+        self.assertEqual(expense.current_approver, self.backup)
+        self.assertEqual(ExpenseApproval.objects.get(expense=expense).approver, self.backup)
+
+    def test_deactivated_step_approvers_are_routed_around(self):
+        self.finance.is_active = False
+        self.finance.save()
+        self.assertEqual(self.submit().current_approver, self.backup)
+
+    def test_processes_pick_up_changes_within_the_refresh_interval(self):
+        self.assertEqual(route_approver(self.company.id, 'admin'), self.finance)
+
+        # As seen from a process whose cache never got the invalidation
+        User.objects.filter(id=self.finance.id).update(role='employee')
+        self.assertEqual(route_approver(self.company.id, 'admin'), self.finance)
+        with mock.patch('time.time', return_value=time.time() + 61):
+            self.assertEqual(route_approver(self.company.id, 'admin'), self.backup)
+
+    def test_process_memory_is_bounded(self):
+        companies = [Company.objects.create(name=f'Company {n}') for n in range(3)]
+        with mock.patch('core.approvals.LOCAL_STRUCTURES_MAX', 2):
+            for company in companies:
+                get_rule_index(company.id)
+            self.assertLessEqual(len(approvals._local_structures), 2)
+            self.assertIn(('approval_rule_index', companies[-1].id), approvals._local_structures)
+
+
+@override_settings(APPROVER_ROUTING_STRATEGY='first')
+class ApproverRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.company = Company.objects.create(name='Acme')
+        self.first = User.objects.create_user(
+            username='first', email='first@example.com', password='x', role='manager', company=self.company
+        )
+        self.second = User.objects.create_user(
+            username='second', email='second@example.com', password='x', role='manager', company=self.company
+        )
+
+    def test_role_changes_reroute(self):
+        self.assertEqual(route_approver(self.company.id, 'manager'), self.first)
+
+        self.first.role = 'employee'
+        self.first.save()
+        self.assertEqual(route_approver(self.company.id, 'manager'), self.second)
+
+        self.first.role = 'manager'
+        self.first.save()
+        self.assertEqual(route_approver(self.company.id, 'manager'), self.first)
+        self.assertIsNone(route_approver(self.company.id, 'admin'))
+
+    def test_deactivated_users_are_not_routed_to(self):
+        self.assertEqual(route_approver(self.company.id, 'manager'), self.first)
+
+        for user in (self.first, self.second):
+            user.is_active = False
+            user.save()
+            self.assertNotEqual(route_approver(self.company.id, 'manager'), user)
+        self.assertIsNone(route_approver(self.company.id, 'manager'))
+
+    @override_settings(APPROVER_ROUTING_STRATEGY='round_robin')
+    def test_round_robin_takes_turns(self):
+        picks = [route_approver(self.company.id, 'manager') for _ in range(4)]
+        self.assertEqual(picks, [self.first, self.second, self.first, self.second])
+
+    @override_settings(APPROVER_ROUTING_STRATEGY='least_pending')
+    def test_least_pending_picks_the_fewest_then_the_lowest_id(self):
+        third = User.objects.create_user(
+            username='third', email='third@example.com', password='x', role='manager', company=self.company
+        )
+        employee = User.objects.create_user(
+            username='employee', email='employee@example.com', password='x', company=self.company
+        )
+
+        def assign(approver, count):
+            with self.captureOnCommitCallbacks(execute=True):
+                for _ in range(count):
+                    expense = Expense.objects.create(
+                        company=self.company, employee=employee, title='Taxi', amount=Decimal('20')
+                    )
+                    ExpenseApproval.objects.create(expense=expense, approver=approver)
+
+        assign(self.first, 2)
+        assign(self.second, 1)
+        assign(third, 1)
+        self.assertEqual(route_approver(self.company.id, 'manager'), self.second)
+
+        assign(self.second, 1)
+        self.assertEqual(route_approver(self.company.id, 'manager'), third)
+
+
+class ApprovalInboxTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username='admin', email='admin@example.com', password='x', role='admin')
+        self.company = Company.objects.create(name='Acme', admin=self.admin)
+        self.manager = User.objects.create_user(
+            username='manager', email='manager@example.com', password='x', role='manager', company=self.company
+        )
+        self.finance = User.objects.create_user(
+            username='finance', email='finance@example.com', password='x', role='admin', company=self.company
+        )
+        self.employee = User.objects.create_user(
+            username='employee', email='employee@example.com', password='x',
+            company=self.company, manager=self.manager
+        )
+        ApprovalRule.objects.create(company=self.company, name='Small', max_amount=Decimal('100'))
+        big = ApprovalRule.objects.create(company=self.company, name='Big', min_amount=Decimal('100.01'))
+        ApprovalStep.objects.create(rule=big, step_number=1, approver=self.finance)
+
+    def submit(self, count, amount=Decimal('500')):
+        return process_approval_workflow_batch([
+            Expense(company=self.company, employee=self.employee, title=f'Expense {i}', amount=amount, status='draft')
+            for i in range(count)
+        ])
+
+    def decide(self, ids, decision):
+        return self.client.post(
+            reverse('core:decide_approvals'),
+            json.dumps({'expenseIds': ids, 'decision': decision, 'comments': 'ok'}),
+            content_type='application/json'
+        ).json()
+
+    def inbox(self, **params):
+        return self.client.get(reverse('core:approval_inbox'), params).json()
+
+    def test_inbox_pages_oldest_first_with_cached_count(self):
+        submitted = self.submit(7)
+        self.client.force_login(self.manager)
+
+        seen, cursor = [], None
+        while True:
+            result = self.inbox(limit=3, **({'cursor': cursor} if cursor else {}))
+            self.assertEqual(result['pendingCount'], 7)
+            seen += [expense['id'] for expense in result['expenses']]
+            cursor = result['nextCursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, [expense.id for expense in submitted])
+
+    def test_approvals_advance_through_the_rule_steps(self):
+        expensive = [expense.id for expense in self.submit(3)]
+        cheap = [expense.id for expense in self.submit(2, amount=Decimal('20'))]
+        self.client.force_login(self.manager)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = self.decide(expensive + cheap, 'approve')
+        self.assertEqual(result['decided'], sorted(expensive + cheap))
+
+        # Big expenses move on to the finance step, small ones are done
+        for expense in Expense.objects.filter(id__in=expensive):
+            self.assertEqual((expense.status, expense.current_approver, expense.current_step), ('in_progress', self.finance, 1))
+        self.assertEqual(set(Expense.objects.filter(id__in=cheap).values_list('status', flat=True)), {'approved'})
+        self.assertEqual(get_pending_counts([self.manager, self.finance]), {self.manager.id: 0, self.finance.id: 3})
+
+        self.client.force_login(self.finance)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.decide(expensive, 'approve')
+        self.assertEqual(set(Expense.objects.filter(id__in=expensive).values_list('status', flat=True)), {'approved'})
+        self.assertEqual(ExpenseApproval.objects.filter(status='pending').count(), 0)
+        self.assertEqual(get_user_stats(self.company)['pendingApprovals'], 0)
+        self.assertEqual(rebuild_counters(fix=False), [])
+
+    def test_pending_counts_ignore_rolled_back_writes(self):
+        self.submit(2)
+        self.assertEqual(get_pending_counts([self.manager]), {self.manager.id: 2})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.submit(1)
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+        self.assertEqual(get_pending_counts([self.manager]), {self.manager.id: 2})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.submit(1)
+        self.assertEqual(get_pending_counts([self.manager]), {self.manager.id: 3})
+
+    def test_rejections_end_the_workflow_and_foreign_items_are_skipped(self):
+        mine = [expense.id for expense in self.submit(2)]
+        self.client.force_login(self.finance)
+        result = self.decide(mine, 'reject')
+        self.assertEqual((result['decided'], result['skipped']), ([], mine))
+
+        self.client.force_login(self.manager)
+        result = self.decide(mine, 'reject')
+        self.assertEqual(result['decided'], mine)
+        self.assertEqual(set(Expense.objects.filter(id__in=mine).values_list('status', flat=True)), {'rejected'})
+        self.assertEqual(
+            set(ExpenseApproval.objects.filter(expense_id__in=mine).values_list('status', 'comments')), {('rejected', 'ok')}
+        )
+        self.assertFalse(self.decide(mine, 'maybe')['success'])
+
+    def test_unexpected_errors_are_logged(self):
+        mine = [expense.id for expense in self.submit(1)]
+        self.client.force_login(self.manager)
+        with mock.patch('core.views.decide_expenses', side_effect=RuntimeError('database went away')), \
+                self.assertLogs('core.views', 'ERROR') as logs:
+            result = self.decide(mine, 'approve')
+        self.assertEqual((result['success'], result['message']), (False, 'database went away'))
+        self.assertIn('Error deciding approvals', logs.output[0])
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        self.client.force_login(self.manager)
+        small, large = self.submit(2), self.submit(40)
+        self.decide([self.submit(1)[0].id], 'approve')
+
+        with CaptureQueriesContext(connection) as few:
+            self.decide([expense.id for expense in small], 'approve')
+        with CaptureQueriesContext(connection) as many:
+            self.decide([expense.id for expense in large], 'approve')
+        self.assertEqual(len(few), len(many))
+
+
+# Query counts cover the view; core.sessions keeps the session out of them
+@override_settings(SESSION_ENGINE='core.sessions')
+class UsersApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username='admin', email='admin@example.com', password='x', role='admin')
+        self.company = Company.objects.create(name='Acme', admin=self.admin)
+        self.client.force_login(self.admin)
+
+    def make_team(self, managers, employees_each, start=0):
+        for m in range(start, start + managers):
+            manager = User.objects.create_user(
+                username=f'manager{m}', email=f'manager{m}@example.com', password='x',
+                role='manager', company=self.company
+            )
+            for e in range(employees_each):
+                User.objects.create_user(
+                    username=f'employee{m}-{e}', email=f'employee{m}-{e}@example.com', password='x',
+                    company=self.company, manager=manager
+                )
+
+    def get_users(self, **params):
+        return self.client.get(reverse('core:get_users'), params).json()
+
+    def test_pages_cover_every_user_once(self):
+        self.make_team(3, 4)
+        other = Company.objects.create(name='Other')
+        User.objects.create_user(username='outsider', email='outsider@example.com', password='x', company=other)
+
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 4}
+            if cursor:
+                params['cursor'] = cursor
+            result = self.get_users(**params)
+            seen += [user['id'] for user in result['users']]
+            cursor = result['nextCursor']
+            if not cursor:
+                break
+
+        expected = User.objects.exclude(username='outsider').values_list('id', flat=True)
+        self.assertEqual(sorted(seen), sorted(expected))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_filters_and_team_size(self):
+        self.make_team(2, 3)
+        manager = User.objects.get(username='manager1')
+
+        managers = self.get_users(role='manager')['users']
+        self.assertEqual({user['teamSize'] for user in managers}, {3})
+        team = self.get_users(manager=manager.id)['users']
+        self.assertEqual({user['managerId'] for user in team}, {manager.id})
+        self.assertEqual(len(team), 3)
+        self.assertEqual([user['username'] for user in self.get_users(q='employee0-2')['users']], ['employee0-2'])
+
+    def test_query_count_does_not_depend_on_team_size(self):
+        # user, company, company version, page (the session is served from the cache and its refresh coalesced)
+        self.make_team(2, 2)
+        with self.assertNumQueries(4):
+            self.get_users(limit=10)
+        self.make_team(10, 10, start=2)
+        with self.assertNumQueries(4):
+            self.get_users(limit=10)
+
+    def test_stream_matches_paginated_output(self):
+        self.make_team(2, 3)
+        response = self.client.get(reverse('core:get_users'), {'stream': 1, 'role': 'employee'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        streamed = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        paged = self.get_users(role='employee')['users']
+        self.assertEqual(sorted(streamed, key=lambda user: user['id']), sorted(paged, key=lambda user: user['id']))
+
+    def test_invalid_cursor(self):
+        self.assertFalse(self.get_users(cursor='nonsense')['success'])
+
+
+@override_settings(SESSION_ENGINE='core.sessions')
+class ExpensesApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username='admin', email='admin@example.com', password='x', role='admin')
+        self.company = Company.objects.create(name='Acme', admin=self.admin)
+        self.admin.company = self.company
+        self.admin.save(update_fields=['company'])
+        self.lead = User.objects.create_user(
+            username='lead', email='lead@example.com', password='x', role='manager', company=self.company
+        )
+        self.manager = User.objects.create_user(
+            username='manager', email='manager@example.com', password='x', role='manager',
+            company=self.company, manager=self.lead
+        )
+        self.employee = User.objects.create_user(
+            username='employee', email='employee@example.com', password='x', company=self.company, manager=self.manager
+        )
+        self.loner = User.objects.create_user(username='loner', email='loner@example.com', password='x', company=self.company)
+        statuses = ['pending', 'approved', 'rejected', 'draft']
+        categories = ['travel', 'meals', 'supplies']
+        Expense.objects.bulk_create([
+            Expense(
+                company=self.company, employee=employee, title=f'Expense {n}', amount=Decimal(10 + n % 7),
+                category=categories[n % 3], status=statuses[n % 4],
+                date=timezone.localdate() - timedelta(days=n % 5)
+            )
+            for n, employee in enumerate([self.employee, self.manager, self.loner] * 8)
+        ])
+        self.client.force_login(self.admin)
+
+    def get_expenses(self, **params):
+        return self.client.get(reverse('core:get_expenses'), params).json()
+
+    def collect(self, **params):
+        seen, cursor = [], None
+        while True:
+            result = self.get_expenses(limit=5, **params, **({'cursor': cursor} if cursor else {}))
+            seen += result['expenses']
+            cursor = result['nextCursor']
+            if not cursor:
+                return seen
+
+    def test_pages_follow_every_sort_order(self):
+        for sort, key in (('-date', 'date'), ('amount', 'amount'), ('-created', 'createdAt')):
+            expenses = self.collect(sort=sort)
+            self.assertEqual(len(expenses), 24)
+            self.assertEqual(len({expense['id'] for expense in expenses}), 24)
+            values = [Decimal(e[key]) if key == 'amount' else e[key] for e in expenses]
+            self.assertEqual(values, sorted(values, reverse=sort.startswith('-')))
+
+    def test_filters(self):
+        expenses = self.collect(status='pending,approved', category='travel', min='12', max='15')
+        expected = Expense.objects.filter(
+            status__in=['pending', 'approved'], category='travel', amount__gte=12, amount__lte=15
+        )
+        self.assertEqual({e['id'] for e in expenses}, set(expected.values_list('id', flat=True)))
+
+        today = timezone.localdate()
+        recent = self.collect(**{'from': (today - timedelta(days=1)).isoformat(), 'to': today.isoformat()})
+        self.assertEqual(len(recent), Expense.objects.filter(date__gte=today - timedelta(days=1)).count())
+
+    def test_visibility_follows_the_hierarchy(self):
+        self.client.force_login(self.lead)
+        owners = {e['employeeId'] for e in self.collect()}
+        self.assertEqual(owners, {self.manager.id, self.employee.id})
+
+        self.client.force_login(self.employee)
+        self.assertEqual({e['employeeId'] for e in self.collect()}, {self.employee.id})
+
+    def test_one_query_per_page(self):
+        # user, company, page
+        with self.assertNumQueries(3):
+            self.get_expenses(status='pending', sort='-amount')
+
+    def test_invalid_parameters(self):
+        self.assertFalse(self.get_expenses(sort='title')['success'])
+        self.assertFalse(self.get_expenses(min='lots')['success'])
+        self.assertFalse(self.get_expenses(cursor='nonsense')['success'])
+        cursor = self.get_expenses(limit=1)['nextCursor']
+        self.assertFalse(self.get_expenses(cursor=cursor, sort='amount')['success'])
+        for value in ('NaN', 'Infinity', '-inf', 'sNaN'):
+            self.assertFalse(self.get_expenses(min=value)['success'])
+            self.assertFalse(self.get_expenses(max=value)['success'])
+            cursor = base64.urlsafe_b64encode(json.dumps(['amount', value, 1]).encode()).decode()
+            self.assertFalse(self.get_expenses(cursor=cursor, sort='amount')['success'])
+
+
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username='admin', email='admin@example.com', password='x', role='admin')
+        self.company = Company.objects.create(name='Acme', admin=self.admin)
+        User.objects.create_user(
+            username='manager', email='manager@example.com', password='x', role='manager', company=self.company
+        )
+        other = Company.objects.create(name='Other')
+        User.objects.create_user(username='outsider', email='outsider@example.com', password='x', company=other)
+
+    def test_counts_are_scoped_and_current(self):
+        self.assertEqual(get_user_stats(self.company), {'employees': 0, 'managers': 1, 'total': 2, 'pendingApprovals': 0})
+        with self.assertNumQueries(1):
+            get_user_stats(self.company)
+
+        User.objects.create_user(username='employee', email='employee@example.com', password='x', company=self.company)
+        self.assertEqual(get_user_stats(self.company), {'employees': 1, 'managers': 1, 'total': 3, 'pendingApprovals': 0})
+
+        # The admin is listed by the users API without being a member, and counted the same way
+        self.client.force_login(self.admin)
+        self.assertEqual(len(self.client.get(reverse('core:get_users')).json()['users']), 3)
+        self.assertEqual(rebuild_counters(fix=False), [])
+
+
+class CompanyCountersTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.company = Company.objects.create(name='Acme')
+        self.other = Company.objects.create(name='Other')
+
+    def assertCounters(self, company, **expected):
+        counters = CompanyCounters.objects.get(company=company)
+        self.assertEqual({field: getattr(counters, field) for field in expected}, expected)
+
+    def test_counters_follow_user_and_approval_changes(self):
+        manager = User.objects.create_user(
+            username='manager', email='manager@example.com', password='x', role='manager', company=self.company
+        )
+        employee = User.objects.create_user(
+            username='employee', email='employee@example.com', password='x', company=self.company, manager=manager
+        )
+        self.assertCounters(self.company, users=2, employees=1, managers=1)
+
+        employee.role = 'manager'
+        employee.save()
+        self.assertCounters(self.company, users=2, employees=0, managers=2)
+
+        employee.company = self.other
+        employee.save()
+        self.assertCounters(self.company, users=1, employees=0, managers=1)
+        self.assertCounters(self.other, users=1, employees=0, managers=1)
+
+        expense = Expense.objects.create(company=self.company, employee=manager, title='Taxi', amount=Decimal('20'))
+        approval = ExpenseApproval.objects.create(expense=expense, approver=employee)
+        self.assertCounters(self.company, pending_approvals=1)
+        approval.status = 'approved'
+        approval.save()
+        self.assertCounters(self.company, pending_approvals=0)
+
+        employee.delete()
+        self.assertCounters(self.other, users=0, managers=0)
+        self.assertEqual(rebuild_counters(), [])
+
+    def test_admins_count_towards_the_company_they_run(self):
+        # Registration creates the admin first, then the company, then attaches them
+        admin = User.objects.create_user(username='admin', email='admin@example.com', password='x', role='admin')
+        company = Company.objects.create(name='Registered', admin=admin)
+        self.assertCounters(company, users=1)
+        admin.company = company
+        admin.save(update_fields=['company'])
+        self.assertCounters(company, users=1)
+
+        successor = User.objects.create_user(
+            username='successor', email='successor@example.com', password='x', role='manager', company=self.other
+        )
+        company.admin = successor
+        company.save()
+        self.assertCounters(company, users=2, managers=1)
+        successor.role = 'employee'
+        successor.save()
+        self.assertCounters(company, users=2, employees=1, managers=0)
+        self.assertCounters(self.other, users=1, employees=1)
+        self.assertEqual(rebuild_counters(fix=False), [])
+
+    def test_failed_user_creation_rolls_back_its_counters(self):
+        admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='x', role='admin', company=self.company
+        )
+        self.client.force_login(admin)
+        response = self.client.post(reverse('core:create_user'), json.dumps({
+            'email': 'new@example.com', 'password': 'x', 'name': 'New Hire', 'role': 'employee', 'managerId': 999999,
+        }), content_type='application/json').json()
+
+        self.assertFalse(response['success'])
+        self.assertFalse(User.objects.filter(email='new@example.com').exists())
+        self.assertCounters(self.company, users=1, employees=0)
+        self.assertEqual(rebuild_counters(fix=False), [])
+
+    def test_missing_counters_are_recounted_on_read(self):
+        User.objects.create_user(username='employee', email='employee@example.com', password='x', company=self.company)
+        CompanyCounters.objects.filter(company=self.company).delete()
+        company = Company.objects.get(id=self.company.id)
+        self.assertEqual((company.get_employee_count(), company.get_manager_count()), (1, 0))
+
+    def test_rebuild_reports_and_fixes_drift(self):
+        User.objects.create_user(username='employee', email='employee@example.com', password='x', company=self.company)
+        CompanyCounters.objects.filter(company=self.company).update(employees=5)
+        CompanyCounters.objects.filter(company=self.other).delete()
+
+        mismatches = rebuild_counters(fix=False)
+        self.assertIn((self.company.id, 'employees', 5, 1), mismatches)
+        self.assertIn((self.other.id, 'users', None, 0), mismatches)
+
+        call_command('rebuild_company_counters', stdout=StringIO())
+        self.assertCounters(self.company, users=1, employees=1)
+        self.assertEqual(rebuild_counters(fix=False), [])
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username='admin', email='admin@example.com', password='x', role='admin')
+        self.company = Company.objects.create(name='Acme', admin=self.admin)
+        self.client.force_login(self.admin)
+
+    def test_unchanged_reads_get_304_until_company_data_changes(self):
+        for name in ('core:get_company', 'core:get_users', 'core:get_stats'):
+            url = reverse(name)
+            first = self.client.get(url)
+            self.assertEqual(first.status_code, 200)
+            self.assertTrue(first.has_header('Last-Modified'))
+
+            again = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(again.status_code, 304)
+
+        url = reverse('core:get_users')
+        etag = self.client.get(url)['ETag']
+        self.assertNotEqual(self.client.get(url, {'role': 'manager'})['ETag'], etag)
+
+        User.objects.create_user(username='new', email='new@example.com', password='x', company=self.company)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_version_lives_in_the_database(self):
+        url = reverse('core:get_company')
+        etag = self.client.get(url)['ETag']
+
+        # Another process changing the company commits a new version, whatever this process has cached
+        cache.clear()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Company.objects.filter(id=self.company.id).update(name='Renamed')
+        bump_company_version(self.company.id)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['company']['name'], 'Renamed')
+
+        # Counters rows missing from older data are recreated
+        CompanyCounters.objects.all().delete()
+        self.assertEqual(get_company_version(self.company.id)[0], 0)
+
+
+@mock.patch('core.views.USERS_SYNC_LAG', timedelta(0))
+class UserSyncTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='x', role='admin'
+        )
+        self.company = Company.objects.create(name='Acme', admin=self.admin)
+        self.manager = User.objects.create_user(
+            username='manager', email='manager@example.com', password='x', role='manager', company=self.company
+        )
+        self.employee = User.objects.create_user(
+            username='employee', email='employee@example.com', password='x', company=self.company
+        )
+        self.client.force_login(self.admin)
+
+    def sync(self, since=None, **params):
+        if since:
+            params['since'] = since
+        return self.client.get(reverse('core:sync_users'), params).json()
+
+    def test_full_then_delta_sync(self):
+        pages, cursor = [], None
+        while True:
+            result = self.sync(cursor, limit=2)
+            pages.append(result)
+            cursor = result['cursor']
+            if not result['hasMore']:
+                break
+        synced = [user['id'] for page in pages for user in page['users']]
+        self.assertEqual(sorted(synced), sorted([self.admin.id, self.manager.id, self.employee.id]))
+
+        self.assertEqual(self.sync(cursor)['users'], [])
+
+        self.employee.manager = self.manager
+        self.employee.save()
+        result = self.sync(cursor)
+        # The manager's team size changed too
+        self.assertEqual({user['id'] for user in result['users']}, {self.employee.id, self.manager.id})
+        cursor = result['cursor']
+
+        response = self.client.delete(reverse('core:delete_user', args=[self.employee.id]))
+        self.assertTrue(response.json()['success'])
+        result = self.sync(cursor)
+        self.assertEqual(result['deleted'], [self.employee.id])
+        self.assertEqual([user['id'] for user in result['users']], [self.manager.id])
+        self.assertEqual(self.sync(result['cursor'])['deleted'], [])
+
+    def test_users_moving_company_are_dropped_from_the_old_one(self):
+        cursor = self.sync()['cursor']
+        other = Company.objects.create(name='Other')
+        self.employee.company = other
+        self.employee.save()
+
+        result = self.sync(cursor)
+        self.assertEqual((result['deleted'], result['users']), ([self.employee.id], []))
+
+        self.employee.company = self.company
+        self.employee.save()
+        result = self.sync(cursor)
+        self.assertEqual(result['deleted'], [])
+        self.assertEqual([user['id'] for user in result['users']], [self.employee.id])
+        self.assertFalse(UserTombstone.objects.filter(company=self.company).exists())
+        self.assertTrue(UserTombstone.objects.filter(company=other, user_id=self.employee.id).exists())
+
+
+class UserImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='x', role='admin'
+        )
+        self.company = Company.objects.create(name='Acme', admin=self.admin)
+        self.admin.company = self.company
+        self.admin.save()
+        self.boss = User.objects.create_user(
+            username='boss', email='boss@example.com', password='x', role='manager', company=self.company
+        )
+        self.client.force_login(self.admin)
+
+    def test_import_resolves_managers_and_reports_row_errors(self):
+        content = '\n'.join([
+            'email,name,role,password,manager',
+            'lead@example.com,Lead Person,manager,secret,boss@example.com',
+            'dev@example.com,Dev Person,employee,secret,lead@example.com',
+            'admin@example.com,Taken,employee,secret,',
+            'bad-email,Nobody,employee,secret,',
+            'ghost@example.com,Ghost,employee,secret,missing@example.com',
+            'dev@example.com,Dev Again,employee,secret,',
+            'odd@example.com,Odd,admin,secret,',
+        ])
+        upload = SimpleUploadedFile('users.csv', content.encode())
+        result = self.client.post(reverse('core:import_users'), {'file': upload}).json()
+
+        self.assertTrue(result['success'])
+        self.assertEqual([user['email'] for user in result['users']], ['lead@example.com', 'dev@example.com'])
+        self.assertEqual([error['row'] for error in result['errors']], [3, 4, 5, 6, 7])
+
+        lead = User.objects.get(email='lead@example.com')
+        dev = User.objects.get(email='dev@example.com')
+        self.assertEqual(lead.manager, self.boss)
+        self.assertEqual(dev.manager, lead)
+        self.assertEqual(dev.username, 'dev')
+        self.assertTrue(dev.check_password('secret'))
+        self.assertEqual(rebuild_counters(fix=False), [])
+
+    def test_rejected_manager_rejects_their_reports(self):
+        rows = [
+            {'email': 'boss@example.com', 'name': 'Duplicate Boss', 'role': 'manager'},
+            {'email': 'new@example.com', 'name': 'New Hire', 'manager': 'boss@example.com'},
+            {'email': 'other@example.com', 'name': 'Other', 'role': 'manager', 'manager': 'nobody@example.com'},
+            {'email': 'report@example.com', 'name': 'Report', 'manager': 'other@example.com'},
+        ]
+        result = import_users(self.company, rows, workers=0)
+
+        # new@ reports to the existing boss; report@ loses its in-batch manager
+        self.assertEqual([user.email for user in result['created']], ['new@example.com'])
+        self.assertEqual([error['row'] for error in result['errors']], [1, 3, 4])
+
+    def test_manager_loops_are_row_errors(self):
+        rows = [
+            {'email': 'a@example.com', 'name': 'A', 'role': 'manager', 'manager': 'b@example.com'},
+            {'email': 'b@example.com', 'name': 'B', 'role': 'manager', 'manager': 'c@example.com'},
+            {'email': 'c@example.com', 'name': 'C', 'role': 'manager', 'manager': 'a@example.com'},
+            {'email': 'd@example.com', 'name': 'D', 'manager': 'a@example.com'},
+            {'email': 'e@example.com', 'name': 'E', 'manager': 'boss@example.com'},
+        ]
+        result = import_users(self.company, rows, workers=0)
+
+        self.assertEqual([user.email for user in result['created']], ['e@example.com'])
+        self.assertEqual(
+            [(error['row'], error['message']) for error in result['errors']],
+            [(1, 'Manager chain loops back to this user'), (2, 'Manager chain loops back to this user'),
+             (3, 'Manager chain loops back to this user'),
+             (4, 'Manager a@example.com is not a manager in this company or this import')]
+        )
+
+    def test_existing_emails_match_case_insensitively(self):
+        User.objects.create_user(username='mixed', email='Mixed@Example.com', password='x', company=self.company)
+        self.boss.email = 'Boss@Example.com'
+        self.boss.save()
+
+        result = import_users(self.company, [
+            {'email': 'MIXED@example.com', 'name': 'Mixed Again'},
+            {'email': 'new@example.com', 'name': 'New', 'manager': 'BOSS@example.com'},
+        ], workers=0)
+
+        self.assertEqual([error['row'] for error in result['errors']], [1])
+        [new] = result['created']
+        self.assertEqual(new.manager_id, self.boss.id)
+
+    def test_generated_usernames_never_clash(self):
+        User.objects.create_user(username='sam', email='sam@old.example', password='x')
+        User.objects.create_user(username='sam@new.example', email='other@old.example', password='x')
+
+        result = import_users(self.company, [
+            {'email': 'sam@new.example', 'name': 'Sam New'},
+            {'email': 'sam@third.example', 'name': 'Sam Third'},
+            {'email': 'sam@fourth.example', 'name': 'Sam Fourth'},
+        ], workers=0)
+
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(
+            [user.username for user in result['created']], ['sam2', 'sam@third.example', 'sam@fourth.example']
+        )
+
+    def test_passwords_hash_in_a_process_pool(self):
+        hashes = hash_passwords(['one', 'two', ''], workers=2)
+        self.assertTrue(check_password('one', hashes[0]))
+        self.assertTrue(check_password('two', hashes[1]))
+        self.assertFalse(is_password_usable(hashes[2]))
+
+
+class UserHierarchyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.company = Company.objects.create(name='Acme')
+
+    def make_user(self, name, manager=None):
+        return User.objects.create_user(
+            username=name, email=f'{name}@example.com', password='x', company=self.company, manager=manager
+        )
+
+    def assertClosureMatchesManagers(self):
+        expected = set()
+        for user in User.objects.all():
+            current, depth = user, 0
+            while current is not None:
+                expected.add((current.id, user.id, depth))
+                current, depth = current.manager, depth + 1
+        self.assertEqual(set(UserHierarchy.objects.values_list('ancestor_id', 'descendant_id', 'depth')), expected)
+
+    def test_closure_follows_manager_changes(self):
+        ceo = self.make_user('ceo')
+        vp = self.make_user('vp', ceo)
+        lead = self.make_user('lead', vp)
+        dev = self.make_user('dev', lead)
+        other = self.make_user('other', ceo)
+
+        self.assertEqual([(user.username, user.depth) for user in ancestors(dev)], [('lead', 1), ('vp', 2), ('ceo', 3)])
+        self.assertEqual([user.username for user in descendants(vp)], ['lead', 'dev'])
+        self.assertEqual(get_depth(dev), 3)
+
+        lead.manager = other
+        lead.save()
+        self.assertEqual([user.username for user in ancestors(dev)], ['lead', 'other', 'ceo'])
+        self.assertEqual(list(descendants(vp)), [])
+        self.assertClosureMatchesManagers()
+
+        other.delete()
+        self.assertEqual([user.username for user in ancestors(dev)], ['lead'])
+        self.assertClosureMatchesManagers()
+
+        import_users(self.company, [
+            {'email': 'intern@example.com', 'name': 'Intern', 'manager': 'mentor@example.com'},
+            {'email': 'mentor@example.com', 'name': 'Mentor', 'role': 'manager'},
+        ], workers=0)
+        self.assertClosureMatchesManagers()
+
+    def test_cycles_are_refused(self):
+        boss = self.make_user('boss')
+        report = self.make_user('report', boss)
+
+        boss.manager = report
+        with self.assertRaises(HierarchyCycleError):
+            boss.save()
+        boss.manager = boss
+        with self.assertRaises(HierarchyCycleError):
+            boss.save()
+        boss.refresh_from_db()
+        self.assertIsNone(boss.manager)
+
+    def test_descendants_respect_max_depth_without_duplicates(self):
+        root = self.make_user('root')
+        a = self.make_user('a', root)
+        x = self.make_user('x', a)
+        self.make_user('y', x)
+
+        self.assertEqual([(user.username, user.depth) for user in descendants(root, 1)], [('a', 1)])
+        self.assertEqual([user.username for user in descendants(root, 2)], ['a', 'x'])
+        self.assertEqual([user.username for user in descendants(root)], ['a', 'x', 'y'])
+
+    def test_manager_loops_within_a_batch_are_refused(self):
+        users = User.objects.bulk_create([
+            User(username=name, email=f'{name}@example.com', company=self.company) for name in ('a', 'b', 'c')
+        ])
+        a, b, c = users
+        a.manager_id, b.manager_id, c.manager_id = b.id, a.id, a.id
+
+        with self.assertRaises(HierarchyCycleError):
+            link_new_users(users)
+        self.assertFalse(UserHierarchy.objects.exists())
+
+        a.manager_id = None
+        link_new_users(users)
+        self.assertEqual(
+            set(UserHierarchy.objects.values_list('ancestor__username', 'descendant__username', 'depth')),
+            {('a', 'a', 0), ('b', 'b', 0), ('c', 'c', 0), ('a', 'b', 1), ('a', 'c', 1)}
+        )
+
+
+@override_settings(SESSION_ENGINE='core.sessions')
+class SessionWriteCoalescingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='user', email='user@example.com', password='x')
+        self.client.force_login(self.user)
+        self.url = reverse('core:get_users')
+
+    def session_updates(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        return sum('UPDATE "django_session"' in query['sql'] for query in queries)
+
+    def test_expiry_refresh_is_written_once_per_fraction_of_the_age(self):
+        self.assertEqual(self.session_updates(), 0)
+        self.assertEqual(self.session_updates(), 0)
+
+        later = time.time() + settings.SESSION_REFRESH_FRACTION * settings.SESSION_COOKIE_AGE + 1
+        with mock.patch('core.sessions.time.time', return_value=later):
+            self.assertEqual(self.session_updates(), 1)
+            self.assertEqual(self.session_updates(), 0)
+
+        self.assertEqual(get_session_write_stats()['saved'], 3)
+
+    def test_modified_sessions_are_always_written(self):
+        self.client.get(self.url)
+        session = self.client.session
+        session['seen'] = True
+        session.save()
+        self.assertEqual(self.client.session['seen'], True)
+
+
+class QueryMetricsTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_metrics()
+        self.admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='x', role='admin', is_staff=True
+        )
+        self.company = Company.objects.create(name='Acme', admin=self.admin)
+        User.objects.create_user(
+            username='manager', email='manager@example.com', password='x', role='manager', company=self.company
+        )
+        self.client.force_login(self.admin)
+
+    def test_read_endpoints_stay_within_budget(self):
+        for name in ('core:get_users', 'core:get_company', 'core:get_stats', 'core:sync_users'):
+            self.assertWithinQueryBudget(reverse(name))
+
+    @override_settings(QUERY_METRICS=True, METRICS_TOKEN='scrape-me')
+    def test_histograms_are_exposed_to_staff_and_token_holders(self):
+        self.client.get(reverse('core:get_users'))
+
+        text = self.client.get(reverse('core:metrics')).content.decode()
+        self.assertIn('http_view_queries_count{view="core:get_users"} 1', text)
+        self.assertIn('# TYPE http_view_seconds histogram', text)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('core:metrics')).status_code, 403)
+        scraped = self.client.get(reverse('core:metrics'), HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(scraped.status_code, 200)
+
+    @override_settings(QUERY_METRICS=True, QUERY_BUDGETS={'core:get_users': 1})
+    def test_requests_over_budget_are_reported(self):
+        with self.assertLogs('core.metrics', 'WARNING') as logs:
+            self.client.get(reverse('core:get_users'))
+        self.assertIn('Query budget exceeded: core:get_users', logs.output[0])
+
+
+@override_settings(REPORT_WORKERS=0)
+class BenchmarkHarnessTests(TestCase):
+    def setUp(self):
+        # The report scenarios write files; keep them out of the working tree
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_override = override_settings(MEDIA_ROOT=media.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+    @override_settings(SESSION_ENGINE='core.sessions')
+    def test_seeding_is_reproducible_and_every_route_is_accounted_for(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            summary = seed_benchmark_data(companies=1, users_per_company=17, expenses_per_user=1, contact_messages=3, seed=7)
+        self.assertEqual(summary, {'companies': 1, 'users': 17, 'expenses': 14, 'contact_messages': 3})
+
+        company = Company.objects.get(name='Bench Company 0')
+        self.assertEqual(company.counters.users, 17)
+        self.assertEqual(company.counters.managers, 2)
+        self.assertEqual(UserHierarchy.objects.filter(descendant__company=company, depth=0).count(), 17)
+
+        report = run_benchmarks(company, requests=2, warmup=0, routes=route_names())
+        self.assertEqual(set(report['results']) | set(report['skipped']), set(route_names()))
+        self.assertEqual(report['results']['get_users']['queries'], 4)
+        self.assertEqual(report['results']['get_users']['errors'], 0)
+        self.assertIn('submit_ocr_job', report['skipped'])
+
+        rows = compare_results(report, report)
+        self.assertTrue(rows)
+        self.assertTrue(all(change == 0 for *_, change in rows))
+
+    def test_server_mode_logs_in_as_the_scenario_user(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            seed_benchmark_data(companies=1, users_per_company=17, expenses_per_user=1, contact_messages=0, seed=7)
+        company = Company.objects.get(name='Bench Company 0')
+        approver = BenchmarkContext(company).approver
+        logins, refused = [], set()
+
+        def respond(method, url, data=None, headers=None):
+            success = True
+            if url.endswith(reverse('core:login')):
+                username = json.loads(data)['username']
+                logins.append(username)
+                success = username not in refused
+            response = mock.Mock(status_code=200, headers={'Content-Type': 'application/json'})
+            response.json.return_value = {'success': success}
+            return response
+
+        with mock.patch('requests.Session') as session:
+            session.return_value.request.side_effect = respond
+            report = run_benchmarks(company, requests=1, warmup=0, routes=['approval_inbox'], server='http://bench.test')
+            self.assertEqual(logins, [company.admin.username, approver.username])
+            self.assertIn('approval_inbox', report['results'])
+
+            refused.add(approver.username)
+            report = run_benchmarks(company, requests=1, warmup=0, routes=['approval_inbox'], server='http://bench.test')
+        self.assertNotIn('approval_inbox', report['results'])
+        self.assertIn(f'Could not log in as {approver.username}', report['failed']['approval_inbox'])
+
+
+@override_settings(REPORT_WORKERS=0, REPORT_CHUNK_SIZE=4)
+class ReportJobTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_override = override_settings(MEDIA_ROOT=media.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.admin = User.objects.create_user(username='admin', email='admin@example.com', password='x', role='admin')
+        self.company = Company.objects.create(name='Acme', admin=self.admin)
+        self.employee = User.objects.create_user(
+            username='employee', email='employee@example.com', password='x',
+            first_name='Erin', last_name='Example', company=self.company
+        )
+        Expense.objects.bulk_create([
+            Expense(
+                company=self.company, employee=self.employee, title=f'Expense {n}', amount=Decimal('10.50'),
+                status='approved' if n % 3 else 'rejected', date=timezone.localdate() - timedelta(days=n)
+            )
+            for n in range(10)
+        ])
+        self.client.force_login(self.admin)
+
+    def submit(self, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('core:submit_report'), json.dumps(data), content_type='application/json')
+        return response.json()
+
+    def job(self, job_id):
+        return self.client.get(reverse('core:get_report_job', args=[job_id])).json()['job']
+
+    def test_csv_report_streams_the_filtered_expenses(self):
+        result = self.submit(format='csv', filters={'status': 'approved', 'ignored': 'x'})
+        job = self.job(result['jobId'])
+        self.assertEqual((job['status'], job['rows'], job['filters']), ('done', 6, {'status': 'approved'}))
+
+        response = self.client.get(job['downloadUrl'])
+        self.assertIn('attachment', response['Content-Disposition'])
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['ID', 'Date', 'Employee'])
+        self.assertEqual(len(lines), 7)
+        self.assertTrue(all('Erin Example' in line and ',approved,' in line for line in lines[1:]))
+        # Oldest first
+        self.assertEqual([line.split(',')[1] for line in lines[1:]], sorted(line.split(',')[1] for line in lines[1:]))
+
+    def test_pdf_report_and_size_limit(self):
+        job = self.job(self.submit(format='pdf')['jobId'])
+        self.assertEqual((job['status'], job['rows']), ('done', 10))
+        content = b''.join(self.client.get(job['downloadUrl']).streaming_content)
+        self.assertTrue(content.startswith(b'%PDF'))
+
+        with override_settings(REPORT_PDF_MAX_ROWS=5), self.assertLogs('core.reports', 'ERROR') as logs:
+            job = self.job(self.submit(format='pdf')['jobId'])
+        self.assertIn(f"Report job {job['id']} failed", logs.output[0])
+        self.assertEqual(job['status'], 'failed')
+        self.assertIn('use CSV', job['error'])
+        self.assertIsNone(job['downloadUrl'])
+
+    def test_reports_are_private_and_validated(self):
+        self.assertFalse(self.submit(format='xlsx')['success'])
+        self.assertFalse(self.submit(format='csv', filters={'from': 'yesterday'})['success'])
+
+        job_id = self.submit(format='csv')['jobId']
+        self.client.force_login(self.employee)
+        self.assertEqual(self.client.get(reverse('core:get_report_job', args=[job_id])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('core:download_report', args=[job_id])).status_code, 404)
+
+
+@override_settings(SESSION_ENGINE='core.sessions')
+class ExpenseRollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username='admin', email='admin@example.com', password='x', role='admin')
+        self.company = Company.objects.create(name='Acme', admin=self.admin, currency='EUR')
+        self.admin.company = self.company
+        self.admin.save(update_fields=['company'])
+        self.manager = User.objects.create_user(
+            username='manager', email='manager@example.com', password='x', role='manager', company=self.company
+        )
+        self.employee = User.objects.create_user(
+            username='employee', email='employee@example.com', password='x', first_name='Erin',
+            company=self.company, manager=self.manager
+        )
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='x', company=self.company)
+        self.today = timezone.localdate()
+        self.client.force_login(self.admin)
+
+    def expense(self, employee=None, amount='10', status='approved', category='travel', days_ago=0, currency='EUR', **fields):
+        return Expense.objects.create(
+            company=self.company, employee=employee or self.employee, title='Expense', amount=Decimal(amount),
+            currency=currency, status=status, category=category, date=self.today - timedelta(days=days_ago), **fields
+        )
+
+    def spend(self, **params):
+        return self.client.get(reverse('core:spend_analytics'), params).json()
+
+    def assertRollupsMatch(self):
+        self.assertEqual(rebuild_rollups(fix=False), [])
+
+    def test_rollups_follow_expense_changes(self):
+        expense = self.expense(amount='10', status='in_progress')
+        self.assertFalse(ExpenseRollup.objects.exclude(count=0).exists())
+
+        expense.status = 'approved'
+        expense.save()
+        self.expense(amount='5', converted_amount=Decimal('4.50'))
+        rollup = ExpenseRollup.objects.get()
+        self.assertEqual((rollup.total, rollup.count), (Decimal('14.50'), 2))
+
+        expense.category = 'meals'
+        expense.amount = Decimal('12')
+        expense.save()
+        self.assertEqual(
+            set(ExpenseRollup.objects.values_list('category', 'total', 'count')),
+            {('travel', Decimal('4.50'), 1), ('meals', Decimal('12'), 1)}
+        )
+        self.assertRollupsMatch()
+
+        expense.status = 'rejected'
+        expense.save(update_fields=['status'])
+        expense.delete()
+        Expense.objects.get().delete()
+        self.assertEqual(set(ExpenseRollup.objects.values_list('total', 'count')), {(Decimal('0'), 0)})
+        self.assertRollupsMatch()
+
+    def test_bulk_decisions_update_rollups(self):
+        ApprovalRule.objects.create(company=self.company, name='Managers')
+        submitted = process_approval_workflow_batch([
+            Expense(
+                company=self.company, employee=self.employee, title=f'E{i}', amount=Decimal('20'), currency='EUR',
+                status='draft'
+            )
+            for i in range(3)
+        ])
+        self.assertRollupsMatch()
+
+        self.client.force_login(self.manager)
+        self.client.post(
+            reverse('core:decide_approvals'),
+            json.dumps({'expenseIds': [expense.id for expense in submitted], 'decision': 'approve'}),
+            content_type='application/json'
+        )
+        self.assertEqual(ExpenseRollup.objects.get().total, Decimal('60'))
+        self.assertRollupsMatch()
+
+    def test_bulk_rollup_writes_do_not_depend_on_batch_size(self):
+        def batch(count):
+            return [
+                Expense(
+                    company=self.company, employee=self.employee, title=f'E{i}', amount=Decimal('5'), currency='EUR',
+                    status='draft', date=self.today - timedelta(days=i)
+                )
+                for i in range(count)
+            ]
+
+        # Warm the rule index
+        process_approval_workflow_batch(batch(1))
+        # savepoint, expenses insert, expenses update, rollups upsert, release savepoint
+        with self.assertNumQueries(5):
+            process_approval_workflow_batch(batch(2))
+        with self.assertNumQueries(5):
+            process_approval_workflow_batch(batch(40))
+        self.assertEqual(ExpenseRollup.objects.get(day=self.today).count, 3)
+        self.assertRollupsMatch()
+
+    def test_spend_api_answers_ranges_from_rollups(self):
+        self.expense(amount='10', category='travel')
+        self.expense(amount='15', category='meals', days_ago=1)
+        self.expense(employee=self.other, amount='7', category='meals', days_ago=3)
+        self.expense(amount='99', days_ago=60)
+        self.expense(amount='1000', status='rejected')
+
+        # user, company, rollups, unconverted count
+        with self.assertNumQueries(4):
+            result = self.spend(group='category')
+        self.assertEqual((result['currency'], result['total'], result['count']), ('EUR', '32.00', 3))
+        self.assertEqual(
+            [(row['key'], row['label'], row['total']) for row in result['series']],
+            [('meals', 'Meals & Entertainment', '22.00'), ('travel', 'Travel', '10.00')]
+        )
+
+        result = self.spend(group='day', **{'from': (self.today - timedelta(days=1)).isoformat()})
+        self.assertEqual([row['count'] for row in result['series']], [1, 1])
+        result = self.spend(group='month', **{'from': (self.today - timedelta(days=90)).isoformat()})
+        self.assertEqual(sum(Decimal(row['total']) for row in result['series']), Decimal('131'))
+
+        self.client.force_login(self.manager)
+        team = self.spend(group='employee')['series']
+        self.assertEqual([(row['key'], row['label']) for row in team], [(self.employee.id, 'Erin')])
+
+        self.assertFalse(self.spend(group='year')['success'])
+        self.assertFalse(self.spend(**{'from': 'last week'})['success'])
+
+    def test_foreign_currency_spend_is_converted_or_reported(self):
+        ExchangeRateTable.objects.create(base='USD', rates={'USD': '1', 'EUR': '0.5'}, source='file')
+        self.expense(amount='10')
+        self.expense(amount='30', currency='USD')
+        self.expense(amount='5000', currency='JPY')
+
+        result = self.spend(group='category')
+        self.assertEqual((result['total'], result['count'], result['unconverted']), ('25.00', 2, 1))
+        self.assertRollupsMatch()
+
+        # Once JPY has a rate, converting the stored expense brings it into the rollups
+        ExchangeRateTable.objects.create(base='USD', rates={'USD': '1', 'EUR': '0.5', 'JPY': '100'}, source='file')
+        cache.clear()
+        self.assertEqual(convert_stored_expenses(), 1)
+        result = self.spend(group='category')
+        self.assertEqual((result['total'], result['count'], result['unconverted']), ('50.00', 3, 0))
+        self.assertRollupsMatch()
+
+    def test_rebuild_repairs_drift(self):
+        self.expense(amount='10')
+        Expense.objects.filter(status='approved').update(amount=Decimal('11'), converted_amount=Decimal('11'))
+        [(key, stored, actual)] = rebuild_rollups(fix=False)
+        self.assertEqual((stored, actual), ((Decimal('10'), 1), (Decimal('11'), 1)))
+
+        call_command('rebuild_expense_rollups', stdout=StringIO())
+        self.assertRollupsMatch()
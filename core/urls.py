@@ -22,8 +22,27 @@ urlpatterns = [
     path('api/core/', views.get_company_data, name='get_company'),
     path('api/core/update/', views.update_company, name='update_company'),
     path('api/users/', views.get_users_data, name='get_users'),
+    path('api/users/sync/', views.sync_users, name='sync_users'),
     path('api/users/create/', views.create_user, name='create_user'),
+    path('api/users/import/', views.import_users_view, name='import_users'),
     path('api/users/<int:user_id>/update/', views.update_user, name='update_user'),
     path('api/users/<int:user_id>/delete/', views.delete_user, name='delete_user'),
+    path('api/users/<int:user_id>/hierarchy/', views.get_user_hierarchy, name='get_user_hierarchy'),
+    path('api/expenses/', views.get_expenses_data, name='get_expenses'),
+    path('api/approvals/inbox/', views.get_approval_inbox, name='approval_inbox'),
+    path('api/approvals/decide/', views.decide_approvals, name='decide_approvals'),
     path('api/stats/', views.get_dashboard_stats, name='get_stats'),
+    path('api/analytics/spend/', views.get_spend_analytics, name='spend_analytics'),
+    path('api/metrics/', views.metrics_view, name='metrics'),
+    
+    # Receipt OCR
+    path('api/ocr/submit/', views.submit_ocr_job, name='submit_ocr_job'),
+    path('api/ocr/<int:job_id>/', views.get_ocr_job, name='get_ocr_job'),
+    path('api/ocr/bulk/', views.submit_receipt_batch, name='submit_receipt_batch'),
+    path('api/ocr/batches/<int:batch_id>/', views.get_receipt_batch, name='get_receipt_batch'),
+    
+    # Expense reports
+    path('api/reports/', views.submit_report, name='submit_report'),
+    path('api/reports/<int:job_id>/', views.get_report_job, name='get_report_job'),
+    path('api/reports/<int:job_id>/download/', views.download_report, name='download_report'),
 ]
\ No newline at end of file
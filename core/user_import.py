@@ -0,0 +1,241 @@
+import csv
+import io
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models.functions import Lower
+
+IMPORT_FIELDS = ('email', 'name', 'role', 'password', 'manager')
+IMPORT_ROLES = ('employee', 'manager')
+INSERT_BATCH_SIZE = 500
+USERNAME_MAX_LENGTH = 150
+
+
+class UserImportError(Exception):
+    pass
+
+
+def parse_import_file(content, filename=''):
+    """Read import rows from CSV or JSON text (a list, or an object with a "users" list)"""
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+
+    if filename.lower().endswith('.json') or content.lstrip()[:1] in ('[', '{'):
+        data = json.loads(content)
+        rows = data.get('users') if isinstance(data, dict) else data
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise UserImportError('JSON imports must be a list of user objects')
+        return rows
+
+    return list(csv.DictReader(io.StringIO(content)))
+
+
+def hash_passwords(passwords, workers=None):
+    """PBKDF2-hash passwords across a process pool; blank ones become unusable passwords"""
+    workers = settings.USER_IMPORT_WORKERS if workers is None else workers
+    passwords = [password or None for password in passwords]
+    if workers <= 1 or len(passwords) < 2:
+        return [make_password(password) for password in passwords]
+
+    chunksize = max(len(passwords) // (workers * 4), 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(make_password, passwords, chunksize=chunksize))
+
+
+def _clean_row(row):
+    cleaned = {field: str(row.get(field) or '').strip() for field in IMPORT_FIELDS}
+    cleaned['email'] = cleaned['email'].lower()
+    cleaned['manager'] = cleaned['manager'].lower()
+    cleaned['role'] = cleaned['role'].lower() or 'employee'
+    # Passwords are taken verbatim
+    cleaned['password'] = str(row.get('password') or '')
+    return cleaned
+
+
+def _validate_rows(rows):
+    """Check each row on its own and against the rest of the batch; returns (valid rows, errors)"""
+    valid, errors = [], []
+    seen = set()
+    for number, row in enumerate(rows, start=1):
+        row = _clean_row(row)
+        row['row'] = number
+        try:
+            validate_email(row['email'])
+        except ValidationError:
+            errors.append({'row': number, 'email': row['email'], 'message': 'Invalid email'})
+            continue
+        if not row['name']:
+            message = 'Name is required'
+        elif row['role'] not in IMPORT_ROLES:
+            message = f"Role must be one of {', '.join(IMPORT_ROLES)}"
+        elif row['email'] in seen:
+            message = 'Duplicate email in this import'
+        elif row['manager'] == row['email']:
+            message = 'A user cannot manage themselves'
+        else:
+            seen.add(row['email'])
+            valid.append(row)
+            continue
+        errors.append({'row': number, 'email': row['email'], 'message': message})
+
+    looped = _looped_emails({row['email']: row['manager'] for row in valid})
+    for row in [row for row in valid if row['email'] in looped]:
+        valid.remove(row)
+        errors.append({'row': row['row'], 'email': row['email'], 'message': 'Manager chain loops back to this user'})
+    return valid, errors
+
+
+def _looped_emails(manager_of):
+    """Emails whose chain of managers within the batch leads back to themselves"""
+    looped, done = set(), set()
+    for email in manager_of:
+        # Insertion-ordered, so the loop is the tail of the path from where it closes
+        path = {}
+        current = email
+        while current in manager_of and current not in done and current not in path:
+            path[current] = len(path)
+            current = manager_of[current]
+        if current in path:
+            looped.update(list(path)[path[current]:])
+        done.update(path)
+    return looped
+
+
+def _username_options(email, attempt):
+    local = email.split('@')[0]
+    options = [local, email] if attempt == 0 else [f'{local}{attempt + 1}']
+    return [option[:USERNAME_MAX_LENGTH] for option in options]
+
+
+def _assign_usernames(rows):
+    """Give each row a free username: the email's local part like create_user, then the full email, then a numbered local part"""
+    from .models import User
+
+    claimed = set()
+    pending, attempt = rows, 0
+    while pending:
+        options = [_username_options(row['email'], attempt) for row in pending]
+        taken = set(User.objects.filter(
+            username__in={option for row_options in options for option in row_options}
+        ).values_list('username', flat=True))
+        left = []
+        for row, row_options in zip(pending, options):
+            free = next((option for option in row_options if option not in taken and option not in claimed), None)
+            if free is None:
+                left.append(row)
+                continue
+            row['username'] = free
+            claimed.add(free)
+        pending, attempt = left, attempt + 1
+
+
+def import_users(company, rows, workers=None):
+    """Create many users for a company in one pass.
+
+    The batch is checked against existing emails (case-insensitively),
+    usernames and managers with one query each. Passwords are hashed in a
+    process pool (see USER_IMPORT_WORKERS). Rows go in with bulk_create, and managers can be
+    existing company managers or other rows of the same import, referenced
+    by email. Invalid rows are skipped and reported:
+    {'created': [users], 'errors': [{'row', 'email', 'message'}]}.
+    """
+    from .models import User
+    from .approvals import invalidate_routing_table
+    from .counters import adjust_counters
+    from .hierarchy import link_new_users
+    from .utils import touch_users
+
+    if len(rows) > settings.USER_IMPORT_MAX_ROWS:
+        raise UserImportError(f"Imports are limited to {settings.USER_IMPORT_MAX_ROWS} rows")
+
+    rows, errors = _validate_rows(rows)
+
+    # Row emails are lowercased; match existing ones whatever their case
+    taken_emails = set(User.objects.annotate(email_lower=Lower('email')).filter(
+        email_lower__in=[row['email'] for row in rows]
+    ).values_list('email_lower', flat=True))
+
+    existing_managers = {
+        email: user_id
+        for email, user_id in User.objects.annotate(email_lower=Lower('email')).filter(
+            company=company,
+            role='manager',
+            email_lower__in={row['manager'] for row in rows if row['manager']}
+        ).values_list('email_lower', 'id')
+    }
+    batch_managers = {row['email'] for row in rows if row['role'] == 'manager' and row['email'] not in taken_emails}
+
+    accepted = []
+    for row in rows:
+        if row['email'] in taken_emails:
+            message = 'Email already exists'
+        elif row['manager'] and row['manager'] not in existing_managers and row['manager'] not in batch_managers:
+            message = f"Manager {row['manager']} is not a manager in this company or this import"
+        else:
+            accepted.append(row)
+            continue
+        errors.append({'row': row['row'], 'email': row['email'], 'message': message})
+
+    # Rows pointing at a rejected in-batch manager are rejected too, until nothing changes
+    while True:
+        emails = {row['email'] for row in accepted}
+        rejected = [
+            row for row in accepted
+            if row['manager'] and row['manager'] not in existing_managers and row['manager'] not in emails
+        ]
+        if not rejected:
+            break
+        for row in rejected:
+            accepted.remove(row)
+            errors.append({'row': row['row'], 'email': row['email'], 'message': f"Manager {row['manager']} was not imported"})
+
+    if not accepted:
+        errors.sort(key=lambda error: error['row'])
+        return {'created': [], 'errors': errors}
+
+    _assign_usernames(accepted)
+    hashes = hash_passwords([row['password'] for row in accepted], workers)
+
+    users = []
+    for row, password in zip(accepted, hashes):
+        names = row['name'].split()
+        users.append(User(
+            username=row['username'],
+            email=row['email'],
+            password=password,
+            first_name=names[0],
+            last_name=' '.join(names[1:]),
+            role=row['role'],
+            company=company,
+            manager_id=existing_managers.get(row['manager'])
+        ))
+
+    with transaction.atomic():
+        User.objects.bulk_create(users, batch_size=INSERT_BATCH_SIZE)
+
+        ids = {user.email: user.id for user in users}
+        linked = []
+        for row, user in zip(accepted, users):
+            if row['manager'] and user.manager_id is None:
+                user.manager_id = ids[row['manager']]
+                linked.append(user)
+        User.objects.bulk_update(linked, ['manager'], batch_size=INSERT_BATCH_SIZE)
+        link_new_users(users)
+
+        # bulk_create skips the signals that keep these up to date; adjusting the counters also bumps the company version
+        adjust_counters(
+            company.id,
+            users=len(users),
+            employees=sum(user.role == 'employee' for user in users),
+            managers=sum(user.role == 'manager' for user in users)
+        )
+        touch_users({user.manager_id for user in users} & set(existing_managers.values()))
+        invalidate_routing_table(company.id)
+
+    errors.sort(key=lambda error: error['row'])
+    return {'created': users, 'errors': errors}
@@ -1,6 +1,18 @@
+import logging
 import requests
+from collections import Counter
 from decimal import Decimal
 from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, prefetch_related_objects
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from .approvals import adjust_pending_count, get_rule_index, route_approver, step_approver
+from .counters import adjust_counters, rebuild_counters
+from .exchange_rates import convert_expenses, get_exchange_rate
+from .rollups import add_expenses_to_rollups
+
+logger = logging.getLogger(__name__)
 
 def get_countries_with_currencies():
     """Fetch countries and their currencies from REST Countries API"""
@@ -32,46 +44,140 @@ def get_countries_with_currencies():
         print(f"Error fetching countries: {e}")
         return []
 
-def convert_currency(amount, from_currency, to_currency):
-    """Convert currency using exchange rate API"""
-    if from_currency == to_currency:
-        return amount
+def get_user_company(user):
+    """Get the company a user belongs to (admins may only own it)"""
+    from .models import Company
     
-    cache_key = f'exchange_rate_{from_currency}_{to_currency}'
-    cached_rate = cache.get(cache_key)
+    if user.company_id:
+        return user.company
+    company = Company.objects.filter(admin=user).first()
+    if company is not None:
+        # Remember it on the instance so repeated lookups in a request are free
+        user.company = company
+    return company
+
+def get_user_stats(company):
+    """Get a company's user counts from its counters row.
+
+    Read from the database on every call: it is a single primary-key
+    lookup, and a per-process cache could serve stale counts under the
+    fresh ETag get_company_version hands out.
+    """
+    from .models import CompanyCounters
     
-    if cached_rate:
-        return Decimal(str(amount)) * Decimal(str(cached_rate))
+    counters = CompanyCounters.objects.filter(company=company).first()
+    if counters is None:
+        rebuild_counters([company.id])
+        counters = CompanyCounters.objects.get(company=company)
     
-    try:
-        response = requests.get(f'https://api.exchangerate-api.com/v4/latest/{from_currency}', timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        if to_currency in data['rates']:
-            rate = data['rates'][to_currency]
-            cache.set(cache_key, rate, 3600)  # Cache for 1 hour
-            return Decimal(str(amount)) * Decimal(str(rate))
-    except Exception as e:
-        print(f"Currency conversion error: {e}")
+    return {
+        'employees': counters.employees,
+        'managers': counters.managers,
+        'total': counters.users,
+        'pendingApprovals': counters.pending_approvals
+    }
+
+def get_company_version(company_id):
+    """Get the company's (version, last change time) from its counters row, used for ETag/Last-Modified.
+
+    Read from the database on every call, so every process sees a change
+    as soon as the transaction that made it commits.
+    """
+    from .models import CompanyCounters
     
-    return amount
+    version = CompanyCounters.objects.filter(company_id=company_id).values_list('version', 'updated_at').first()
+    if version is None:
+        rebuild_counters([company_id])
+        version = CompanyCounters.objects.filter(company_id=company_id).values_list('version', 'updated_at').get()
+    return version
 
-def get_applicable_approval_rule(company, amount):
-    """Get the applicable approval rule for an expense"""
-    from .models import ApprovalRule
+def bump_company_version(company_id):
+    """Mark a company's users, settings or stats as changed so clients refetch them.
+
+    Call it inside the transaction making the change; the bump commits or
+    rolls back with it.
+    """
+    from .models import CompanyCounters
     
-    rules = ApprovalRule.objects.filter(
-        company=company,
-        is_active=True
-    ).order_by('-min_amount')
+    CompanyCounters.objects.filter(company_id=company_id).update(version=F('version') + 1, updated_at=timezone.now())
+
+def touch_users(user_ids):
+    """Bump updated_at on users whose API representation changed without a save()"""
+    from .models import User
+    
+    user_ids = list(user_ids)
+    if user_ids:
+        User.objects.filter(id__in=user_ids).update(updated_at=timezone.now())
+
+EXPENSE_FILTERS = ('status', 'category', 'employee', 'from', 'to', 'min', 'max')
+
+def visible_to(queryset, user, company):
+    """Narrow rows with company and employee fields to what the user may see.
+
+    Admins see the whole company, managers their own rows and their whole
+    team's, employees their own.
+    """
+    queryset = queryset.filter(company=company)
+    if user.role == 'admin' or company.admin_id == user.id:
+        return queryset
+    if user.role == 'manager':
+        # The closure table links every user to itself at depth 0
+        return queryset.filter(employee__ancestor_links__ancestor=user)
+    return queryset.filter(employee=user)
+
+def visible_expenses(user, company):
+    from .models import Expense
+    
+    return visible_to(Expense.objects.all(), user, company)
+
+def parse_amount(value):
+    """Parse an amount from a query string or cursor; None for NaN and infinities, which no amount can match"""
+    amount = Decimal(value)
+    return amount if amount.is_finite() else None
+
+def filter_expenses(expenses, params):
+    """Apply the expense list filters (status (comma-separated), category, employee, from, to, min, max).
+
+    params is request.GET or a plain dict; raises ValueError for values that do not parse.
+    """
+    params = {name: str(params.get(name) or '') for name in EXPENSE_FILTERS}
+    statuses = [status for status in params['status'].split(',') if status]
+    if statuses:
+        expenses = expenses.filter(status__in=statuses)
+    if params['category']:
+        expenses = expenses.filter(category=params['category'])
+    if params['employee']:
+        expenses = expenses.filter(employee_id=int(params['employee']))
+    
+    for param, lookup, parse in (
+        ('from', 'date__gte', parse_date), ('to', 'date__lte', parse_date),
+        ('min', 'amount__gte', parse_amount), ('max', 'amount__lte', parse_amount),
+    ):
+        if params[param]:
+            try:
+                value = parse(params[param])
+            except ArithmeticError:
+                value = None
+            if value is None:
+                raise ValueError(f'Invalid {param}')
+            expenses = expenses.filter(**{lookup: value})
+    return expenses
+
+def convert_currency(amount, from_currency, to_currency):
+    """Convert currency using the locally stored exchange rate table"""
+    if from_currency == to_currency:
+        return amount
     
-    for rule in rules:
-        if rule.min_amount is None or amount >= rule.min_amount:
-            if rule.max_amount is None or amount <= rule.max_amount:
-                return rule
+    rate = get_exchange_rate(from_currency, to_currency)
+    if rate is None:
+        logger.warning("No exchange rate for %s -> %s; amount left unconverted", from_currency, to_currency)
+        return amount
     
-    return None
+    return Decimal(str(amount)) * rate
+
+def get_applicable_approval_rule(company, amount):
+    """Get the applicable approval rule for an expense from the cached rule index"""
+    return get_rule_index(company.id).lookup(amount)
 
 def process_approval_workflow(expense):
     """Process the approval workflow for an expense"""
@@ -84,8 +190,8 @@ def process_approval_workflow(expense):
         expense.save()
         return
     
-    # Get approval steps
-    steps = rule.steps.all().order_by('step_number')
+    # Get approval steps (prefetched with the rule index, ordered by step_number)
+    steps = rule.steps.all()
     
     if rule.is_manager_approver and expense.employee.manager:
         # First approval is by manager
@@ -100,7 +206,7 @@ def process_approval_workflow(expense):
     elif steps.exists():
         # Start with first step in the rule
         first_step = steps.first()
-        approver = first_step.approver or get_approver_by_role(expense.company, first_step.approver_role)
+        approver = step_approver(expense.company_id, first_step)
         
         if approver:
             ExpenseApproval.objects.create(
@@ -115,8 +221,149 @@ def process_approval_workflow(expense):
     expense.status = 'in_progress'
     expense.save()
 
+def process_approval_workflow_batch(expenses):
+    """Process the approval workflow for many expenses at once.
+
+    Rules and approvers come from the cached per-company indexes, employees
+    and companies are loaded with a single query each when not already
+    attached, and all approvals and expenses are written with one
+    bulk_create and one bulk_update inside a single transaction, so the
+    number of queries does not grow with the batch size. Unsaved expenses
+    are inserted first, and expenses without a converted_amount get one.
+    """
+    from .models import Expense, ExpenseApproval
+    
+    expenses = list(expenses)
+    if not expenses:
+        return expenses
+    
+    now = timezone.now()
+    approvals = []
+    
+    with transaction.atomic():
+        unsaved = [expense for expense in expenses if expense.pk is None]
+        if unsaved:
+            Expense.objects.bulk_create(unsaved)
+        
+        prefetch_related_objects(expenses, 'employee', 'company')
+        # Bulk writes skip the pre_save signal that fills this in
+        convert_expenses([expense for expense in expenses if expense.converted_amount is None])
+        
+        for expense in expenses:
+            rule = get_rule_index(expense.company_id).lookup(expense.converted_amount or expense.amount)
+            expense.updated_at = now
+            
+            if not rule:
+                expense.status = 'approved'
+                continue
+            
+            steps = rule.steps.all()
+            manager_id = expense.employee.manager_id
+            
+            if rule.is_manager_approver and manager_id:
+                approvals.append(ExpenseApproval(expense=expense, approver_id=manager_id, step_number=0))
+                expense.current_approver_id = manager_id
+                expense.current_step = 0
+            elif steps:
+                first_step = steps[0]
+                approver = step_approver(expense.company_id, first_step)
+                
+                if approver:
+                    approvals.append(ExpenseApproval(expense=expense, approver=approver, step_number=1))
+                    expense.current_approver = approver
+                    expense.current_step = 1
+            
+            expense.status = 'in_progress'
+        
+        ExpenseApproval.objects.bulk_create(approvals)
+        Expense.objects.bulk_update(expenses, ['status', 'current_approver', 'current_step', 'converted_amount', 'updated_at'])
+        
+        for company_id, count in Counter(approval.expense.company_id for approval in approvals).items():
+            adjust_counters(company_id, pending_approvals=count)
+        # Expenses no rule applies to are approved on the spot
+        add_expenses_to_rollups(expense for expense in expenses if expense.status == 'approved')
+    
+    # bulk_create skips the post_save signals that normally maintain these
+    for approver_id, count in Counter(approval.approver_id for approval in approvals).items():
+        adjust_pending_count(approver_id, count)
+    
+    return expenses
+
+def _next_step(expense):
+    """The step after the expense's current one and its approver, or (None, None) when none is left"""
+    rule = get_rule_index(expense.company_id).lookup(expense.converted_amount or expense.amount)
+    if not rule:
+        return None, None
+    
+    # The manager step is step 0; rule steps are numbered from 1
+    for step in rule.steps.all():
+        if step.step_number <= expense.current_step:
+            continue
+        approver = step_approver(expense.company_id, step)
+        if approver:
+            return step, approver
+    return None, None
+
+def decide_expenses(approver, expense_ids, decision, comments=''):
+    """Approve or reject many expenses waiting on one approver in a single transaction.
+
+    Only expenses whose current approver is `approver` are touched; the
+    rest are returned as skipped. Approvals move the expense to the next
+    step of its rule (or approve it after the last one), rejections end the
+    workflow. Approvals are written with one update, one bulk_create and
+    one bulk_update, so the query count does not grow with the batch.
+    Returns {'decided': [ids], 'skipped': [ids]}.
+    """
+    from .models import Expense, ExpenseApproval
+    
+    if decision not in ('approve', 'reject'):
+        raise ValueError("Decision must be 'approve' or 'reject'")
+    
+    expense_ids = list(dict.fromkeys(expense_ids))
+    now = timezone.now()
+    next_approvals = []
+    
+    with transaction.atomic():
+        expenses = list(
+            Expense.objects.select_for_update()
+            .filter(id__in=expense_ids, current_approver=approver, status='in_progress')
+        )
+        if not expenses:
+            return {'decided': [], 'skipped': expense_ids}
+        
+        decided = ExpenseApproval.objects.filter(
+            expense__in=expenses, approver=approver, status='pending'
+        ).update(status='approved' if decision == 'approve' else 'rejected', comments=comments, updated_at=now)
+        
+        for expense in expenses:
+            expense.updated_at = now
+            step, next_approver = _next_step(expense) if decision == 'approve' else (None, None)
+            if step:
+                next_approvals.append(ExpenseApproval(expense=expense, approver=next_approver, step_number=step.step_number))
+                expense.current_approver = next_approver
+                expense.current_step = step.step_number
+            else:
+                expense.status = 'approved' if decision == 'approve' else 'rejected'
+                expense.current_approver = None
+        
+        ExpenseApproval.objects.bulk_create(next_approvals)
+        Expense.objects.bulk_update(expenses, ['status', 'current_approver', 'current_step', 'updated_at'])
+        
+        pending = Counter(approval.expense.company_id for approval in next_approvals)
+        pending.subtract(expense.company_id for expense in expenses)
+        for company_id, delta in pending.items():
+            if delta:
+                adjust_counters(company_id, pending_approvals=delta)
+        add_expenses_to_rollups(expense for expense in expenses if expense.status == 'approved')
+    
+    # bulk writes skip the ExpenseApproval signals that normally maintain these
+    adjust_pending_count(approver.id, -decided)
+    for approver_id, count in Counter(approval.approver_id for approval in next_approvals).items():
+        adjust_pending_count(approver_id, count)
+    
+    ids = {expense.id for expense in expenses}
+    return {'decided': sorted(ids), 'skipped': [expense_id for expense_id in expense_ids if expense_id not in ids]}
+
 def get_approver_by_role(company, role):
-    """Get an approver by role"""
-    from .models import User
-    users = User.objects.filter(company=company, role=role)
-    return users.first() if users.exists() else None
\ No newline at end of file
+    """Get an approver by role from the cached routing table"""
+    return route_approver(company.id, role)
\ No newline at end of file
@@ -1,13 +1,73 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_exempt
-from django.db.models import Q, Count
-from .models import User, Company, ContactMessage
+from django.views.decorators.http import condition
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.db import transaction
+from django.db.models import Q, Count, Sum
+from django.db.models.functions import TruncMonth
+from .models import User, Company, ContactMessage, Expense, ExpenseRollup, OCRJob, ReceiptBatch, ReportJob, UserTombstone
 from .forms import RegistrationForm, LoginForm, UserForm, CompanyForm, ContactForm
+from .ocr_cache import hash_upload
+from .ocr_queue import enqueue_ocr_job
+from .exchange_rates import CENT
+from .hierarchy import ancestors, descendants
+from .metrics import render_metrics
+from .receipt_ingest import ingest_receipts, get_batch_progress
+from .reports import enqueue_report_job
+from .rollups import ROLLUP_STATUSES
+from .user_import import import_users, parse_import_file
+from .approvals import get_pending_counts
+from .utils import (
+    EXPENSE_FILTERS, decide_expenses, filter_expenses, get_company_version, get_user_company, get_user_stats,
+    parse_amount, visible_expenses, visible_to
+)
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+import base64
+import hashlib
+import hmac
 import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _company_version(request):
+    """The (company id, version, last change time) triple behind the read APIs' validators"""
+    if not hasattr(request, '_company_version'):
+        company = get_user_company(request.user)
+        request._company_version = (company.id, *get_company_version(company.id)) if company else None
+    return request._company_version
+
+
+def _company_etag(request, *args, **kwargs):
+    version = _company_version(request)
+    if version is None:
+        return None
+    # Query strings select different pages/filters, and payloads differ per user
+    path = hashlib.sha1(request.get_full_path().encode()).hexdigest()[:16]
+    return f"{version[0]}-{request.user.id}-{version[1]}-{path}"
+
+
+def _company_last_modified(request, *args, **kwargs):
+    version = _company_version(request)
+    if version is None:
+        return None
+    return version[2]
+
+
+def company_conditional(view):
+    """Answer unchanged reads with 304 before the payload is built; browsers revalidate every time"""
+    view = condition(etag_func=_company_etag, last_modified_func=_company_last_modified)(view)
+    return cache_control(private=True, no_cache=True)(view)
 
 
 def index(request):
@@ -32,21 +92,24 @@ def register_view(request):
                     'message': 'Username or email already exists!'
                 })
             
-            # Create admin user
-            user = User.objects.create_user(
-                username=username,
-                email=email,
-                password=password,
-                role='admin',
-                first_name=username
-            )
+            with transaction.atomic():
+                # Create admin user
+                user = User.objects.create_user(
+                    username=username,
+                    email=email,
+                    password=password,
+                    role='admin',
+                    first_name=username
+                )
             
-            # Create company
-            company = Company.objects.create(
-                name=f"{username}'s Company",
-                currency=currency,
-                admin=user
-            )
+                # Create company
+                company = Company.objects.create(
+                    name=f"{username}'s Company",
+                    currency=currency,
+                    admin=user
+                )
+                user.company = company
+                user.save(update_fields=['company'])
             
             # Login user
             login(request, user)
@@ -142,25 +205,30 @@ def dashboard_view(request):
     try:
         company = Company.objects.get(admin=request.user)
     except Company.DoesNotExist:
-        # Create company if doesn't exist
-        company = Company.objects.create(
-            name=f"{request.user.username}'s Company",
-            currency='USD',
-            admin=request.user
-        )
+        with transaction.atomic():
+            # Create company if doesn't exist
+            company = Company.objects.create(
+                name=f"{request.user.username}'s Company",
+                currency='USD',
+                admin=request.user
+            )
+            request.user.company = company
+            request.user.save(update_fields=['company'])
     
+    stats = get_user_stats(company)
     context = {
         'company': company,
-        'total_employees': User.objects.filter(role='employee').count(),
-        'total_managers': User.objects.filter(role='manager').count(),
-        'total_users': User.objects.count(),
-        'recent_users': User.objects.all()[:5]
+        'total_employees': stats['employees'],
+        'total_managers': stats['managers'],
+        'total_users': stats['total'],
+        'recent_users': User.objects.filter(Q(company=company) | Q(id=company.admin_id))[:5]
     }
     
     return render(request, 'core/dashboard.html', context)
 
 
 @login_required
+@company_conditional
 def get_company_data(request):
     """Get company data as JSON"""
     try:
@@ -181,40 +249,268 @@ def get_company_data(request):
         })
 
 
+USERS_PAGE_SIZE = 50
+USERS_MAX_PAGE_SIZE = 200
+USERS_STREAM_CHUNK_SIZE = 2000
+USERS_SYNC_PAGE_SIZE = 500
+USERS_SYNC_LAG = timedelta(seconds=5)
+SYNC_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _encode_users_cursor(user):
+    """Encode a user's position in the (-created_at, -id) ordering"""
+    payload = json.dumps([user.created_at.isoformat(), user.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def _decode_users_cursor(cursor):
+    created_at, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    created_at = parse_datetime(created_at)
+    if created_at is None:
+        raise ValueError('Invalid cursor')
+    return created_at, int(user_id)
+
+
+def _company_users(company):
+    return User.objects.filter(Q(company=company) | Q(id=company.admin_id))
+
+
+def _serialize_user(user):
+    """Users API representation; expects select_related('manager') and the subordinate_count annotation"""
+    return {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'name': user.get_full_name() or user.username,
+        'role': user.role,
+        'managerId': user.manager.id if user.manager else None,
+        'managerName': user.manager.get_full_name() if user.manager else None,
+        'teamSize': user.subordinate_count if user.role == 'manager' else 0
+    }
+
+
+def _filter_users(request, company):
+    """Apply the users API filters (?role=, ?manager=, ?q=) to a company's users"""
+    users = _company_users(company)
+    
+    role = request.GET.get('role')
+    if role:
+        users = users.filter(role=role)
+    if request.GET.get('manager'):
+        users = users.filter(manager_id=int(request.GET['manager']))
+    search = request.GET.get('q', '').strip()
+    if search:
+        users = users.filter(
+            Q(username__icontains=search) |
+            Q(email__icontains=search) |
+            Q(first_name__icontains=search) |
+            Q(last_name__icontains=search)
+        )
+    return users.annotate(subordinate_count=Count('subordinates'))
+
+
+def _stream_users(users):
+    """Stream users as NDJSON, one object per line, without building the list in memory"""
+    rows = users.order_by('id').values(
+        'id', 'username', 'email', 'first_name', 'last_name', 'role', 'manager_id',
+        'manager__first_name', 'manager__last_name', 'subordinate_count'
+    ).iterator(chunk_size=USERS_STREAM_CHUNK_SIZE)
+    
+    def lines():
+        for row in rows:
+            name = f"{row['first_name']} {row['last_name']}".strip()
+            manager_name = f"{row['manager__first_name'] or ''} {row['manager__last_name'] or ''}".strip()
+            yield json.dumps({
+                'id': row['id'],
+                'username': row['username'],
+                'email': row['email'],
+                'name': name or row['username'],
+                'role': row['role'],
+                'managerId': row['manager_id'],
+                'managerName': manager_name if row['manager_id'] else None,
+                'teamSize': row['subordinate_count'] if row['role'] == 'manager' else 0
+            }) + '\n'
+    
+    return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+
+
 @login_required
+@company_conditional
 def get_users_data(request):
-    """Get all users data as JSON"""
-    users = User.objects.all().select_related('manager')
-    users_data = []
-    
-    for user in users:
-        users_data.append({
-            'id': user.id,
-            'username': user.username,
-            'email': user.email,
-            'name': user.get_full_name() or user.username,
-            'role': user.role,
-            'managerId': user.manager.id if user.manager else None,
-            'managerName': user.manager.get_full_name() if user.manager else None,
-            'teamSize': user.get_team_size()
+    """Get one page of the company's users as JSON.
+
+    Pages are keyset-paginated on (created_at, id): pass the returned
+    nextCursor back as ?cursor= to get the next page. Supports ?role=,
+    ?manager=<id>, ?q=<search> and ?limit=. Team sizes come from a single
+    annotated count, so each page costs the same number of queries.
+    With ?stream=1 every matching user is streamed as NDJSON instead.
+    """
+    company = get_user_company(request.user)
+    if company is None:
+        return JsonResponse({
+            'success': False,
+            'message': 'Company not found'
+        })
+    
+    try:
+        users = _filter_users(request, company)
+        if request.GET.get('stream'):
+            return _stream_users(users)
+        
+        limit = min(max(int(request.GET.get('limit', USERS_PAGE_SIZE)), 1), USERS_MAX_PAGE_SIZE)
+        cursor = request.GET.get('cursor')
+        position = _decode_users_cursor(cursor) if cursor else None
+    except (TypeError, ValueError):
+        return JsonResponse({
+            'success': False,
+            'message': 'Invalid pagination parameters'
+        })
+    
+    users = users.select_related('manager').order_by('-created_at', '-id')
+    if position:
+        created_at, user_id = position
+        users = users.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=user_id))
+    
+    # One extra row tells us whether another page exists
+    page = list(users[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+    
+    return JsonResponse({
+        'success': True,
+        'users': [_serialize_user(user) for user in page],
+        'nextCursor': _encode_users_cursor(page[-1]) if has_more else None
+    })
+
+
+def _encode_sync_cursor(users_position, tombstones_position):
+    payload = json.dumps([
+        [users_position[0].isoformat(), users_position[1]],
+        [tombstones_position[0].isoformat(), tombstones_position[1]]
+    ])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def _decode_sync_cursor(cursor):
+    positions = []
+    for timestamp, row_id in json.loads(base64.urlsafe_b64decode(cursor.encode())):
+        timestamp = parse_datetime(timestamp)
+        if timestamp is None:
+            raise ValueError('Invalid cursor')
+        positions.append((timestamp, int(row_id)))
+    return positions
+
+
+def _after(queryset, field, position):
+    timestamp, row_id = position
+    return queryset.filter(Q(**{f'{field}__gt': timestamp}) | Q(**{field: timestamp, 'id__gt': row_id}))
+
+
+@login_required
+def sync_users(request):
+    """Get the users changed and deleted since a sync cursor.
+
+    Without ?since= every user is returned (in pages) and deletions start
+    from now. Follow the returned cursor while hasMore is true, then keep
+    it for the next sync. Rows younger than USERS_SYNC_LAG are held back
+    so a transaction committing late cannot slip behind the cursor.
+    """
+    company = get_user_company(request.user)
+    if company is None:
+        return JsonResponse({
+            'success': False,
+            'message': 'Company not found'
+        })
+    
+    try:
+        limit = min(max(int(request.GET.get('limit', USERS_SYNC_PAGE_SIZE)), 1), USERS_SYNC_PAGE_SIZE)
+        since = request.GET.get('since')
+        if since:
+            users_position, tombstones_position = _decode_sync_cursor(since)
+        else:
+            latest = company.user_tombstones.order_by('-deleted_at', '-id').first()
+            users_position = (SYNC_EPOCH, 0)
+            tombstones_position = (latest.deleted_at, latest.id) if latest else (SYNC_EPOCH, 0)
+    except (TypeError, ValueError):
+        return JsonResponse({
+            'success': False,
+            'message': 'Invalid sync cursor'
         })
     
+    horizon = timezone.now() - USERS_SYNC_LAG
+    users = _after(_company_users(company), 'updated_at', users_position).filter(
+        updated_at__lt=horizon
+    ).select_related('manager').annotate(
+        subordinate_count=Count('subordinates')
+    ).order_by('updated_at', 'id')
+    tombstones = _after(company.user_tombstones.all(), 'deleted_at', tombstones_position).filter(
+        deleted_at__lt=horizon
+    ).order_by('deleted_at', 'id')
+    
+    # One extra row per stream tells us whether another page exists
+    changed = list(users[:limit + 1])
+    deleted = list(tombstones.values('id', 'user_id', 'deleted_at')[:limit + 1])
+    has_more = len(changed) > limit or len(deleted) > limit
+    changed, deleted = changed[:limit], deleted[:limit]
+    
+    if changed:
+        users_position = (changed[-1].updated_at, changed[-1].id)
+    if deleted:
+        tombstones_position = (deleted[-1]['deleted_at'], deleted[-1]['id'])
+    
     return JsonResponse({
         'success': True,
-        'users': users_data
+        'users': [_serialize_user(user) for user in changed],
+        'deleted': [tombstone['user_id'] for tombstone in deleted],
+        'cursor': _encode_sync_cursor(users_position, tombstones_position),
+        'hasMore': has_more
     })
 
 
 @login_required
+@company_conditional
 def get_dashboard_stats(request):
-    """Get dashboard statistics"""
+    """Get dashboard statistics for the user's company"""
+    company = get_user_company(request.user)
+    if company is None:
+        return JsonResponse({
+            'success': False,
+            'message': 'Company not found'
+        })
+    
     return JsonResponse({
         'success': True,
-        'stats': {
-            'employees': User.objects.filter(role='employee').count(),
-            'managers': User.objects.filter(role='manager').count(),
-            'total': User.objects.count()
+        'stats': get_user_stats(company)
+    })
+
+
+@login_required
+def get_user_hierarchy(request, user_id):
+    """Get a user's management chain and everyone under them (?depth= limits how far down)"""
+    company = get_user_company(request.user)
+    user = get_object_or_404(_company_users(company) if company else User.objects.none(), id=user_id)
+    
+    try:
+        max_depth = int(request.GET['depth']) if request.GET.get('depth') else None
+    except ValueError:
+        return JsonResponse({
+            'success': False,
+            'message': 'Invalid depth'
+        })
+    
+    def node(member):
+        return {
+            'id': member.id,
+            'name': member.get_full_name() or member.username,
+            'role': member.role,
+            'managerId': member.manager_id,
+            'depth': member.depth
         }
+    
+    return JsonResponse({
+        'success': True,
+        'ancestors': [node(member) for member in ancestors(user)],
+        'descendants': [node(member) for member in descendants(user, max_depth)]
     })
 
 
@@ -232,20 +528,22 @@ def create_user(request):
                     'message': 'Email already exists'
                 })
             
-            # Create user
-            user = User.objects.create_user(
-                username=data.get('email').split('@')[0],
-                email=data.get('email'),
-                password=data.get('password'),
-                first_name=data.get('name').split()[0],
-                last_name=' '.join(data.get('name').split()[1:]) if len(data.get('name').split()) > 1 else '',
-                role=data.get('role')
-            )
+            with transaction.atomic():
+                # Create user
+                user = User.objects.create_user(
+                    username=data.get('email').split('@')[0],
+                    email=data.get('email'),
+                    password=data.get('password'),
+                    first_name=data.get('name').split()[0],
+                    last_name=' '.join(data.get('name').split()[1:]) if len(data.get('name').split()) > 1 else '',
+                    role=data.get('role'),
+                    company=get_user_company(request.user)
+                )
             
-            # Set manager if provided
-            if data.get('managerId'):
-                user.manager = User.objects.get(id=data.get('managerId'))
-                user.save()
+                # Set manager if provided
+                if data.get('managerId'):
+                    user.manager = User.objects.get(id=data.get('managerId'))
+                    user.save()
             
             return JsonResponse({
                 'success': True,
@@ -267,6 +565,48 @@ def create_user(request):
     return JsonResponse({'success': False, 'message': 'Invalid request method'})
 
 
+@login_required
+def import_users_view(request):
+    """Bulk-create users from an uploaded CSV/JSON file or a JSON body of {"users": [...]}"""
+    if request.method == 'POST':
+        try:
+            if request.user.role != 'admin':
+                return JsonResponse({
+                    'success': False,
+                    'message': 'Admin privileges required'
+                })
+            
+            company = get_user_company(request.user)
+            if company is None:
+                return JsonResponse({
+                    'success': False,
+                    'message': 'Company not found'
+                })
+            
+            upload = request.FILES.get('file')
+            if upload:
+                rows = parse_import_file(upload.read(), upload.name)
+            else:
+                rows = parse_import_file(request.body)
+            
+            result = import_users(company, rows)
+            
+            return JsonResponse({
+                'success': True,
+                'message': f"{len(result['created'])} users imported",
+                'users': [{'id': user.id, 'email': user.email, 'role': user.role} for user in result['created']],
+                'errors': result['errors']
+            })
+            
+        except Exception as e:
+            return JsonResponse({
+                'success': False,
+                'message': str(e)
+            })
+    
+    return JsonResponse({'success': False, 'message': 'Invalid request method'})
+
+
 @login_required
 def update_user(request, user_id):
     """Update existing user"""
@@ -284,12 +624,13 @@ def update_user(request, user_id):
             if data.get('password'):
                 user.set_password(data.get('password'))
             
-            if data.get('managerId'):
-                user.manager = User.objects.get(id=data.get('managerId'))
-            else:
-                user.manager = None
+            with transaction.atomic():
+                if data.get('managerId'):
+                    user.manager = User.objects.get(id=data.get('managerId'))
+                else:
+                    user.manager = None
             
-            user.save()
+                user.save()
             
             return JsonResponse({
                 'success': True,
@@ -319,7 +660,12 @@ def delete_user(request, user_id):
                     'message': 'Cannot delete your own account'
                 })
             
-            user.delete()
+            with transaction.atomic():
+                company_id = user.company_id
+                user.delete()
+                # Lets delta syncs (api/users/sync/) drop the user on their side
+                if company_id is not None:
+                    UserTombstone.objects.create(company_id=company_id, user_id=user_id)
             
             return JsonResponse({
                 'success': True,
@@ -343,11 +689,12 @@ def update_company(request):
             data = json.loads(request.body)
             company = Company.objects.get(admin=request.user)
             
-            company.name = data.get('name')
-            company.currency = data.get('currency')
-            company.address = data.get('address', '')
-            company.phone = data.get('phone', '')
-            company.save()
+            with transaction.atomic():
+                company.name = data.get('name')
+                company.currency = data.get('currency')
+                company.address = data.get('address', '')
+                company.phone = data.get('phone', '')
+                company.save()
             
             return JsonResponse({
                 'success': True,
@@ -360,4 +707,467 @@ def update_company(request):
                 'message': str(e)
             })
     
-    return JsonResponse({'success': False, 'message': 'Invalid request method'})
\ No newline at end of file
+    return JsonResponse({'success': False, 'message': 'Invalid request method'})
+
+
+EXPENSES_PAGE_SIZE = 50
+EXPENSES_MAX_PAGE_SIZE = 200
+# ?sort= value -> (field, parser for the cursor's copy of it)
+EXPENSE_SORTS = {
+    'date': ('date', parse_date),
+    'amount': ('amount', parse_amount),
+    'created': ('created_at', parse_datetime),
+}
+
+
+def _encode_expenses_cursor(sort, expense):
+    """Encode an expense's position in the current sort order"""
+    field, _ = EXPENSE_SORTS[sort.lstrip('-')]
+    value = getattr(expense, field)
+    payload = json.dumps([sort, value.isoformat() if hasattr(value, 'isoformat') else str(value), expense.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def _decode_expenses_cursor(cursor, sort):
+    cursor_sort, value, expense_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if cursor_sort != sort:
+        raise ValueError('Cursor belongs to a different sort order')
+    _, parse = EXPENSE_SORTS[sort.lstrip('-')]
+    value = parse(value)
+    if value is None:
+        raise ValueError('Invalid cursor')
+    return value, int(expense_id)
+
+
+def _serialize_expense(expense):
+    """Expenses API representation; expects select_related('employee')"""
+    return {
+        'id': expense.id,
+        'title': expense.title,
+        'merchant': expense.merchant,
+        'amount': str(expense.amount),
+        'currency': expense.currency,
+        'convertedAmount': str(expense.converted_amount) if expense.converted_amount is not None else None,
+        'category': expense.category,
+        'date': expense.date.isoformat(),
+        'status': expense.status,
+        'employeeId': expense.employee_id,
+        'employeeName': expense.employee.get_full_name() or expense.employee.username,
+        'currentApproverId': expense.current_approver_id,
+        'createdAt': expense.created_at.isoformat()
+    }
+
+
+@login_required
+def get_expenses_data(request):
+    """Get one page of the expenses the user may see as JSON.
+
+    Filters: ?status= (comma-separated), ?category=, ?employee=<id>,
+    ?from=/?to= (dates) and ?min=/?max= (amounts). Sort with
+    ?sort=date|amount|created, prefixed with - for descending (default
+    -date). Pages are keyset-paginated on (sort key, id): pass nextCursor
+    back as ?cursor= with the same sort. Each page is a single query over
+    the (company, employee, status, date) indexes, however long the
+    history is.
+    """
+    company = get_user_company(request.user)
+    if company is None:
+        return JsonResponse({
+            'success': False,
+            'message': 'Company not found'
+        })
+    
+    sort = request.GET.get('sort', '-date')
+    if sort.lstrip('-') not in EXPENSE_SORTS:
+        return JsonResponse({
+            'success': False,
+            'message': f"Sort must be one of {', '.join(EXPENSE_SORTS)} (prefix - for descending)"
+        })
+    
+    try:
+        expenses = filter_expenses(visible_expenses(request.user, company), request.GET)
+        limit = min(max(int(request.GET.get('limit', EXPENSES_PAGE_SIZE)), 1), EXPENSES_MAX_PAGE_SIZE)
+        cursor = request.GET.get('cursor')
+        position = _decode_expenses_cursor(cursor, sort) if cursor else None
+    except (TypeError, ValueError, ArithmeticError):
+        return JsonResponse({
+            'success': False,
+            'message': 'Invalid filter or pagination parameters'
+        })
+    
+    field, _ = EXPENSE_SORTS[sort.lstrip('-')]
+    descending = sort.startswith('-')
+    order = '-' if descending else ''
+    expenses = expenses.select_related('employee').order_by(f'{order}{field}', f'{order}id')
+    if position:
+        value, expense_id = position
+        after = 'lt' if descending else 'gt'
+        expenses = expenses.filter(Q(**{f'{field}__{after}': value}) | Q(**{field: value, f'id__{after}': expense_id}))
+    
+    # One extra row tells us whether another page exists
+    page = list(expenses[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+    
+    return JsonResponse({
+        'success': True,
+        'expenses': [_serialize_expense(expense) for expense in page],
+        'nextCursor': _encode_expenses_cursor(sort, page[-1]) if has_more else None
+    })
+
+
+SPEND_DEFAULT_DAYS = 30
+SPEND_GROUPS = ('category', 'employee', 'month', 'day')
+
+
+@login_required
+def get_spend_analytics(request):
+    """Approved spend over a date range, grouped by category, employee, month or day.
+
+    Answered from the daily expense rollups rather than the expense rows,
+    in the company currency; 'unconverted' counts approved expenses left
+    out because their currency has no rate yet. Parameters: ?from=/?to= (dates, default the
+    last 30 days), ?group=, ?category= and ?employee=<id>. Visibility
+    follows the expense list.
+    """
+    company = get_user_company(request.user)
+    if company is None:
+        return JsonResponse({
+            'success': False,
+            'message': 'Company not found'
+        })
+    
+    group = request.GET.get('group', 'category')
+    if group not in SPEND_GROUPS:
+        return JsonResponse({
+            'success': False,
+            'message': f"Group must be one of {', '.join(SPEND_GROUPS)}"
+        })
+    
+    try:
+        end = parse_date(request.GET['to']) if request.GET.get('to') else timezone.localdate()
+        start = parse_date(request.GET['from']) if request.GET.get('from') else end - timedelta(days=SPEND_DEFAULT_DAYS - 1)
+        if start is None or end is None:
+            raise ValueError('Invalid date')
+        filters = {}
+        if request.GET.get('category'):
+            filters['category'] = request.GET['category']
+        if request.GET.get('employee'):
+            filters['employee_id'] = int(request.GET['employee'])
+    except (TypeError, ValueError):
+        return JsonResponse({
+            'success': False,
+            'message': 'Invalid filter parameters'
+        })
+    
+    rollups = visible_to(ExpenseRollup.objects.filter(day__range=(start, end), **filters), request.user, company)
+    # Approved expenses with no rate to the company currency yet stay out of the rollups; say how many
+    unconverted = visible_to(Expense.objects.filter(
+        status__in=ROLLUP_STATUSES, date__range=(start, end), converted_amount__isnull=True, **filters
+    ), request.user, company).count()
+    
+    if group == 'month':
+        rollups = rollups.annotate(month=TruncMonth('day'))
+    keys = {
+        'category': ['category'],
+        'employee': ['employee_id', 'employee__first_name', 'employee__last_name', 'employee__username'],
+        'month': ['month'],
+        'day': ['day'],
+    }[group]
+    rows = rollups.values(*keys).annotate(spend=Sum('total'), expenses=Sum('count')).filter(expenses__gt=0).order_by(keys[0])
+    
+    categories = dict(Expense.CATEGORY_CHOICES)
+    series = []
+    total = Decimal('0')
+    for row in rows:
+        if group == 'category':
+            key, label = row['category'], categories.get(row['category'], row['category'])
+        elif group == 'employee':
+            key = row['employee_id']
+            label = f"{row['employee__first_name']} {row['employee__last_name']}".strip() or row['employee__username']
+        else:
+            key = row[group].isoformat()
+            label = row[group].strftime('%b %Y') if group == 'month' else key
+        series.append({'key': key, 'label': label, 'total': str(row['spend'].quantize(CENT)), 'count': row['expenses']})
+        total += row['spend']
+    
+    return JsonResponse({
+        'success': True,
+        'currency': company.currency,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'group': group,
+        'total': str(total.quantize(CENT)),
+        'count': sum(row['count'] for row in series),
+        'unconverted': unconverted,
+        'series': series
+    })
+
+
+APPROVAL_BATCH_MAX = 500
+
+
+@login_required
+def get_approval_inbox(request):
+    """Get one page of the expenses waiting on the user's decision, oldest first.
+
+    Served from the (current_approver, status, created_at) index and
+    keyset-paginated like the expenses API (?cursor=, ?limit=).
+    pendingCount comes from the cached per-approver counts.
+    """
+    try:
+        limit = min(max(int(request.GET.get('limit', EXPENSES_PAGE_SIZE)), 1), EXPENSES_MAX_PAGE_SIZE)
+        cursor = request.GET.get('cursor')
+        position = _decode_expenses_cursor(cursor, 'created') if cursor else None
+    except (TypeError, ValueError):
+        return JsonResponse({
+            'success': False,
+            'message': 'Invalid pagination parameters'
+        })
+    
+    expenses = Expense.objects.filter(
+        current_approver=request.user, status='in_progress'
+    ).select_related('employee').order_by('created_at', 'id')
+    if position:
+        created_at, expense_id = position
+        expenses = expenses.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=expense_id))
+    
+    # One extra row tells us whether another page exists
+    page = list(expenses[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+    
+    return JsonResponse({
+        'success': True,
+        'expenses': [_serialize_expense(expense) for expense in page],
+        'pendingCount': get_pending_counts([request.user])[request.user.id],
+        'nextCursor': _encode_expenses_cursor('created', page[-1]) if has_more else None
+    })
+
+
+@login_required
+def decide_approvals(request):
+    """Approve or reject many expenses from the user's inbox in one transaction"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Invalid request method'})
+    
+    try:
+        data = json.loads(request.body)
+        expense_ids = [int(expense_id) for expense_id in data.get('expenseIds', [])]
+    except (TypeError, ValueError):
+        return JsonResponse({
+            'success': False,
+            'message': 'expenseIds must be a list of expense ids'
+        })
+    
+    if not expense_ids:
+        return JsonResponse({'success': False, 'message': 'No expenses selected'})
+    if len(expense_ids) > APPROVAL_BATCH_MAX:
+        return JsonResponse({
+            'success': False,
+            'message': f"At most {APPROVAL_BATCH_MAX} expenses can be decided at once"
+        })
+    
+    try:
+        result = decide_expenses(request.user, expense_ids, data.get('decision'), data.get('comments', ''))
+    except ValueError as e:
+        return JsonResponse({'success': False, 'message': str(e)})
+    except Exception as e:
+        logger.exception("Error deciding approvals")
+        return JsonResponse({'success': False, 'message': str(e)})
+    
+    verb = 'approved' if data.get('decision') == 'approve' else 'rejected'
+    return JsonResponse({
+        'success': True,
+        'message': f"{len(result['decided'])} expense(s) {verb}",
+        'decided': result['decided'],
+        'skipped': result['skipped']
+    })
+
+
+def metrics_view(request):
+    """Prometheus metrics for this process (staff users, or a bearer METRICS_TOKEN)"""
+    authorized = request.user.is_authenticated and request.user.is_staff
+    if settings.METRICS_TOKEN:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        authorized = authorized or hmac.compare_digest(supplied, settings.METRICS_TOKEN)
+    if not authorized:
+        return HttpResponseForbidden('Admin privileges required')
+    
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4')
+
+
+def _serialize_ocr_job(job):
+    return {
+        'id': job.id,
+        'status': job.status,
+        'text': job.text,
+        'data': job.result,
+        'timings': job.timings,
+        'error': job.error or None,
+        'createdAt': job.created_at.isoformat()
+    }
+
+
+@login_required
+def submit_ocr_job(request):
+    """Queue a receipt image for OCR and return the job id immediately"""
+    if request.method == 'POST':
+        try:
+            receipt = request.FILES.get('receipt')
+            if not receipt:
+                return JsonResponse({
+                    'success': False,
+                    'message': 'No receipt image uploaded'
+                })
+            
+            job = OCRJob.objects.create(
+                user=request.user,
+                image=receipt,
+                filename=receipt.name,
+                content_hash=hash_upload(receipt)
+            )
+            transaction.on_commit(lambda: enqueue_ocr_job(job))
+            
+            return JsonResponse({
+                'success': True,
+                'jobId': job.id,
+                'status': job.status
+            })
+            
+        except Exception as e:
+            return JsonResponse({
+                'success': False,
+                'message': str(e)
+            })
+    
+    return JsonResponse({'success': False, 'message': 'Invalid request method'})
+
+
+@login_required
+def get_ocr_job(request, job_id):
+    """Get the status and, once finished, the result of an OCR job"""
+    job = get_object_or_404(OCRJob, id=job_id, user=request.user)
+    return JsonResponse({
+        'success': True,
+        'job': _serialize_ocr_job(job)
+    })
+
+
+@login_required
+def submit_receipt_batch(request):
+    """Queue a ZIP archive and/or several receipt images for OCR as one batch"""
+    if request.method == 'POST':
+        try:
+            uploads = request.FILES.getlist('receipts')
+            if not uploads:
+                return JsonResponse({
+                    'success': False,
+                    'message': 'No receipts uploaded'
+                })
+            
+            batch = ingest_receipts(request.user, uploads)
+            
+            return JsonResponse({
+                'success': True,
+                'batchId': batch.id,
+                'accepted': batch.total_files,
+                'skipped': batch.skipped,
+                'skippedCount': batch.skipped_count
+            })
+            
+        except Exception as e:
+            return JsonResponse({
+                'success': False,
+                'message': str(e)
+            })
+    
+    return JsonResponse({'success': False, 'message': 'Invalid request method'})
+
+
+@login_required
+def get_receipt_batch(request, batch_id):
+    """Get per-file progress for a receipt batch"""
+    batch = get_object_or_404(ReceiptBatch, id=batch_id, user=request.user)
+    return JsonResponse({
+        'success': True,
+        'batch': get_batch_progress(batch)
+    })
+
+
+def _serialize_report_job(job):
+    return {
+        'id': job.id,
+        'format': job.format,
+        'filters': job.filters,
+        'status': job.status,
+        'rows': job.rows,
+        'error': job.error or None,
+        'downloadUrl': reverse('core:download_report', args=[job.id]) if job.status == 'done' else None,
+        'createdAt': job.created_at.isoformat()
+    }
+
+
+@login_required
+def submit_report(request):
+    """Queue a CSV or PDF expense report and return the job id immediately"""
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            company = get_user_company(request.user)
+            if company is None:
+                return JsonResponse({
+                    'success': False,
+                    'message': 'Company not found'
+                })
+            
+            report_format = data.get('format', 'csv')
+            if report_format not in dict(ReportJob.FORMAT_CHOICES):
+                return JsonResponse({
+                    'success': False,
+                    'message': 'Format must be csv or pdf'
+                })
+            
+            filters = {name: data['filters'][name] for name in EXPENSE_FILTERS if (data.get('filters') or {}).get(name)}
+            try:
+                # Build (not run) the query once so bad filters fail now rather than in the worker
+                filter_expenses(visible_expenses(request.user, company), filters)
+            except (TypeError, ValueError):
+                return JsonResponse({
+                    'success': False,
+                    'message': 'Invalid report filters'
+                })
+            
+            job = ReportJob.objects.create(user=request.user, company=company, format=report_format, filters=filters)
+            transaction.on_commit(lambda: enqueue_report_job(job))
+            
+            return JsonResponse({
+                'success': True,
+                'jobId': job.id,
+                'status': job.status
+            })
+            
+        except Exception as e:
+            return JsonResponse({
+                'success': False,
+                'message': str(e)
+            })
+    
+    return JsonResponse({'success': False, 'message': 'Invalid request method'})
+
+
+@login_required
+def get_report_job(request, job_id):
+    """Get the status of a report job, with its download link once it is done"""
+    job = get_object_or_404(ReportJob, id=job_id, user=request.user)
+    return JsonResponse({
+        'success': True,
+        'job': _serialize_report_job(job)
+    })
+
+
+@login_required
+def download_report(request, job_id):
+    """Stream a finished report file"""
+    job = get_object_or_404(ReportJob, id=job_id, user=request.user, status='done')
+    return FileResponse(job.file.open('rb'), as_attachment=True, filename=f"expenses-{job.id}.{job.format}")
@@ -1,6 +1,6 @@
 import os
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
 
 # Build paths inside the project
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -29,6 +29,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,17 +59,26 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'expense_management.wsgi.application'  # Change to your project name
 
-# PostgreSQL Database
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': config('DB_NAME'),
-        'USER': config('DB_USER'),
-        'PASSWORD': config('DB_PASSWORD'),
-        'HOST': config('DB_HOST', default='localhost'),
-        'PORT': config('DB_PORT', default='5432'),
+# Database: PostgreSQL by default; DB_ENGINE=sqlite runs locally and for benchmarks without a server
+DB_ENGINE = config('DB_ENGINE', default='postgresql')
+if DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME'),
+            'USER': config('DB_USER'),
+            'PASSWORD': config('DB_PASSWORD'),
+            'HOST': config('DB_HOST', default='localhost'),
+            'PORT': config('DB_PORT', default='5432'),
+        }
     }
-}
 
 # Custom User Model
 AUTH_USER_MODEL = 'core.User'
@@ -109,6 +119,58 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# OCR job queue (0 workers runs jobs inline in the request)
+OCR_WORKERS = config('OCR_WORKERS', default=os.cpu_count() or 1, cast=int)
+OCR_MAX_RECEIPT_BYTES = config('OCR_MAX_RECEIPT_BYTES', default=20 * 1024 * 1024, cast=int)
+OCR_MAX_RECEIPT_PIXELS = config('OCR_MAX_RECEIPT_PIXELS', default=50_000_000, cast=int)
+OCR_MAX_BATCH_FILES = config('OCR_MAX_BATCH_FILES', default=500, cast=int)
+# Skipped files listed per batch; the rest are only counted
+OCR_MAX_SKIPPED_LISTED = config('OCR_MAX_SKIPPED_LISTED', default=100, cast=int)
+OCR_CACHE_MAX_ENTRIES = config('OCR_CACHE_MAX_ENTRIES', default=50000, cast=int)
+
+# OCR image preprocessing, applied in order. Available stages: grayscale, crop, downscale, deskew, threshold
+OCR_PREPROCESS_STAGES = config('OCR_PREPROCESS_STAGES', default='grayscale,crop,downscale,deskew,threshold', cast=Csv())
+OCR_TARGET_DPI = config('OCR_TARGET_DPI', default=300, cast=int)
+OCR_RECEIPT_WIDTH_INCHES = config('OCR_RECEIPT_WIDTH_INCHES', default=3.15, cast=float)  # 80 mm till roll
+
+# Expense report jobs (0 workers builds reports inline in the request)
+REPORT_WORKERS = config('REPORT_WORKERS', default=2, cast=int)
+REPORT_CHUNK_SIZE = config('REPORT_CHUNK_SIZE', default=2000, cast=int)
+REPORT_PDF_MAX_ROWS = config('REPORT_PDF_MAX_ROWS', default=100000, cast=int)
+
+# Exchange rates: one base table fetched out of band by `manage.py refresh_exchange_rates`
+EXCHANGE_RATE_PROVIDER = config('EXCHANGE_RATE_PROVIDER', default='http')  # 'http' or 'file'
+EXCHANGE_RATE_FILE = config('EXCHANGE_RATE_FILE', default=str(BASE_DIR / 'exchange_rates.json'))
+EXCHANGE_RATE_BASE = config('EXCHANGE_RATE_BASE', default='USD')
+EXCHANGE_RATE_CACHE_SECONDS = config('EXCHANGE_RATE_CACHE_SECONDS', default=3600, cast=int)
+
+# Approval routing: 'first', 'round_robin', 'least_pending' or a dotted path to a callable
+APPROVER_ROUTING_STRATEGY = config('APPROVER_ROUTING_STRATEGY', default='round_robin')
+# Rule indexes and routing tables are rebuilt after changes; with a per-process cache (no shared CACHES)
+# other processes notice within this many seconds
+APPROVAL_CACHE_REFRESH_SECONDS = config('APPROVAL_CACHE_REFRESH_SECONDS', default=60, cast=int)
+
+# Bulk user import: password hashing runs in this many processes (0 or 1 hashes inline)
+USER_IMPORT_WORKERS = config('USER_IMPORT_WORKERS', default=os.cpu_count() or 1, cast=int)
+USER_IMPORT_MAX_ROWS = config('USER_IMPORT_MAX_ROWS', default=10000, cast=int)
+
+# Per-view query/latency histograms at /api/metrics/ (staff users, or "Authorization: Bearer <METRICS_TOKEN>")
+QUERY_METRICS = config('QUERY_METRICS', default=False, cast=bool)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+# Requests running more queries than their view's budget are reported
+QUERY_BUDGET_DEFAULT = config('QUERY_BUDGET_DEFAULT', default=20, cast=int)
+# Budgets include the 4 queries the default database session engine adds to each request
+# (reading the session, then saving its expiry in a savepoint)
+QUERY_BUDGETS = {
+    'core:get_users': 9,
+    'core:get_company': 8,
+    'core:get_stats': 8,
+    'core:sync_users': 10,
+    'core:get_expenses': 8,
+    'core:approval_inbox': 8,
+    'core:spend_analytics': 8,
+}
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -120,6 +182,11 @@ LOGOUT_REDIRECT_URL = 'core:index'
 # Session settings
 SESSION_COOKIE_AGE = 86400  # 1 day
 SESSION_SAVE_EVERY_REQUEST = True
+SESSION_ENGINE = config('SESSION_ENGINE', default='django.contrib.sessions.backends.db')
+# With SESSION_ENGINE=core.sessions, cached sessions only rewrite the expiry after this fraction of
+# SESSION_COOKIE_AGE has passed. Only opt in with a shared cache (CACHES): like cached_db, a per-process
+# cache lets other workers keep serving a session after it was logged out or flushed
+SESSION_REFRESH_FRACTION = config('SESSION_REFRESH_FRACTION', default=0.1, cast=float)
 
 # CSRF settings
 CSRF_COOKIE_HTTPONLY = False